@@ -1,14 +1,15 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 from joblib import load
-from io import StringIO
 import os
 
 MODEL_PATH = os.path.join("models", "model_with_sms_norm.joblib")
 
 @st.cache_resource
 def load_model(path=MODEL_PATH):
+    if os.environ.get("FAST_INFERENCE") == "1":
+        from src.fast_inference import load_fast
+        return load_fast(path)
     return load(path)
 
 def predict_text(model, texts, threshold=0.5):
@@ -53,25 +54,25 @@ def main():
 
     with col2:
         st.subheader("Batch upload")
-        uploaded = st.file_uploader("Upload CSV (must contain `text` column)", type=["csv"]) 
+        uploaded = st.file_uploader("Upload CSV, Parquet or Arrow (must contain `text` column)",
+                                    type=["csv", "gz", "parquet", "pq", "arrow", "feather"])
         if uploaded is not None:
+            from src.data_io import read_table
             try:
-                df = pd.read_csv(uploaded)
+                # only the columns shown in the results are read
+                df = read_table(uploaded, ["text"], optional=["id", "subject", "label"])
             except Exception as e:
-                st.error(f"Failed to read CSV: {e}")
+                st.error(f"Failed to read file: {e}")
                 df = None
             if df is not None:
-                if 'text' not in df.columns:
-                    st.error("CSV must contain a `text` column")
-                else:
-                    if st.button("Predict file"):
-                        texts = df['text'].astype(str).tolist()
-                        labels, probs = predict_text(model, texts, threshold=threshold)
-                        df['pred_label'] = labels
-                        df['pred_proba'] = probs
-                        st.write(df.head(20))
-                        csv = df.to_csv(index=False)
-                        st.download_button("Download predictions CSV", data=csv, file_name="predictions.csv", mime="text/csv")
+                if st.button("Predict file"):
+                    texts = df['text'].astype(str).tolist()
+                    labels, probs = predict_text(model, texts, threshold=threshold)
+                    df['pred_label'] = labels
+                    df['pred_proba'] = probs
+                    st.write(df.head(20))
+                    csv = df.to_csv(index=False)
+                    st.download_button("Download predictions CSV", data=csv, file_name="predictions.csv", mime="text/csv")
 
     st.markdown("---")
     st.subheader("Model info")
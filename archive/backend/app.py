@@ -1,14 +1,16 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
-from joblib import load
 from typing import List
 import os
 import logging
 from dotenv import load_dotenv
-import traceback
+import asyncio
+import gc
+import hmac
+import time
 
 load_dotenv()
 
@@ -18,6 +20,26 @@ import sys
 REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if REPO_ROOT not in sys.path:
     sys.path.insert(0, REPO_ROOT)
+# The backend uses the top-level `src` package (stage timing, fast inference, and
+# the modules that models from the current training scripts pickle references to,
+# such as `src.vectorizers`), so it runs from a checkout of the whole repository
+# (Docker/Render build from the repo root). It takes precedence over archive/backend/src.
+TOP_LEVEL_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if not os.path.isfile(os.path.join(TOP_LEVEL_ROOT, 'src', 'stage_timing.py')):
+    raise RuntimeError(f"top-level src package not found under {TOP_LEVEL_ROOT}; "
+                       "run archive/backend from a checkout of the whole repository")
+# first even when it is already on PYTHONPATH behind archive/backend
+sys.path.insert(0, TOP_LEVEL_ROOT)
+
+import inference
+from batcher import MicroBatcher
+from inference import load_model, make_executor, predict_in_worker, predict_probas
+from prediction_cache import file_version, make_cache
+from metrics import COUNT_BUCKETS, Exposition, MetricsMiddleware, RequestMetrics
+from model_watch import ModelWatcher
+from procmem import process_memory
+from src.stage_timing import StageTimings, instrument
+from streaming import BodyStreamingResponse, format_csv, format_ndjson, iter_csv, iter_lines, iter_ndjson
 
 logger = logging.getLogger("spam_classifier")
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +55,47 @@ if not os.path.exists(MODEL_PATH):
 
 ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', '*')
 
+# Load the model at import time. With `gunicorn --preload` (start.sh sets it when
+# PRELOAD_MODEL=1) that happens once in the master and workers share the pages
+# copy-on-write instead of each loading their own copy.
+PRELOAD_MODEL = os.environ.get('PRELOAD_MODEL') == '1'
+
+# Coalesce concurrent /predict calls into one predict_proba call (see batcher.py)
+MICRO_BATCHING = os.environ.get('MICRO_BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '32'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '2'))
+
+# Dedicated inference executor: "thread" or "process" (process workers get past the GIL)
+INFERENCE_EXECUTOR = os.environ.get('INFERENCE_EXECUTOR', 'thread')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '2'))
+
+# Prediction cache keyed by simple_clean(text) + model version (see prediction_cache.py).
+# PREDICTION_CACHE is "memory" (per worker), "sqlite" (shared by the workers of a host) or "off".
+PREDICTION_CACHE = os.environ.get('PREDICTION_CACHE', 'memory')
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '100000'))
+PREDICTION_CACHE_MB = float(os.environ.get('PREDICTION_CACHE_MB', '64'))
+PREDICTION_CACHE_TTL = float(os.environ['PREDICTION_CACHE_TTL']) if os.environ.get('PREDICTION_CACHE_TTL') else None
+PREDICTION_CACHE_PATH = os.environ.get('PREDICTION_CACHE_PATH', os.path.join('.cache', 'predictions.sqlite'))
+
+# Rows scored per chunk by /predict_stream
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '256'))
+# longest NDJSON line / CSV record (in characters) /predict_stream keeps in memory; longer ones are row errors
+STREAM_MAX_RECORD_CHARS = int(os.environ.get('STREAM_MAX_RECORD_CHARS', '1000000'))
+
+# Per-stage timers around the pipeline steps, exported on /metrics
+STAGE_TIMING = os.environ.get('STAGE_TIMING', '1') == '1'
+
+# Score with the NumPy-only engine in src/fast_inference.py instead of the sklearn pipeline
+FAST_INFERENCE = os.environ.get('FAST_INFERENCE') == '1'
+
+# Hot reload: poll MODEL_PATH every MODEL_WATCH_SECONDS (0 = off) and swap in the new model when the
+# file changes; POST /admin/reload with an X-Admin-Token header matching ADMIN_TOKEN does it on demand.
+MODEL_WATCH_SECONDS = float(os.environ.get('MODEL_WATCH_SECONDS', '0'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# scored once by a freshly loaded model before it takes traffic
+WARMUP_TEXTS = ["Congratulations! You have won a free prize, call now", "Are we still meeting for lunch tomorrow?"]
+
 app = FastAPI(title="Spam Classifier API")
 
 # Allow CORS for frontend deployments (set ALLOWED_ORIGINS in env)
@@ -41,6 +104,10 @@ if ALLOWED_ORIGINS == '*' or ALLOWED_ORIGINS.strip() == '':
 else:
     origins = [o.strip() for o in ALLOWED_ORIGINS.split(',') if o.strip()]
 
+timings = StageTimings()
+request_metrics = RequestMetrics(paths=["/predict", "/predict_batch", "/predict_stream", "/health", "/ready", "/metrics"])
+app.add_middleware(MetricsMiddleware, metrics=request_metrics)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -81,19 +148,31 @@ class BatchIn(BaseModel):
 
 model = None
 model_loaded = False
-last_prediction_exception: str | None = None
-
-
-def load_model(path: str):
-    logger.info(f"Loading model from: {path}")
-    m = load(path)
-    logger.info("Model loaded successfully")
-    return m
+model_version = None
+model_load_seconds = None
+model_reloads = 0
+last_reload_error = None
+executor = None
+reload_lock = asyncio.Lock()
+
+
+def prepare_model(path):
+    """Load, warm and instrument a model; returns `(model, load_seconds)`."""
+    t0 = time.perf_counter()
+    m = load_model(path, FAST_INFERENCE)
+    seconds = time.perf_counter() - t0
+    # first call pays lazy imports and allocations; keep it out of request latency and stage timings
+    try:
+        predict_probas(m, WARMUP_TEXTS)
+    except Exception:
+        logger.warning("Warm-up prediction failed for %s", path)
+    if STAGE_TIMING:
+        m = instrument(m, timings)
+    return m, seconds
 
 
-@app.on_event("startup")
-def startup_event():
-    global model, model_loaded
+def init_model():
+    global model, model_loaded, model_version, model_load_seconds
     try:
         # Ensure NLTK corpora are present before loading models that may call them
         try:
@@ -106,7 +185,10 @@ def startup_event():
             # src.preprocess may not be importable in some environments; proceed to load model and surface errors
             logger.debug("Could not import src.preprocess to prefetch NLTK data")
         if os.path.exists(MODEL_PATH):
-            model = load_model(MODEL_PATH)
+            model, model_load_seconds = prepare_model(MODEL_PATH)
+            model_version = file_version(MODEL_PATH)
+            if prediction_cache is not None:
+                prediction_cache.set_model_version(model_version)
             model_loaded = True
         else:
             logger.warning(f"Model path does not exist: {MODEL_PATH}")
@@ -115,16 +197,67 @@ def startup_event():
         model_loaded = False
 
 
+@app.on_event("startup")
+def startup_event():
+    # already loaded in the gunicorn master when preloading
+    if not model_loaded:
+        init_model()
+
+
+async def reload_model():
+    """Load the model at MODEL_PATH again if its content changed and swap it in without downtime.
+
+    Loading and warm-up run in a background thread while the old model keeps
+    serving. The swap is a handful of reference assignments on the event
+    loop, so every request sees either the old or the new model; requests
+    already scoring keep their reference and finish on the old one (old
+    process-pool workers finish their tasks before exiting). Returns True if
+    a new model was activated.
+    """
+    global model, model_loaded, model_version, model_load_seconds, model_reloads, last_reload_error, executor
+    async with reload_lock:
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(None, file_version, MODEL_PATH)
+        if model_loaded and version == model_version:
+            return False
+        try:
+            new_model, seconds = await loop.run_in_executor(None, prepare_model, MODEL_PATH)
+        except Exception as e:
+            last_reload_error = f"{type(e).__name__}: {e}"
+            raise
+        old_executor = None
+        if INFERENCE_EXECUTOR == "process":
+            # pool workers hold their own copy; new workers fork with the new model
+            old_executor = executor
+            executor = make_executor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, model=new_model, model_path=MODEL_PATH,
+                                     fast=FAST_INFERENCE)
+            batcher.executor = executor
+        model, model_version, model_load_seconds = new_model, version, seconds
+        model_loaded = True
+        # after the swap: anything looked up under the new version is scored by the new model
+        if prediction_cache is not None:
+            prediction_cache.set_model_version(version)
+        model_reloads += 1
+        last_reload_error = None
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+        logger.info(f"Hot-reloaded model {version} from {MODEL_PATH} in {seconds:.2f}s")
+        return True
+
+
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 @app.get("/ready")
-def ready():
+async def ready():
     if not model_loaded:
         raise HTTPException(status_code=503, detail="model_not_loaded")
-    return {"status": "ready", "model_path": MODEL_PATH}
+    info = {"status": "ready", "model_path": MODEL_PATH, "model_version": model_version, "model_reloads": model_reloads}
+    if last_reload_error is not None:
+        info["last_reload_error"] = last_reload_error
+    return info
 
 
 def ensure_model():
@@ -132,54 +265,269 @@ def ensure_model():
         raise HTTPException(status_code=503, detail="model_not_loaded")
 
 
+def _predict_current(texts):
+    # read the global at call time so batches always use the loaded model
+    return predict_probas(model, texts)
+
+
+prediction_cache = make_cache(PREDICTION_CACHE, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_MB, PREDICTION_CACHE_TTL, PREDICTION_CACHE_PATH)
+# one batch in flight per executor worker
+batcher = MicroBatcher(_predict_current, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       max_in_flight=INFERENCE_WORKERS)
+
+
+@app.on_event("startup")
+def start_executor():
+    global executor
+    # created per gunicorn worker, after the fork
+    executor = make_executor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, model=model, model_path=MODEL_PATH, fast=FAST_INFERENCE)
+    batcher.executor = executor
+    batcher.predict_fn = predict_in_worker if INFERENCE_EXECUTOR == "process" else _predict_current
+    logger.info(f"Inference executor: {INFERENCE_EXECUTOR} x {INFERENCE_WORKERS}")
+
+
+model_watcher = ModelWatcher(lambda: MODEL_PATH, reload_model, interval=MODEL_WATCH_SECONDS)
+
+
+@app.on_event("startup")
+async def start_model_watch():
+    if MODEL_WATCH_SECONDS > 0:
+        model_watcher.start()
+        logger.info(f"Watching {MODEL_PATH} for new models every {MODEL_WATCH_SECONDS}s")
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await model_watcher.stop()
+    await batcher.stop()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def score(texts):
+    """Run inference on the dedicated executor so the event loop and probes stay free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, batcher.predict_fn, texts)
+
+
+async def score_single(texts):
+    if MICRO_BATCHING:
+        return [await batcher.submit(texts[0])]
+    return await score(texts)
+
+
+def _cache_lookup(texts):
+    keys = prediction_cache.keys(texts)
+    return keys, prediction_cache.lookup(keys)
+
+
+async def score_cached(texts, scorer):
+    """Serve cached probabilities and score each distinct missing text once with `scorer`."""
+    if prediction_cache is None:
+        return await scorer(texts)
+    loop = asyncio.get_running_loop()
+    small = len(texts) <= 64
+    # hashing/lookups of large batches go to the default pool, off the event loop
+    t0 = time.perf_counter()
+    keys, values = _cache_lookup(texts) if small else await loop.run_in_executor(None, _cache_lookup, texts)
+    timings.observe("cache_lookup", time.perf_counter() - t0)
+    missing = {}
+    for i, (key, value) in enumerate(zip(keys, values)):
+        if value is None:
+            missing.setdefault(key, []).append(i)
+    if missing:
+        miss_keys = list(missing)
+        fresh = await scorer([texts[missing[k][0]] for k in miss_keys])
+        for key, value in zip(miss_keys, fresh):
+            for i in missing[key]:
+                values[i] = value
+        if small:
+            prediction_cache.store(miss_keys, fresh)
+        else:
+            await loop.run_in_executor(None, prediction_cache.store, miss_keys, fresh)
+    return values
+
+
 @app.post("/predict")
-def predict(item: TextIn):
+async def predict(item: TextIn, request: Request):
+    timings.observe("parse", time.perf_counter() - request.state.t_start)
     ensure_model()
-    m = model
-    text = [item.text]
     try:
-        proba = m.predict_proba(text)[:, 1][0]
-    except Exception as e:
-        # store traceback for short-term debugging and log
-        tb = traceback.format_exc()
-        global last_prediction_exception
-        last_prediction_exception = tb
-        logger.exception("predict_proba failed: %s", e)
-        try:
-            pred = m.predict(text)[0]
-            proba = 1.0 if str(pred).lower() == 'spam' else 0.0
-        except Exception as e2:
-            tb2 = traceback.format_exc()
-            last_prediction_exception = (last_prediction_exception or "") + "\n" + tb2
-            logger.exception("predict failed: %s", e2)
-            raise HTTPException(status_code=500, detail="model_prediction_failed")
+        proba = (await score_cached([item.text], score_single))[0]
+    except Exception:
+        raise HTTPException(status_code=500, detail="model_prediction_failed")
     label = 'spam' if proba >= 0.5 else 'ham'
     return {"label": label, "probability": float(proba)}
 
 
 @app.post("/predict_batch")
-def predict_batch(item: BatchIn):
+async def predict_batch(item: BatchIn, request: Request):
+    timings.observe("parse", time.perf_counter() - request.state.t_start)
     ensure_model()
-    m = model
     texts = item.texts
+    request_metrics.observe_texts("/predict_batch", len(texts))
     try:
-        probas = m.predict_proba(texts)[:, 1].tolist()
-    except Exception as e:
-        tb = traceback.format_exc()
-        last_prediction_exception = tb
-        logger.exception("predict_proba batch failed: %s", e)
-        try:
-            preds = m.predict(texts)
-            probas = [1.0 if str(p).lower() == 'spam' else 0.0 for p in preds]
-        except Exception as e2:
-            tb2 = traceback.format_exc()
-            last_prediction_exception = (last_prediction_exception or "") + "\n" + tb2
-            logger.exception("predict batch failed: %s", e2)
-            raise HTTPException(status_code=500, detail="model_prediction_failed")
+        probas = await score_cached(texts, score)
+    except Exception:
+        raise HTTPException(status_code=500, detail="model_prediction_failed")
     labels = ['spam' if p >= 0.5 else 'ham' for p in probas]
     return {"predictions": [ {"text": t, "label": l, "probability": float(p)} for t, l, p in zip(texts, labels, probas) ]}
 
 
+async def _score_stream_chunk(records, fmt):
+    valid = [i for i, (_, _, error) in enumerate(records) if error is None]
+    try:
+        probas = await score_cached([records[i][1] for i in valid], score) if valid else []
+    except Exception:
+        return "".join(fmt(rid, None, None, error or "model_prediction_failed") for rid, _, error in records)
+    results = dict(zip(valid, probas))
+    out = []
+    for i, (rid, _, error) in enumerate(records):
+        if error is not None:
+            out.append(fmt(rid, None, None, error))
+        else:
+            p = float(results[i])
+            out.append(fmt(rid, 'spam' if p >= 0.5 else 'ham', p))
+    return "".join(out)
+
+
+@app.post("/predict_stream")
+async def predict_stream(request: Request, output_format: str = Query("ndjson", alias="format")):
+    """Classify an NDJSON or CSV upload in fixed-size chunks while it is still arriving.
+
+    The body is NDJSON (`{"id": ..., "text": ...}` per line, or bare JSON
+    strings) unless the Content-Type contains "csv", in which case it is CSV
+    with a header containing `text` and optionally `id`/`subject`. Rows
+    without an `id` are numbered from 0. Results stream back in input order
+    as NDJSON (`id`, `label`, `probability`, or `error`), or as CSV with
+    `?format=csv`. Texts are not echoed back. Records longer than
+    STREAM_MAX_RECORD_CHARS come back as a `record_too_long` error.
+    """
+    ensure_model()
+    if output_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    lines = iter_lines(request.stream(), max_chars=STREAM_MAX_RECORD_CHARS)
+    if "csv" in request.headers.get("content-type", ""):
+        records = iter_csv(lines, max_chars=STREAM_MAX_RECORD_CHARS)
+    else:
+        records = iter_ndjson(lines)
+    fmt = format_csv if output_format == "csv" else format_ndjson
+
+    async def results():
+        if output_format == "csv":
+            yield "id,label,probability,error\n"
+        chunk = []
+        rows = 0
+        try:
+            async for record in records:
+                rows += 1
+                chunk.append(record)
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    yield await _score_stream_chunk(chunk, fmt)
+                    chunk = []
+        except ValueError as e:
+            chunk.append((None, None, str(e)))
+        if chunk:
+            yield await _score_stream_chunk(chunk, fmt)
+        request_metrics.observe_texts("/predict_stream", rows)
+
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return BodyStreamingResponse(results(), media_type=media_type)
+
+
+@app.get("/metrics/batching")
+def batching_metrics():
+    """Batch-size distribution and queue wait of the /predict micro-batcher in this worker."""
+    info = batcher.stats()
+    info["enabled"] = MICRO_BATCHING
+    return info
+
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """Hit rate, size and eviction counters of the prediction cache."""
+    if prediction_cache is None:
+        return {"enabled": False}
+    info = prediction_cache.stats()
+    info["enabled"] = True
+    return info
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's request, stage, batching, cache and model metrics.
+
+    Stage histograms cover inference run in this process; with
+    INFERENCE_EXECUTOR=process the pipeline steps run in pool workers and
+    only the request-level stages ("parse", "cache_lookup") are recorded.
+    """
+    out = Exposition()
+    for (path, method, status), n in sorted(request_metrics.requests.items()):
+        out.sample("spam_requests_total", "counter", "HTTP requests by path, method and status.", n,
+                   path=path, method=method, status=status)
+    for path, hist in sorted(request_metrics.latency.items()):
+        out.histogram("spam_request_duration_seconds", "End-to-end request latency.", hist, path=path)
+    for path, hist in sorted(request_metrics.payload.items()):
+        out.histogram("spam_request_body_bytes", "Request body size.", hist, path=path)
+    for path, hist in sorted(request_metrics.texts.items()):
+        out.histogram("spam_request_texts", "Texts per batch/stream request.", hist, path=path)
+    for stage, hist in sorted(timings.histograms.items()):
+        out.histogram("spam_stage_duration_seconds", "Time per inference stage (pipeline step name, preprocess, calibration, total).",
+                      hist, stage=stage)
+    out.counts_histogram("spam_batch_size", "Texts per /predict micro-batch.", batcher.batch_sizes, COUNT_BUCKETS)
+    waits = batcher.stats()["queue_wait_ms"]
+    for key, q in (("p50", "0.5"), ("p99", "0.99")):
+        out.sample("spam_batch_queue_wait_seconds", "summary", "Micro-batch queue wait over recent requests.",
+                   waits[key] / 1000.0, quantile=q)
+    if prediction_cache is not None:
+        cache = prediction_cache.stats()
+        out.sample("spam_cache_hits_total", "counter", "Prediction cache hits.", cache["hits"])
+        out.sample("spam_cache_misses_total", "counter", "Prediction cache misses.", cache["misses"])
+        out.sample("spam_cache_evictions_total", "counter", "Prediction cache evictions.", cache["evictions"])
+        out.sample("spam_cache_entries", "gauge", "Prediction cache entries.", cache["size"])
+    out.sample("spam_model_loaded", "gauge", "1 if a model is loaded.", int(model_loaded))
+    if model_load_seconds is not None:
+        out.sample("spam_model_load_seconds", "gauge", "Time to load the current model.", model_load_seconds)
+        out.sample("spam_model_info", "gauge", "Current model version.", 1, version=model_version)
+    out.sample("spam_model_reloads_total", "counter", "Models activated by hot reload.", model_reloads)
+    return PlainTextResponse(out.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/memory")
+def memory():
+    """Resident and shared memory of the worker that serves this request.
+
+    Call repeatedly to sample different workers; `shared_mb` should cover the
+    model when it is preloaded (`PRELOAD_MODEL=1`) or memory-mapped (binary
+    artifact with `FAST_INFERENCE=1`).
+    """
+    info = process_memory()
+    info["preloaded"] = PRELOAD_MODEL
+    info["model_type"] = type(getattr(model, "model", model)).__name__ if model is not None else None
+    return info
+
+
+@app.post("/admin/reload")
+async def admin_reload(request: Request):
+    """Reload MODEL_PATH in this worker now (see `reload_model`).
+
+    Enabled by setting `ADMIN_TOKEN`; callers send it in the `X-Admin-Token`
+    header. Each gunicorn worker holds its own model, so this reaches only
+    the worker that answers; use MODEL_WATCH_SECONDS to update all of them.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin_disabled")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="invalid_admin_token")
+    try:
+        reloaded = await reload_model()
+    except Exception as e:
+        logger.exception("Hot reload failed: %s", e)
+        raise HTTPException(status_code=500, detail="model_reload_failed")
+    return {"reloaded": reloaded, "model_path": MODEL_PATH, "model_version": model_version,
+            "load_seconds": model_load_seconds, "model_reloads": model_reloads}
+
+
 @app.get("/debug/last_exception")
 def debug_last_exception():
     """Return the last stored prediction exception traceback when debugging is enabled.
@@ -189,4 +537,11 @@ def debug_last_exception():
     """
     if os.environ.get("DEBUG_API") != "1":
         raise HTTPException(status_code=403, detail="debug_disabled")
-    return {"last_exception": last_prediction_exception}
+    return {"last_exception": inference.last_exception}
+
+
+if PRELOAD_MODEL:
+    init_model()
+    # keep the loaded objects out of future GC passes so workers don't touch
+    # (and copy) their pages
+    gc.freeze()
@@ -0,0 +1,178 @@
+"""Asyncio request coalescer: concurrent single-text predictions become one batched call."""
+
+import asyncio
+import collections
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Collect concurrent `submit(text)` calls and score them with one `predict_fn(texts)` call.
+
+    A batch is dispatched when it reaches `max_batch_size` or when the first
+    request in it has waited `max_wait_ms`. The wait is adaptive: it is
+    capped at twice the recent mean gap between arrivals, so at low traffic
+    (gaps longer than `max_wait_ms`) requests are dispatched immediately and
+    pay no added latency. Up to `max_in_flight` batches (the executor's
+    worker count) are scored at once; requests that arrive while all of them
+    are busy queue up and form the next batch. `predict_fn` must return one
+    value per text and is run with `run_in_executor(executor, ...)`; callers
+    left without a result, or whose batch fails unexpectedly, get an
+    exception instead of waiting forever.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=2.0, executor=None, window=2048, max_in_flight=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._in_flight = set()
+        self._gap = None
+        self._last_arrival = None
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes = collections.Counter()
+        self._waits = collections.deque(maxlen=window)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, self.max_in_flight))
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._in_flight) + ([self._task] if self._task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, text):
+        if self._task is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self._gap = gap if self._gap is None else 0.8 * self._gap + 0.2 * gap
+        self._last_arrival = now
+        fut = loop.create_future()
+        self._queue.put_nowait((text, fut, now))
+        return await fut
+
+    def _wait_budget(self):
+        if self._gap is None or self._gap >= self.max_wait:
+            return 0.0
+        return min(self.max_wait, 2 * self._gap)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a free executor slot first, so requests arriving meanwhile join the next batch
+            await self._slots.acquire()
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = batch[0][2] + self._wait_budget()
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                task = loop.create_task(self._dispatch_batch(loop, batch))
+            except asyncio.CancelledError:
+                self._slots.release()
+                _fail(batch, asyncio.CancelledError())
+                raise
+            except Exception as e:
+                # never let one bad batch end the loop; every later submit would hang
+                self._slots.release()
+                _fail(batch, e)
+                continue
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch_batch(self, loop, batch):
+        try:
+            await self._dispatch(loop, batch)
+        except asyncio.CancelledError:
+            _fail(batch, asyncio.CancelledError())
+            raise
+        except Exception as e:
+            _fail(batch, e)
+        finally:
+            self._slots.release()
+
+    async def _dispatch(self, loop, batch):
+        start = loop.time()
+        batch = [item for item in batch if not item[1].cancelled()]
+        if not batch:
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self._waits.extend(start - t for _, _, t in batch)
+        try:
+            results = await loop.run_in_executor(self.executor, self.predict_fn, [t for t, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # retry one by one so a single bad input only fails its own request
+            for item in batch:
+                await self._dispatch_one(loop, item)
+            return
+        for (_, fut, _), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+        if len(results) != len(batch):
+            _fail(batch[len(results):], RuntimeError(f"predict_fn returned {len(results)} results for {len(batch)} texts"))
+
+    async def _dispatch_one(self, loop, item):
+        text, fut, _ = item
+        try:
+            result = (await loop.run_in_executor(self.executor, self.predict_fn, [text]))[0]
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        if not fut.done():
+            fut.set_result(result)
+
+    def stats(self) -> dict:
+        waits = np.fromiter(self._waits, dtype=np.float64) * 1000.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_counts": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "queue_wait_ms": {
+                "p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "p99": float(np.percentile(waits, 99)) if len(waits) else 0.0,
+                "max": float(waits.max()) if len(waits) else 0.0,
+            },
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+def _fail(batch, exc):
+    """Resolve the still-pending futures of `batch` with `exc` (cancellation cancels them)."""
+    for _, fut, _ in batch:
+        if fut.done():
+            continue
+        if isinstance(exc, asyncio.CancelledError):
+            fut.cancel()
+        else:
+            fut.set_exception(exc)
@@ -0,0 +1,79 @@
+"""Model loading and scoring, shared by the API handlers and the inference executor.
+
+Kept free of FastAPI so that process-pool workers can import it cheaply.
+"""
+
+import logging
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from joblib import load
+
+logger = logging.getLogger("spam_classifier")
+
+# traceback of the last failed prediction in this process (see /debug/last_exception)
+last_exception = None
+
+
+def load_model(path: str, fast: bool = False):
+    logger.info(f"Loading model from: {path}")
+    if fast:
+        # accepts joblib pipelines and binary artifacts written by convert_model.py
+        try:
+            from src.fast_inference import load_fast
+            m = load_fast(path)
+            logger.info("Model loaded successfully (fast inference engine)")
+            return m
+        except (ImportError, ValueError) as e:
+            logger.warning("Fast inference unavailable for this model (%s); using sklearn pipeline", e)
+    m = load(path)
+    logger.info("Model loaded successfully")
+    return m
+
+
+def predict_probas(m, texts):
+    """Spam probability for each text; falls back to hard labels if predict_proba fails."""
+    global last_exception
+    try:
+        return m.predict_proba(texts)[:, 1].tolist()
+    except Exception as e:
+        # store traceback for short-term debugging and log
+        last_exception = traceback.format_exc()
+        logger.exception("predict_proba failed: %s", e)
+        try:
+            preds = m.predict(texts)
+            return [1.0 if str(p).lower() == 'spam' else 0.0 for p in preds]
+        except Exception as e2:
+            last_exception = (last_exception or "") + "\n" + traceback.format_exc()
+            logger.exception("predict failed: %s", e2)
+            raise
+
+
+# Process-pool workers keep their own model. When the pool is forked after the
+# parent loaded the model, `worker_model` is inherited and nothing is reloaded.
+worker_model = None
+
+
+def _init_worker(path, fast):
+    global worker_model
+    if worker_model is None:
+        worker_model = load_model(path, fast)
+
+
+def predict_in_worker(texts):
+    return predict_probas(worker_model, texts)
+
+
+def make_executor(kind: str, workers: int, model=None, model_path=None, fast=False):
+    """Dedicated inference executor: `"thread"` or `"process"` (sidesteps the GIL)."""
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+    if kind != "process":
+        raise ValueError(f"unknown executor kind: {kind!r}")
+    global worker_model
+    worker_model = model
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                               initargs=(model_path, fast))
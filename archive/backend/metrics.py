@@ -0,0 +1,123 @@
+"""Request metrics and Prometheus text exposition for the API.
+
+Everything is kept per worker process in plain counters and fixed-bucket
+histograms (`src.stage_timing.Histogram`), so recording costs a few
+microseconds; Prometheus scrapes each worker and aggregates.
+"""
+
+import collections
+import time
+
+from src.stage_timing import Histogram
+
+# bytes, 256 B .. 64 MB
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+# texts per request / per batch
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+class RequestMetrics:
+    def __init__(self, paths):
+        self.paths = set(paths)
+        self.requests = collections.Counter()
+        self.latency = collections.defaultdict(Histogram)
+        self.payload = collections.defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.texts = collections.defaultdict(lambda: Histogram(COUNT_BUCKETS))
+
+    def label(self, path):
+        return path if path in self.paths else "other"
+
+    def observe_request(self, path, method, status, seconds, nbytes):
+        path = self.label(path)
+        self.requests[(path, method, str(status))] += 1
+        self.latency[path].observe(seconds)
+        if method in ("POST", "PUT"):
+            self.payload[path].observe(nbytes)
+
+    def observe_texts(self, path, n):
+        self.texts[path].observe(n)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: counts requests, times them and measures request body size.
+
+    Also stores the arrival time in `request.state.t_start`, so handlers can
+    record how long body parsing and validation took before they ran.
+    """
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        scope.setdefault("state", {})["t_start"] = start
+        nbytes = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal nbytes
+            message = await receive()
+            if message["type"] == "http.request":
+                nbytes += len(message.get("body", b""))
+            return message
+
+        async def status_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, status_send)
+        finally:
+            self.metrics.observe_request(scope["path"], scope["method"], status, time.perf_counter() - start, nbytes)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def _fmt(v):
+    return "+Inf" if v == float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Exposition:
+    """Accumulates Prometheus text-format lines, one HELP/TYPE header per metric."""
+
+    def __init__(self):
+        self.lines = []
+        self._declared = set()
+
+    def _declare(self, name, kind, doc):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f"# HELP {name} {doc}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, kind, doc, value, **labels):
+        self._declare(name, kind, doc)
+        self.lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+    def histogram(self, name, doc, hist, **labels):
+        self._declare(name, "histogram", doc)
+        for bound, count in zip(list(hist.buckets) + [float("inf")], hist.cumulative()):
+            self.lines.append(f"{name}_bucket{_labels({**labels, 'le': _fmt(bound)})} {count}")
+        self.lines.append(f"{name}_sum{_labels(labels)} {_fmt(hist.sum)}")
+        self.lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def counts_histogram(self, name, doc, counter, buckets, **labels):
+        """Histogram from a Counter of exact values (e.g. micro-batch sizes)."""
+        hist = Histogram(buckets)
+        for value, n in counter.items():
+            hist.counts[min(i for i, b in enumerate(list(buckets) + [float("inf")]) if value <= b)] += n
+            hist.sum += value * n
+            hist.count += n
+        self.histogram(name, doc, hist, **labels)
+
+    def render(self):
+        return "\n".join(self.lines) + "\n"
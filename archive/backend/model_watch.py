@@ -0,0 +1,60 @@
+"""Poll a model file and trigger a hot reload when a new version lands.
+
+Polling `os.stat` is cheap enough to run every few seconds in every worker.
+A change is only acted on once the file has stayed the same for a whole
+interval, so a model that is still being copied into place is never loaded
+half-written (replacing it with an atomic rename avoids the wait).
+"""
+
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger("spam_classifier")
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class ModelWatcher:
+    """Call `await on_change()` after the file returned by `get_path()` changes and settles."""
+
+    def __init__(self, get_path, on_change, interval=5.0):
+        self.get_path = get_path
+        self.on_change = on_change
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        last = _stat(self.get_path())
+        while True:
+            await asyncio.sleep(self.interval)
+            current = _stat(self.get_path())
+            if current == last or current is None:
+                continue
+            await asyncio.sleep(self.interval)
+            if _stat(self.get_path()) != current:
+                # still being written; look again on the next poll
+                continue
+            last = current
+            try:
+                await self.on_change()
+            except Exception:
+                logger.exception("Hot reload of %s failed; keeping the current model", self.get_path())
@@ -0,0 +1,207 @@
+"""Cache of spam probabilities keyed by normalized text and model version.
+
+Keys are a BLAKE2 digest of `simple_clean(text)` (lowercased, URLs and
+punctuation stripped), so copies of a campaign message that differ only in
+case, punctuation or tracking links share one entry. The model version is
+part of every key and `PredictionCache.set_model_version` drops the local
+entries, so a new model never serves stale results.
+
+Backends implement `get_many(keys)`, `set_many(items)`, `clear()` and
+`stats()`. `MemoryBackend` is a per-process LRU; `SQLiteBackend` is a file on
+local disk that every worker process on the box can share.
+"""
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from src.nb_classifier_adv import simple_clean
+
+# rough per-entry footprint of MemoryBackend (OrderedDict slot, key bytes, value tuple)
+_ENTRY_BYTES = 200
+
+
+def file_version(path: str) -> str:
+    """Short content hash of a model file."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+
+class MemoryBackend:
+    """In-process LRU with optional TTL, bounded by entry count and approximate bytes."""
+
+    def __init__(self, max_entries=100_000, max_mb=64, ttl=None):
+        self.max_entries = min(max_entries, int(max_mb * 1e6 // _ENTRY_BYTES))
+        self.ttl = ttl
+        self.evictions = 0
+        self.expired = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._data[key]
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    out.append(None)
+                else:
+                    self._data.move_to_end(key)
+                    out.append(entry[0])
+        return out
+
+    def set_many(self, items):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items:
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"backend": "memory", "size": len(self._data), "max_entries": self.max_entries,
+                "approx_mb": round(len(self._data) * _ENTRY_BYTES / 1e6, 2),
+                "evictions": self.evictions, "expired": self.expired}
+
+
+class SQLiteBackend:
+    """SQLite file shared by the worker processes of one host.
+
+    Entries expire after `ttl` seconds; when the table grows past
+    `max_entries`, the oldest-written entries are deleted in bulk.
+    """
+
+    def __init__(self, path, max_entries=1_000_000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._pid = os.getpid()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS predictions (key BLOB PRIMARY KEY, value REAL, written REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_written ON predictions (written)")
+        conn.commit()
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            # never reuse a connection inherited across fork (gunicorn --preload)
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        conn = self._conn()
+        found = {}
+        cutoff = time.time() - self.ttl if self.ttl is not None else None
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, value, written FROM predictions WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, value, written in rows:
+                if cutoff is None or written >= cutoff:
+                    found[bytes(key)] = value
+        return [found.get(k) for k in keys]
+
+    def set_many(self, items):
+        if not items:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", [(k, v, now) for k, v in items])
+        self._writes += len(items)
+        if self._writes >= max(1000, self.max_entries // 100):
+            self._writes = 0
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl is not None:
+            self.evictions += conn.execute("DELETE FROM predictions WHERE written < ?", (now - self.ttl,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.evictions += conn.execute(
+                "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY written LIMIT ?)",
+                (excess,)).rowcount
+
+    def clear(self):
+        # entries of other model versions can never match; let eviction remove them
+        pass
+
+    def stats(self):
+        size = self._conn().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "size": size, "max_entries": self.max_entries,
+                "evictions": self.evictions}
+
+
+class PredictionCache:
+    def __init__(self, backend, model_version=""):
+        self.backend = backend
+        self.model_version = model_version
+        self.hits = 0
+        self.misses = 0
+
+    def set_model_version(self, version: str):
+        if version != self.model_version:
+            self.model_version = version
+            self.backend.clear()
+
+    def keys(self, texts):
+        prefix = self.model_version.encode("ascii")
+        return [hashlib.blake2b(prefix + simple_clean(t).encode("utf-8"), digest_size=16).digest() for t in texts]
+
+    def lookup(self, keys):
+        """Cached values for `keys` (None for misses)."""
+        values = self.backend.get_many(keys)
+        n_hits = sum(v is not None for v in values)
+        self.hits += n_hits
+        self.misses += len(values) - n_hits
+        return values
+
+    def store(self, keys, values):
+        self.backend.set_many(list(zip(keys, values)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        info = self.backend.stats()
+        info.update({"model_version": self.model_version, "hits": self.hits, "misses": self.misses,
+                     "hit_rate": self.hits / lookups if lookups else 0.0})
+        return info
+
+
+def make_cache(kind: str, max_entries: int, max_mb: float, ttl, path: str):
+    """Build a cache from configuration; `kind` is "memory", "sqlite" or "off" (returns None)."""
+    if kind == "off":
+        return None
+    if kind == "memory":
+        return PredictionCache(MemoryBackend(max_entries=max_entries, max_mb=max_mb, ttl=ttl))
+    if kind == "sqlite":
+        return PredictionCache(SQLiteBackend(path, max_entries=max_entries, ttl=ttl))
+    raise ValueError(f"unknown prediction cache backend: {kind!r}")
@@ -0,0 +1,40 @@
+"""Resident/shared memory of the current process, for comparing gunicorn workers."""
+
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory() -> dict:
+    """Memory of this process in MB.
+
+    On Linux this reads `/proc/self/smaps_rollup`: `shared_mb` is pages also
+    mapped by other processes (the preloaded or memory-mapped model), and
+    `pss_mb` splits shared pages evenly between the processes mapping them,
+    so summing `pss_mb` over workers gives the real total. Elsewhere only the
+    peak RSS from `getrusage` is available.
+    """
+    out = {"pid": os.getpid(), "ppid": os.getppid()}
+    try:
+        kb = {}
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _SMAPS_FIELDS:
+                    kb[key] = int(rest.split()[0])
+    except OSError:
+        if resource is not None:
+            out["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return out
+    out.update({
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) / 1024, 1),
+        "private_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+    })
+    return out
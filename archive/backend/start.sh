@@ -25,5 +25,11 @@ if [ ! -f "${MODEL_PATH}" ]; then
   fi
 fi
 
+# PRELOAD_MODEL=1 loads the model once in the gunicorn master; workers share it copy-on-write
+PRELOAD_FLAG=""
+if [ "${PRELOAD_MODEL}" = "1" ]; then
+  PRELOAD_FLAG="--preload"
+fi
+
 echo "Starting gunicorn..."
-exec gunicorn -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:${PORT:-8000} --workers ${WORKERS:-4} --timeout ${TIMEOUT:-120}
+exec gunicorn -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:${PORT:-8000} --workers ${WORKERS:-4} --timeout ${TIMEOUT:-120} ${PRELOAD_FLAG}
@@ -0,0 +1,182 @@
+"""Incremental parsing of NDJSON/CSV upload bodies for the streaming prediction endpoint.
+
+Records are yielded as soon as their line has arrived, so the server only
+ever holds one partial line (or one partially received quoted CSV record)
+plus the chunk being scored. Lines and CSV records longer than
+`max_chars` are dropped as they arrive and reported as a
+`record_too_long` row error, so memory stays bounded whatever the upload.
+"""
+
+import codecs
+import csv
+import io
+import json
+
+from starlette.responses import StreamingResponse
+
+# yielded by iter_lines in place of a line longer than its limit
+LINE_TOO_LONG = object()
+
+DEFAULT_MAX_CHARS = 1_000_000
+
+
+async def iter_lines(chunks, max_chars=DEFAULT_MAX_CHARS):
+    """Decode an async stream of byte chunks into lines (line endings kept).
+
+    A line longer than `max_chars` is discarded while it arrives and yielded
+    as `LINE_TOO_LONG`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    skipping = False
+    async for chunk in chunks:
+        # only the new text can hold the next newline
+        scan = len(pending)
+        pending += decoder.decode(chunk)
+        start = 0
+        while True:
+            end = pending.find("\n", max(start, scan))
+            if end < 0:
+                break
+            if skipping:
+                skipping = False
+            elif end + 1 - start > max_chars:
+                yield LINE_TOO_LONG
+            else:
+                yield pending[start:end + 1]
+            start = end + 1
+        pending = pending[start:]
+        if len(pending) > max_chars:
+            if not skipping:
+                yield LINE_TOO_LONG
+                skipping = True
+            pending = ""
+    pending += decoder.decode(b"", final=True)
+    if pending and not skipping:
+        yield LINE_TOO_LONG if len(pending) > max_chars else pending
+
+
+def _ndjson_record(line, row):
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return row, None, "invalid_json"
+    if isinstance(obj, str):
+        return row, obj, None
+    if not isinstance(obj, dict):
+        return row, None, "expected_object"
+    rid = obj.get("id", row)
+    text = obj.get("text")
+    if "subject" in obj and text is not None:
+        text = f"{obj.get('subject') or ''} {text}"
+    if not isinstance(text, str):
+        return rid, None, "missing_text"
+    return rid, text, None
+
+
+async def iter_ndjson(lines):
+    """Yield `(id, text, error)` per non-empty line: `{"id": ..., "text": ...}` objects or bare strings."""
+    row = 0
+    async for line in lines:
+        if line is LINE_TOO_LONG:
+            yield row, None, "record_too_long"
+        elif not line.strip():
+            continue
+        else:
+            yield _ndjson_record(line, row)
+        row += 1
+
+
+async def iter_csv(lines, max_chars=DEFAULT_MAX_CHARS):
+    """Yield `(id, text, error)` per CSV record; needs a header with `text` (and optionally `id`, `subject`).
+
+    A record longer than `max_chars` yields a `record_too_long` error; the
+    rest of it is read past without being kept.
+    """
+    # records up to max_chars may hold a single field that long
+    csv.field_size_limit(max(csv.field_size_limit(), max_chars))
+    header = None
+    buf = []
+    size = 0
+    # a quoted field may span lines: an odd number of quotes so far means the record continues
+    open_quote = False
+    skipping = False
+    row = 0
+    async for line in lines:
+        if line is LINE_TOO_LONG:
+            # its quotes are unknown; the next line starts a new record
+            if header is None:
+                raise ValueError("CSV header is too long")
+            if not skipping:
+                yield row, None, "record_too_long"
+                row += 1
+            buf, size, open_quote, skipping = [], 0, False, False
+            continue
+        open_quote ^= line.count('"') % 2 == 1
+        if skipping:
+            skipping = open_quote
+            continue
+        buf.append(line)
+        size += len(line)
+        if size > max_chars:
+            if header is None:
+                raise ValueError("CSV header is too long")
+            yield row, None, "record_too_long"
+            row += 1
+            buf, size, skipping = [], 0, open_quote
+            continue
+        if open_quote:
+            continue
+        record = "".join(buf)
+        buf, size = [], 0
+        if not record.strip():
+            continue
+        fields = next(csv.reader(io.StringIO(record)))
+        if header is None:
+            header = {name.strip(): i for i, name in enumerate(fields)}
+            if "text" not in header:
+                raise ValueError("CSV header must contain a 'text' column")
+            continue
+
+        def get(name):
+            i = header.get(name)
+            return fields[i] if i is not None and i < len(fields) else None
+
+        rid = get("id")
+        rid = row if rid is None else rid
+        text = get("text")
+        if text is None:
+            yield rid, None, "missing_text"
+        else:
+            subject = get("subject")
+            yield rid, text if subject is None else f"{subject} {text}", None
+        row += 1
+    if "".join(buf).strip():
+        yield row, None, "unterminated_quote"
+
+
+def format_ndjson(rid, label, probability, error=None):
+    if error is not None:
+        return json.dumps({"id": rid, "error": error}) + "\n"
+    return json.dumps({"id": rid, "label": label, "probability": probability}) + "\n"
+
+
+def format_csv(rid, label, probability, error=None):
+    out = io.StringIO()
+    csv.writer(out).writerow([rid, label or "", "" if probability is None else probability, error or ""])
+    return out.getvalue()
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose generator may still be reading the request body.
+
+    The stock implementation listens for client disconnects by calling
+    `receive()` concurrently, which would swallow the body chunks the
+    generator is waiting for. A disconnect still surfaces to the generator,
+    as `ClientDisconnect` from `request.stream()`.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,75 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+from src.fast_inference import from_model
+
+
+def load_texts(path, limit):
+    df = pd.read_csv(path)
+    if "subject" in df.columns and "text" in df.columns:
+        texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str)
+    else:
+        texts = df["text"].astype(str)
+    return texts.tolist()[:limit]
+
+
+def per_call_latency(func, texts, repeat):
+    times = []
+    for _ in range(repeat):
+        for t in texts:
+            start = time.perf_counter()
+            func([t])
+            times.append(time.perf_counter() - start)
+    return np.array(times) * 1e6
+
+
+def batch_seconds(func, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(texts)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sklearn and fast-inference latency and check probability parity")
+    parser.add_argument("--model", default="models/model_advanced.joblib")
+    parser.add_argument("--data", default="data/sms_spam.csv")
+    parser.add_argument("--limit", type=int, default=2000, help="Number of texts to score")
+    parser.add_argument("--single", type=int, default=200, help="Texts used for the per-message latency test")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-9, help="Max allowed absolute probability difference")
+    args = parser.parse_args()
+
+    model = load(args.model)
+    sk = getattr(model, "pipeline", model)
+    fast = from_model(model)
+    texts = load_texts(args.data, args.limit)
+
+    ref = sk.predict_proba(texts)
+    got = fast.predict_proba(texts)
+    diff = float(np.abs(ref - got).max())
+    agree = float(np.mean(sk.predict(texts) == fast.predict(texts)))
+    print(f"parity: max |p_sklearn - p_fast| = {diff:.2e}, label agreement = {agree:.2%}")
+    if diff > args.atol:
+        raise SystemExit(f"parity check failed: {diff:.2e} > {args.atol:.0e}")
+
+    single = texts[:args.single]
+    print(f"{'engine':<8} {'p50 us':>10} {'p99 us':>10} {'batch msg/s':>12}")
+    results = {}
+    for name, m in (("sklearn", sk), ("fast", fast)):
+        lat = per_call_latency(m.predict_proba, single, args.repeat)
+        rate = len(texts) / batch_seconds(m.predict_proba, texts, args.repeat)
+        results[name] = (np.percentile(lat, 50), rate)
+        print(f"{name:<8} {np.percentile(lat, 50):>10.1f} {np.percentile(lat, 99):>10.1f} {rate:>12.0f}")
+    print(f"single-message speedup: {results['sklearn'][0] / results['fast'][0]:.1f}x, "
+          f"batch speedup: {results['fast'][1] / results['sklearn'][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
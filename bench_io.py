@@ -0,0 +1,99 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_io import TableReader, read_table
+
+WORDS = np.array("free win prize claim call now meeting report tomorrow lunch offer cash account urgent "
+                 "please review attached invoice thanks team project update click link reply".split())
+
+
+def make_frame(rows, seed=0):
+    """Synthetic emails with the training columns plus the kind of extra columns real exports carry."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(8, 40, rows)
+    words = WORDS[rng.integers(0, len(WORDS), lengths.sum())]
+    bounds = np.cumsum(lengths)[:-1]
+    texts = [" ".join(w) for w in np.split(words, bounds)]
+    subjects = np.array([" ".join(w) for w in WORDS[rng.integers(0, len(WORDS), (1000, 4))]])
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "sender": [f"user{i % 5000}@example.com" for i in range(rows)],
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 86400 * 365, rows), unit="s"),
+        "subject": subjects[np.arange(rows) % len(subjects)],
+        "text": texts,
+        "headers": ["Received: from mx.example.com; X-Spam-Score: 0.0; Content-Type: text/plain"] * rows,
+        "label": np.where(rng.random(rows) < 0.15, "spam", "ham"),
+    })
+
+
+def write_files(df, directory):
+    paths = {
+        "csv": os.path.join(directory, "emails.csv"),
+        "csv.gz": os.path.join(directory, "emails.csv.gz"),
+        "parquet": os.path.join(directory, "emails.parquet"),
+        "arrow": os.path.join(directory, "emails.arrow"),
+    }
+    df.to_csv(paths["csv"], index=False)
+    df.to_csv(paths["csv.gz"], index=False)
+    df.to_parquet(paths["parquet"], index=False)
+    df.to_feather(paths["arrow"])
+    return paths
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = func()
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pd.read_csv with the column-pruned CSV/Parquet/Arrow readers")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Rows in the synthetic dataset")
+    parser.add_argument("--dir", help="Directory for the generated files (default: a temporary directory)")
+    parser.add_argument("--batch-rows", type=int, default=50000, help="Batch size of the streaming readers")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = None if args.dir else tempfile.TemporaryDirectory()
+    directory = args.dir or tmp.name
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    paths = write_files(make_frame(args.rows), directory)
+    print(f"wrote {args.rows} rows in {time.perf_counter() - start:.1f}s to {directory}")
+
+    columns = ["text", "label"]
+    cases = [("pd.read_csv (all columns)", "csv", lambda: len(pd.read_csv(paths["csv"])[columns + ["subject"]]))]
+    for fmt in ("csv", "csv.gz", "parquet", "arrow"):
+        cases.append((f"read_table {fmt}", fmt,
+                      lambda p=paths[fmt]: len(read_table(p, columns, optional=["subject"]))))
+    cases.append(("pd.read_csv chunks", "csv",
+                  lambda: sum(len(c) for c in pd.read_csv(paths["csv"], chunksize=args.batch_rows))))
+    for fmt in ("csv", "parquet", "arrow"):
+        cases.append((f"TableReader {fmt}", fmt,
+                      lambda p=paths[fmt]: sum(len(b) for b in TableReader(p, columns, optional=["subject"],
+                                                                         batch_rows=args.batch_rows))))
+
+    print(f"{'reader':<28} {'file MB':>8} {'seconds':>8} {'rows/s':>12} {'speedup':>8}")
+    baseline = {}
+    for name, fmt, func in cases:
+        seconds, rows = best_of(func, args.repeat)
+        if rows != args.rows:
+            raise SystemExit(f"{name} read {rows} rows, expected {args.rows}")
+        ref = baseline.setdefault("chunks" if "chunks" in name or "Reader" in name else "full", seconds)
+        print(f"{name:<28} {os.path.getsize(paths[fmt]) / 1e6:>8.1f} {seconds:>8.2f} {rows / seconds:>12.0f} "
+              f"{ref / seconds:>7.1f}x")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
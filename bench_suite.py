@@ -0,0 +1,252 @@
+"""Benchmark suite for the training and inference hot paths.
+
+Every (variant, dataset) case runs in its own child process, so peak memory
+and warm caches (lemma cache, imported modules) do not leak between cases.
+For each case it records:
+
+- fit_s: median seconds of `--repeat` fits on the whole dataset
+- p50_us / p99_us: single-message `predict_proba` latency
+- batch_msgs_per_s: batch `predict_proba` throughput
+- load_ms: joblib load time of the fitted model, best of `--repeat` runs
+  of enough back-to-back loads to last `MIN_RUN_SECONDS`
+- peak_rss_mb: peak resident memory of the child
+
+Results are written as JSON. With a baseline (`--save-baseline` stores
+one), every metric is compared against it and the run exits with status 1
+when any metric is worse by more than `--threshold` and by more than its
+`MIN_CHANGE`, so millisecond-scale jitter on small cases is not flagged.
+Timings depend on the machine, so compare only against a baseline recorded
+on the same hardware.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+VARIANTS = {
+    "spam_nb": "SpamClassifier: CountVectorizer + TF-IDF + MultinomialNB",
+    "adv_tfidf": "AdvancedSpamClassifier: simple_clean TF-IDF + MultinomialNB",
+    "adv_hashing": "AdvancedSpamClassifier(use_hashing=True)",
+    "pipe_logreg": "train_advanced.build_pipeline(): lemmatized TF-IDF + LogisticRegression",
+    "pipe_cnb_k5000": "train_advanced.build_pipeline(k_best=5000, clf_name='cnb')",
+    "preprocess": "src.preprocess.tokenize_batch throughput only (no model)",
+}
+DATASETS = {
+    "large_emails": "data/large_emails.csv",
+    "sms_spam": "data/sms_spam.csv",
+    "synthetic": None,
+}
+LOWER_IS_BETTER = ("fit_s", "p50_us", "p99_us", "load_ms", "peak_rss_mb")
+HIGHER_IS_BETTER = ("batch_msgs_per_s",)
+# smallest absolute change (in the metric's unit) that counts as a regression
+MIN_CHANGE = {"fit_s": 0.1, "p50_us": 20.0, "p99_us": 100.0, "load_ms": 2.0, "peak_rss_mb": 20.0,
+              "batch_msgs_per_s": 1000.0}
+MIN_RUN_SECONDS = 0.2
+
+
+def synthetic_corpus(rows, seed=0, vocab=20000):
+    """Zipf-distributed pseudo-words; spam rows mix in words from a small spam vocabulary."""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab)])
+    spam_words = np.array("free win prize cash claim urgent offer click winner credit".split())
+    labels = np.where(rng.random(rows) < 0.2, "spam", "ham")
+    texts = []
+    for label, n in zip(labels, rng.integers(8, 60, rows)):
+        ids = np.minimum(rng.zipf(1.3, n), vocab) - 1
+        toks = words[ids]
+        if label == "spam":
+            toks = np.concatenate([toks, spam_words[rng.integers(0, len(spam_words), max(1, n // 5))]])
+            rng.shuffle(toks)
+        texts.append(" ".join(toks))
+    return texts, labels.tolist()
+
+
+def load_dataset(name, synthetic_rows):
+    if name == "synthetic":
+        return synthetic_corpus(synthetic_rows)
+    from src.data_io import normalize_label, read_table
+    df = read_table(DATASETS[name], ["text", "label"], optional=["subject"])
+    if "subject" in df.columns:
+        texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str)
+    else:
+        texts = df["text"].fillna("").astype(str)
+    return texts.tolist(), df["label"].map(normalize_label).tolist()
+
+
+def build(variant):
+    if variant == "spam_nb":
+        from src.nb_classifier import SpamClassifier
+        return SpamClassifier().pipeline
+    if variant == "adv_tfidf":
+        from src.nb_classifier_adv import AdvancedSpamClassifier
+        return AdvancedSpamClassifier().pipeline
+    if variant == "adv_hashing":
+        from src.nb_classifier_adv import AdvancedSpamClassifier
+        return AdvancedSpamClassifier(use_hashing=True).pipeline
+    from train_advanced import build_pipeline
+    if variant == "pipe_logreg":
+        return build_pipeline(clf_name="logreg")
+    if variant == "pipe_cnb_k5000":
+        return build_pipeline(k_best=5000, clf_name="cnb")
+    raise ValueError(f"unknown variant {variant!r}")
+
+
+def run_seconds(func, repeat, number=1):
+    """Seconds per call of each of `repeat` runs, each timing `number` back-to-back calls."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+    return runs
+
+
+def best_seconds(func, repeat, number=1):
+    return min(run_seconds(func, repeat, number))
+
+
+def calls_per_run(func, min_seconds=MIN_RUN_SECONDS):
+    """Calls of `func` needed for one timed run to last about `min_seconds` (one call is made to measure)."""
+    start = time.perf_counter()
+    func()
+    return max(1, int(min_seconds / max(time.perf_counter() - start, 1e-9)))
+
+
+def run_case(variant, dataset, synthetic_rows, single, repeat):
+    """Measure one case; runs in a fresh child process."""
+    from joblib import dump, load
+
+    texts, labels = load_dataset(dataset, synthetic_rows)
+    result = {"rows": len(texts), "rss_before_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if variant == "preprocess":
+        from src.preprocess import tokenize_batch
+        seconds = best_seconds(lambda: tokenize_batch(texts), 1)
+        result["batch_msgs_per_s"] = len(texts) / seconds
+    else:
+        model = build(variant)
+        # every fit starts from scratch; the median is robust to one slow run
+        result["fit_s"] = float(np.median(run_seconds(lambda: model.fit(texts, labels), repeat)))
+
+        lat = []
+        for t in texts[:single] * repeat:
+            start = time.perf_counter()
+            model.predict_proba([t])
+            lat.append(time.perf_counter() - start)
+        result["p50_us"] = float(np.percentile(lat, 50)) * 1e6
+        result["p99_us"] = float(np.percentile(lat, 99)) * 1e6
+        result["batch_msgs_per_s"] = len(texts) / best_seconds(lambda: model.predict_proba(texts), repeat)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.joblib")
+            dump(model, path)
+            result["model_mb"] = os.path.getsize(path) / 1e6
+            # a single load takes about a millisecond, too short to time once
+            result["load_ms"] = best_seconds(lambda: load(path), repeat, calls_per_run(lambda: load(path))) * 1e3
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def compare(results, baseline, threshold, ignore=()):
+    """Print current vs baseline per metric; return the regressions (outside `ignore`) as strings.
+
+    A metric regresses when it is worse by more than `threshold` (relative)
+    and by more than `MIN_CHANGE[metric]` (absolute).
+    """
+    regressions = []
+    print(f"\n{'case':<32} {'metric':<18} {'baseline':>12} {'current':>12} {'change':>8}")
+    for case, metrics in results.items():
+        base = baseline.get(case)
+        if base is None:
+            print(f"{case:<32} (not in baseline)")
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in metrics or not base.get(metric):
+                continue
+            change = metrics[metric] / base[metric] - 1
+            if metric in LOWER_IS_BETTER:
+                worse = change > threshold and metrics[metric] - base[metric] > MIN_CHANGE[metric]
+            else:
+                worse = change < -threshold and base[metric] - metrics[metric] > MIN_CHANGE[metric]
+            flag = ("  (ignored)" if metric in ignore else "  REGRESSION") if worse else ""
+            worse = worse and metric not in ignore
+            print(f"{case:<32} {metric:<18} {base[metric]:>12.2f} {metrics[metric]:>12.2f} {change:>+8.1%}{flag}")
+            if worse:
+                regressions.append(f"{case} {metric}: {base[metric]:.2f} -> {metrics[metric]:.2f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fit time, latency, throughput, memory and load time")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS),
+                        help="; ".join(f"{k}: {v}" for k, v in VARIANTS.items()))
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--synthetic-rows", type=int, default=20000, help="Size of the synthetic corpus")
+    parser.add_argument("--single", type=int, default=200, help="Messages timed one at a time for latency percentiles")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of the fit, latency, throughput and load timings")
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fail when a metric is worse than the baseline by more than this fraction "
+                             "(and by more than its absolute MIN_CHANGE)")
+    parser.add_argument("--ignore", nargs="*", default=[], choices=LOWER_IS_BETTER + HIGHER_IS_BETTER,
+                        help="Metrics reported but not failed on (e.g. p99_us on noisy shared runners)")
+    args = parser.parse_args()
+
+    import sklearn
+    meta = {"python": platform.python_version(), "sklearn": sklearn.__version__, "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "synthetic_rows": args.synthetic_rows}
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+
+    results = {}
+    print(f"{'case':<32} {'rows':>7} {'fit s':>8} {'p50 us':>9} {'p99 us':>9} {'msg/s':>10} {'load ms':>8} {'peak MB':>8}")
+    for dataset in args.datasets:
+        for variant in args.variants:
+            case = f"{variant}/{dataset}"
+            # one process per case so peak RSS and caches are per case
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                r = pool.submit(run_case, variant, dataset, args.synthetic_rows, args.single, args.repeat).result()
+            results[case] = r
+
+            def col(key, width, prec):
+                return f"{r[key]:>{width}.{prec}f}" if key in r else f"{'-':>{width}}"
+            print(f"{case:<32} {r['rows']:>7} {col('fit_s', 8, 2)} {col('p50_us', 9, 0)} {col('p99_us', 9, 0)} "
+                  f"{col('batch_msgs_per_s', 10, 0)} {col('load_ms', 8, 1)} {col('peak_rss_mb', 8, 0)}", flush=True)
+
+    report = {"meta": meta, "results": results}
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}" + (f" and baseline {args.baseline}" if args.save_baseline else ""))
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if {k: baseline["meta"].get(k) for k in ("machine", "cpus")} != {k: meta[k] for k in ("machine", "cpus")}:
+        print("warning: baseline was recorded on different hardware; timings are not comparable")
+    regressions = compare(results, baseline["results"], args.threshold, args.ignore)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
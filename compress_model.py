@@ -0,0 +1,225 @@
+"""Shrink a saved TF-IDF + Naive Bayes / linear model by pruning its vocabulary and quantizing weights.
+
+Features are ranked by their mean contribution to the class scores on
+`--data` (src/compression.py). How many are kept comes from `--keep`, from
+`--target-mb` (the largest vocabulary whose output file fits) or, by default,
+from `--max-f1-drop` (the smallest vocabulary whose macro F1 on `--data` stays
+within the budget). Whatever the choice, the output is not written when its
+F1 drops by more than `--max-f1-drop`, unless `--force` is given.
+
+The output format follows the extension: `.joblib` (sklearn pipeline; float16
+at most), `.bin` (binary artifact, src/model_artifact.py) or `.json`
+(frontend/public/model/model.json layout; quantization rounds the numbers).
+Size, load time, single-message latency and F1 are reported for the input
+and the output. F1 and latency of a `.json` output are measured with the
+equivalent NumPy model, not the frontend's own tokenizer.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from joblib import dump, load
+from sklearn.metrics import f1_score
+
+from src.compression import QUANTIZE, from_json, prune, prune_pipeline, quantize, ranking, to_json
+from src.data_io import normalize_label, read_table
+from src.fast_inference import from_model
+from src.model_artifact import is_artifact, load_artifact, save_artifact
+
+# significant digits kept in JSON output per quantization
+JSON_DIGITS = {None: None, "float16": 4, "int8": 3}
+
+
+def load_data(path):
+    df = read_table(path, ["text", "label"], optional=["subject"])
+    texts = df["text"].fillna("")
+    if "subject" in df.columns:
+        texts = df["subject"].fillna("") + " " + texts
+    return texts.astype(str).tolist(), df["label"].map(normalize_label).tolist()
+
+
+def match_labels(labels, classes):
+    """`labels` ("spam"/"ham") expressed as the model's `classes` (e.g. "1"/"0" from trainers that keep raw labels).
+
+    Raises SystemExit when none of the labels can be matched to a class, since
+    every F1 would then be 0 and the budget check meaningless.
+    """
+    classes = list(classes)
+    if not set(labels) <= set(classes):
+        by_name = {normalize_label(c): c for c in classes}
+        if len(by_name) == len(classes):
+            labels = [by_name.get(label, label) for label in labels]
+    if not set(labels) & set(classes):
+        raise SystemExit(f"--data labels {sorted(set(map(str, labels)))} do not match the model classes "
+                         f"{[str(c) for c in classes]}")
+    return labels
+
+
+def output_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        return "json"
+    if ext in (".bin", ".artifact"):
+        return "bin"
+    return "joblib"
+
+
+def macro_f1(model, texts, labels):
+    return f1_score(labels, model.predict(texts), average="macro")
+
+
+def write(model, fmt, path, fast, keep, dtype):
+    if fmt == "joblib":
+        dump(prune_pipeline(model, keep, dtype), path)
+    elif fmt == "bin":
+        save_artifact(quantize(prune(fast, keep), dtype), path)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(to_json(quantize(prune(fast, keep), dtype), JSON_DIGITS[dtype]), f, separators=(",", ":"))
+
+
+def read(path, fmt, template):
+    """Load `path` the way its consumers do; returns `(loaded object, model to score with)`."""
+    if fmt == "json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data, from_json(data, template)
+    obj = load_artifact(path) if fmt == "bin" else load(path)
+    return obj, obj
+
+
+def measure(path, fmt, template, texts, labels, single, repeat=3):
+    load_ms = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, model = read(path, fmt, template)
+        load_ms = min(load_ms, (time.perf_counter() - start) * 1e3)
+    lat = []
+    for t in texts[:single]:
+        start = time.perf_counter()
+        model.predict([t])
+        lat.append(time.perf_counter() - start)
+    return {"size_mb": os.path.getsize(path) / 1e6, "load_ms": load_ms, "p50_us": float(np.median(lat)) * 1e6,
+            "f1": macro_f1(model, texts, labels)}
+
+
+class Candidates:
+    """Writes the top-k version of the model to `path` and scores it, for the search over k."""
+
+    def __init__(self, model, fast, fmt, order, dtype, texts, labels, path):
+        self.model, self.fast, self.fmt, self.order, self.dtype = model, fast, fmt, order, dtype
+        self.texts, self.labels, self.path = texts, labels, path
+        self.base_f1 = macro_f1(fast, texts, labels)
+
+    def size_mb(self, k):
+        write(self.model, self.fmt, self.path, self.fast, self.order[:k], self.dtype)
+        return os.path.getsize(self.path) / 1e6
+
+    def f1_drop(self, k):
+        size_mb = self.size_mb(k)
+        f1 = macro_f1(read(self.path, self.fmt, self.fast)[1], self.texts, self.labels)
+        print(f"  {k:>8} features: F1 {f1:.4f} ({f1 - self.base_f1:+.4f}), {size_mb:.3f} MB")
+        return self.base_f1 - f1
+
+
+def choose_features(candidates, n, keep=None, target_mb=None, max_f1_drop=0.01):
+    if keep:
+        return max(1, min(n, int(round(keep * n)) if keep <= 1 else int(keep)))
+    lo, hi = 1, n
+    if target_mb:
+        # the largest k that fits; size grows with k
+        if candidates.size_mb(lo) > target_mb:
+            raise SystemExit(f"even a single feature does not fit in {target_mb} MB")
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if candidates.size_mb(mid) <= target_mb:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+    # the smallest k within the F1 budget; F1 grows (nearly) monotonically with k
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if candidates.f1_drop(mid) <= max_f1_drop:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune and quantize a saved model, keeping F1 within a budget")
+    parser.add_argument("--model", required=True, help="Input .joblib model or binary artifact")
+    parser.add_argument("--output", required=True, help="Output .joblib, .bin or .json (frontend layout)")
+    parser.add_argument("--data", default="data/sms_spam.csv", help="Labelled texts used to rank features and check F1 "
+                                                                    "(preferably held out from training)")
+    parser.add_argument("--keep", type=float, help="Features to keep: a count, or a fraction when <= 1")
+    parser.add_argument("--target-mb", type=float, help="Keep the most features whose output fits in this many MB")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest allowed macro-F1 loss; without --keep/--target-mb, prune as far as this allows")
+    parser.add_argument("--quantize", choices=QUANTIZE, help="Store weights as float16 or int8 (int8: .bin/.json only)")
+    parser.add_argument("--force", action="store_true", help="Write the output even when F1 drops beyond the budget")
+    parser.add_argument("--single", type=int, default=200, help="Messages timed one at a time for the latency")
+    args = parser.parse_args()
+
+    fmt = output_format(args.output)
+    in_fmt = "bin" if is_artifact(args.model) else "joblib"
+    if fmt == "joblib" and in_fmt != "joblib":
+        raise SystemExit(".joblib output needs a .joblib input model")
+    if fmt == "joblib" and args.quantize == "int8":
+        raise SystemExit("int8 weights need a .bin or .json output; use --quantize float16 for .joblib")
+
+    model = load(args.model) if in_fmt == "joblib" else None
+    try:
+        fast = from_model(model) if model is not None else load_artifact(args.model)
+    except ValueError as e:
+        raise SystemExit(f"cannot compress {args.model}: {e}")
+    texts, labels = load_data(args.data)
+    labels = match_labels(labels, fast.classes_)
+    n = fast.n_features
+
+    # candidates are written next to the output and the accepted one is renamed into place
+    fd, probe = tempfile.mkstemp(suffix=os.path.splitext(args.output)[1], dir=os.path.dirname(args.output) or ".")
+    os.close(fd)
+    try:
+        candidates = Candidates(model, fast, fmt, ranking(fast, texts), args.quantize, texts, labels, probe)
+        print(f"{n} features, macro F1 {candidates.base_f1:.4f} on {len(texts)} rows of {args.data}")
+        if candidates.base_f1 == 0:
+            raise SystemExit(f"the model scores macro F1 0 on {args.data}; cannot check the F1 budget")
+        k = choose_features(candidates, n, args.keep, args.target_mb, args.max_f1_drop)
+        drop = candidates.f1_drop(k)
+        if drop > args.max_f1_drop and not args.force:
+            raise SystemExit(f"macro F1 drops by {drop:.4f} with {k} features, more than --max-f1-drop "
+                             f"{args.max_f1_drop}; not writing {args.output} (use --force to write anyway)")
+        os.replace(probe, args.output)
+    except ValueError as e:
+        # e.g. a calibrated or linear model written to the frontend JSON
+        raise SystemExit(f"cannot write {args.output}: {e}")
+    finally:
+        if os.path.exists(probe):
+            os.remove(probe)
+    print(f"Wrote {args.output}: kept {k} of {n} features ({k / n:.1%})"
+          + (f", {args.quantize} weights" if args.quantize else ""))
+
+    rows = [("input", measure(args.model, in_fmt, fast, texts, labels, args.single))]
+    if fmt != in_fmt:
+        # the full model in the output format, to separate the format change from the compression
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, "full" + os.path.splitext(args.output)[1])
+            write(model, fmt, full, fast, np.arange(n), None)
+            rows.append((f"full {fmt}", measure(full, fmt, fast, texts, labels, args.single)))
+    rows.append(("output", measure(args.output, fmt, fast, texts, labels, args.single)))
+    print(f"\n{'':<12} {'size MB':>9} {'load ms':>9} {'p50 us':>9} {'macro F1':>9}")
+    for name, r in rows:
+        print(f"{name:<12} {r['size_mb']:>9.3f} {r['load_ms']:>9.1f} {r['p50_us']:>9.0f} {r['f1']:>9.4f}")
+    base, after = rows[-2][1], rows[-1][1]
+    print(f"{'change':<12} {after['size_mb'] / base['size_mb'] - 1:>+9.1%} {after['load_ms'] / base['load_ms'] - 1:>+9.1%} "
+          f"{after['p50_us'] / base['p50_us'] - 1:>+9.1%} {after['f1'] - base['f1']:>+9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import os
+import time
+
+from src.fast_inference import from_model
+from src.model_artifact import load_artifact, save_artifact
+from joblib import load
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a saved .joblib model into a memory-mappable binary artifact")
+    parser.add_argument("--model", required=True, help="Input .joblib model")
+    parser.add_argument("--output", help="Output path (default: input path with .bin extension)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + ".bin"
+    t0 = time.perf_counter()
+    model = load(args.model)
+    joblib_load = time.perf_counter() - t0
+
+    header = save_artifact(from_model(model), output)
+
+    t0 = time.perf_counter()
+    load_artifact(output)
+    artifact_load = time.perf_counter() - t0
+
+    print(f"Wrote {output}: {len(header['classes'])} classes, {header['arrays']['terms']['shape'][0]} terms, "
+          f"{os.path.getsize(output) / 1e6:.2f} MB (joblib {os.path.getsize(args.model) / 1e6:.2f} MB)")
+    print(f"load time: joblib {joblib_load * 1e3:.1f} ms, artifact {artifact_load * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
 import argparse
+from contextlib import nullcontext
 
+from src.fast_inference import load_fast
 from src.nb_classifier import SpamClassifier
+from src.profiling import add_profile_args, profile_model
 
 
 def main():
     parser = argparse.ArgumentParser(description="Load saved model and predict text labels")
     parser.add_argument("--model", default="models/model.joblib", help="Path to saved model")
     parser.add_argument("--text", help="Text to classify; if omitted, runs a small demo")
+    parser.add_argument("--fast", action="store_true", help="Score with the NumPy-only engine (src/fast_inference.py); also accepts binary artifacts")
+    add_profile_args(parser)
     args = parser.parse_args()
 
-    clf = SpamClassifier.load(args.model)
+    if args.fast:
+        clf = load_fast(args.model)
+    else:
+        clf = SpamClassifier.load(args.model)
 
     if args.text:
         texts = [args.text]
@@ -19,9 +27,16 @@ def main():
             "Hey, are we still meeting for lunch tomorrow?",
         ]
 
-    preds = clf.predict(texts)
+    session = None
+    if args.profile:
+        clf, session = profile_model(clf, args)
+    with session or nullcontext():
+        preds = clf.predict(texts)
     for t, p in zip(texts, preds):
         print(f"{p}\t{t}")
+    if session is not None:
+        print()
+        print(session.report())
 
 
 if __name__ == "__main__":
@@ -1,30 +1,257 @@
 import argparse
-import csv
+import json
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from src.data_io import TableReader, TableWriter, column_names, is_compressed, read_table, table_format
+from src.fast_inference import load_fast
 from src.nb_classifier_adv import AdvancedSpamClassifier
+from src.profiling import add_profile_args, profile_model
+
+
+def extract_texts(df):
+    if "subject" in df.columns and "text" in df.columns:
+        return (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str).tolist()
+    if "text" in df.columns:
+        return df["text"].astype(str).tolist()
+    raise ValueError("Input must contain 'text' or ('subject' and 'text') columns")
+
+
+def input_columns(path, keep):
+    """Columns to read: the text columns plus `keep` (all columns when `keep` is None)."""
+    names = column_names(path)
+    if keep is None:
+        return names
+    return [c for c in names if c in ("subject", "text") or c in keep]
+
+
+def load_progress(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_progress(path, rows_done, output_bytes, position):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"rows_done": rows_done, "output_bytes": output_bytes, "input": position}, f)
+    os.replace(tmp, path)
+
+
+def load_model(path, fast):
+    if fast:
+        return load_fast(path)
+    return AdvancedSpamClassifier.load(path)
+
+
+_worker_clf = None
+
+
+def _init_worker(model_path, fast):
+    global _worker_clf
+    _worker_clf = load_model(model_path, fast)
+
+
+def _score_chunk(texts):
+    start = time.perf_counter()
+    preds = _worker_clf.predict(texts)
+    return preds, os.getpid(), time.perf_counter() - start
+
+
+def score_parallel(chunks, model_path, fast, workers, stats):
+    """Yield `(chunk, preds)` in input order, scoring up to 2 * `workers` chunks ahead in a process pool.
+
+    Every worker loads the model once. A worker that dies (e.g. OOM-killed)
+    or raises stops the run with an error naming the affected rows.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    pending = deque()
+    first_row = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, fast)) as pool:
+
+        def collect():
+            chunk, start_row, fut = pending.popleft()
+            try:
+                preds, pid, seconds = fut.result()
+            except BrokenProcessPool:
+                raise SystemExit(f"A worker process died while scoring rows {start_row}-{start_row + len(chunk) - 1}; "
+                                 "rerun with --resume to continue from the last completed chunk")
+            except Exception as e:
+                raise SystemExit(f"Scoring rows {start_row}-{start_row + len(chunk) - 1} failed in a worker: "
+                                 f"{type(e).__name__}: {e}")
+            rows, busy = stats.get(pid, (0, 0.0))
+            stats[pid] = (rows + len(chunk), busy + seconds)
+            return chunk, preds
+
+        for chunk in chunks:
+            pending.append((chunk, first_row, pool.submit(_score_chunk, extract_texts(chunk))))
+            first_row += len(chunk)
+            if len(pending) >= 2 * workers:
+                yield collect()
+        while pending:
+            yield collect()
+
+
+def predict_streaming(clf, input_path, output_path, chunksize, resume=False, workers=1, model_path=None, fast=False,
+                      keep=None):
+    """Score the input in chunks of `chunksize` rows, appending each chunk to the output.
+
+    After every chunk the output is flushed and `<output>.progress` records how
+    many input rows are done, the output size and the input position at that
+    point (`TableReader.position()`: a byte offset for CSV). With `resume`, a
+    previous run is continued from there: the output is truncated back to the
+    last complete chunk and the input is read from the saved position, so the
+    rows already scored are not parsed again. With
+    `workers` > 1, chunks are scored in a process pool and written in input
+    order.
+
+    Input and output may be CSV, Parquet or Arrow (see `src.data_io`); only
+    the text columns and `keep` are read. Checkpointing and `resume` need an
+    uncompressed CSV output, other outputs are written in one pass.
+    """
+    if table_format(output_path) != "csv" or is_compressed(output_path):
+        if resume:
+            raise SystemExit("--resume needs an uncompressed CSV output")
+        return _predict_streaming_columnar(clf, input_path, output_path, chunksize, workers, model_path, fast, keep)
+
+    progress_path = output_path + ".progress"
+    state = load_progress(progress_path) if resume else None
+    rows_done = 0
+    position = None
+    if state is not None:
+        rows_done = state["rows_done"]
+        # progress files from before input positions were saved resume by row count
+        position = state.get("input") or {"row": rows_done, "offset": None}
+        with open(output_path, "r+b") as out:
+            out.truncate(state["output_bytes"])
+        print(f"Resuming after {rows_done} rows")
+
+    reader = TableReader(input_path, batch_rows=chunksize, columns=input_columns(input_path, keep), start=position)
+    # reader position after each chunk read; chunks are written in the same order
+    positions = deque()
+    start = time.perf_counter()
+    scored = 0
+    worker_stats = {}
+    with open(output_path, "ab" if state else "wb") as out:
+
+        def chunks():
+            for chunk in reader:
+                positions.append(reader.position())
+                yield chunk
+
+        if workers > 1:
+            scored_chunks = score_parallel(chunks(), model_path, fast, workers, worker_stats)
+        else:
+            scored_chunks = ((chunk, clf.predict(extract_texts(chunk))) for chunk in chunks())
+
+        for chunk, preds in scored_chunks:
+            chunk["predicted_label"] = preds
+            out.write(chunk.to_csv(index=False, header=out.tell() == 0).encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+            rows_done += len(chunk)
+            scored += len(chunk)
+            save_progress(progress_path, rows_done, out.tell(), positions.popleft())
+
+            print_progress(rows_done, reader, scored, start)
+
+    os.remove(progress_path)
+    print_summary(scored, start, worker_stats)
+
+
+def _predict_streaming_columnar(clf, input_path, output_path, chunksize, workers, model_path, fast, keep):
+    # CSV columns are typed per chunk by their values; read them as text so every chunk fits the output schema
+    dtype = str if table_format(input_path) == "csv" else None
+    reader = TableReader(input_path, batch_rows=chunksize, columns=input_columns(input_path, keep), dtype=dtype)
+    start = time.perf_counter()
+    scored = 0
+    worker_stats = {}
+    if workers > 1:
+        scored_chunks = score_parallel(iter(reader), model_path, fast, workers, worker_stats)
+    else:
+        scored_chunks = ((chunk, clf.predict(extract_texts(chunk))) for chunk in reader)
+    with TableWriter(output_path) as out:
+        for chunk, preds in scored_chunks:
+            chunk["predicted_label"] = preds
+            out.write(chunk)
+            scored += len(chunk)
+            print_progress(scored, reader, scored, start)
+    print_summary(scored, start, worker_stats)
+
+
+def print_progress(rows_done, reader, scored, start):
+    elapsed = time.perf_counter() - start
+    print(f"{rows_done} rows ({reader.fraction_done():.1%} of input), "
+          f"{scored / max(elapsed, 1e-9):.0f} rows/s", flush=True)
+
+
+def print_summary(scored, start, worker_stats):
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} rows in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.0f} rows/s)")
+    if worker_stats:
+        print(f"{'worker pid':>10} {'rows':>10} {'busy s':>8} {'rows/s':>9}")
+        for pid, (rows, busy) in sorted(worker_stats.items()):
+            print(f"{pid:>10} {rows:>10} {busy:>8.1f} {rows / max(busy, 1e-9):>9.0f}")
+        print(f"overall: {scored / max(elapsed, 1e-9):.0f} rows/s with {len(worker_stats)} workers")
+
+
+def print_profile(session):
+    if session is not None:
+        print()
+        print(session.report())
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Batch predict labels for CSV with subject/text columns")
+    parser = argparse.ArgumentParser(description="Batch predict labels for CSV/Parquet/Arrow files with subject/text columns")
     parser.add_argument("--model", default="models/model_advanced.joblib")
-    parser.add_argument("--input", required=True, help="Input CSV path with 'text' or 'subject'+'text' columns")
-    parser.add_argument("--output", default="predictions.csv")
+    parser.add_argument("--input", required=True, help="Input CSV (optionally .gz/.bz2/.xz/.zst), Parquet or Arrow file "
+                                                       "with 'text' or 'subject'+'text' columns")
+    parser.add_argument("--output", default="predictions.csv", help="Output file; .parquet/.arrow write a columnar file")
+    parser.add_argument("--columns", help="Comma-separated input columns to copy to the output (default: all); "
+                                          "other columns are not read")
+    parser.add_argument("--fast", action="store_true", help="Score with the NumPy-only engine (src/fast_inference.py); also accepts binary artifacts")
+    parser.add_argument("--chunksize", type=int, default=0, help="Stream the input in chunks of this many rows with constant memory (0 = load everything)")
+    parser.add_argument("--resume", action="store_true", help="With --chunksize, continue an interrupted run from its last completed chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Score chunks in this many processes, each loading the model once (implies streaming)")
+    add_profile_args(parser)
     args = parser.parse_args()
 
-    clf = AdvancedSpamClassifier.load(args.model)
+    if args.profile and args.workers > 1:
+        raise SystemExit("--profile needs --workers 1 (the model is profiled in this process)")
+    if args.workers > 1 and args.chunksize <= 0:
+        args.chunksize = 10000
 
-    import pandas as pd
-    df = pd.read_csv(args.input)
-    if "subject" in df.columns and "text" in df.columns:
-        texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str).tolist()
-    elif "text" in df.columns:
-        texts = df["text"].astype(str).tolist()
-    else:
-        raise ValueError("Input CSV must contain 'text' or ('subject' and 'text') columns")
+    # worker processes load their own copy
+    clf = load_model(args.model, args.fast) if args.workers <= 1 else None
+    session = None
+    if args.profile:
+        clf, session = profile_model(clf, args)
+
+    keep = None if args.columns is None else [c.strip() for c in args.columns.split(",") if c.strip()]
+    if args.chunksize > 0:
+        # streaming interleaves IO with scoring, so the profile covers both
+        with session or nullcontext():
+            predict_streaming(clf, args.input, args.output, args.chunksize, resume=args.resume,
+                              workers=args.workers, model_path=args.model, fast=args.fast, keep=keep)
+        print(f"Wrote predictions to {args.output}")
+        print_profile(session)
+        return
+
+    df = read_table(args.input, input_columns(args.input, keep))
+    texts = extract_texts(df)
 
-    preds = clf.predict(texts)
+    with session or nullcontext():
+        preds = clf.predict(texts)
     df["predicted_label"] = preds
-    df.to_csv(args.output, index=False)
+    with TableWriter(args.output) as out:
+        out.write(df)
     print(f"Wrote predictions to {args.output}")
+    print_profile(session)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""Vocabulary pruning and weight quantization for TF-IDF + Naive Bayes / linear models.
+
+A feature moves a prediction by its TF-IDF value times the spread of its
+class weights (for binary models: its contribution to the class log-odds).
+`feature_importance` averages that contribution over sample texts, so rare
+features and features that move every class alike rank last. `prune` keeps
+the top columns of a `FastTextModel`; `prune_pipeline` does the same to the
+fitted sklearn model so it still loads with joblib. A pruned feature also
+leaves the L2 norm of the TF-IDF row, so scores of the remaining features
+shift slightly: check pruned models on held-out data (compress_model.py
+does).
+
+`quantize` stores weights as float16, or as int8 with a per-class scale and
+offset (255 levels over each class's weight range).
+"""
+
+import copy
+
+import numpy as np
+
+from src.fast_inference import _unwrap, sorted_terms
+
+QUANTIZE = ("float16", "int8")
+
+
+def dequantized_weights(model):
+    """`(n_features, n_outputs)` float64 weights of a `FastTextModel`, undoing int8 quantization."""
+    w = np.asarray(model.weights, dtype=np.float64)
+    if model.weight_scale is not None:
+        w = w * model.weight_scale + model.weight_offset
+    return w
+
+
+def weight_spread(model):
+    """Largest difference between class weights per feature (|weight| for single-output linear models)."""
+    w = dequantized_weights(model)
+    if w.shape[1] == 1:
+        return np.abs(w[:, 0])
+    return w.max(axis=1) - w.min(axis=1)
+
+
+def feature_importance(model, texts):
+    """Mean absolute contribution of every feature to the class scores over `texts`."""
+    _, cols, vals, n = model.features(texts)
+    mean_value = np.bincount(cols, weights=np.abs(vals), minlength=model.n_features) / max(n, 1)
+    return mean_value * weight_spread(model)
+
+
+def ranking(model, texts):
+    """Feature columns from most to least important; features absent from `texts` are ordered by weight spread."""
+    return np.lexsort((-weight_spread(model), -feature_importance(model, texts)))
+
+
+def prune(model, keep):
+    """Copy of a `FastTextModel` with only the feature columns in `keep`, renumbered in column order."""
+    keep = np.sort(np.asarray(keep))
+    if not len(keep):
+        raise ValueError("keep at least one feature")
+    pos_cols = np.arange(len(model.terms)) if model.term_cols is None else np.asarray(model.term_cols)
+    kept = np.isin(pos_cols, keep)
+    out = copy.copy(model)
+    out.terms = np.asarray(model.terms)[kept]
+    out.term_cols = np.searchsorted(keep, pos_cols[kept]).astype(np.int32)
+    out.weights = np.asarray(model.weights)[keep]
+    if model.idf is not None:
+        out.idf = np.asarray(model.idf)[keep]
+    return out
+
+
+def quantize(model, dtype):
+    """Copy of a `FastTextModel` with float16 or int8 weights (and float16 idf); `dtype=None` returns `model`."""
+    if dtype is None:
+        return model
+    if dtype not in QUANTIZE:
+        raise ValueError(f"unsupported quantization {dtype!r}; expected one of {QUANTIZE}")
+    w = dequantized_weights(model)
+    out = copy.copy(model)
+    out.weight_scale = out.weight_offset = None
+    if dtype == "float16":
+        out.weights = w.astype(np.float16)
+    else:
+        lo, hi = w.min(axis=0), w.max(axis=0)
+        out.weight_offset = (hi + lo) / 2
+        out.weight_scale = np.where(hi > lo, (hi - lo) / 254, 1.0)
+        out.weights = np.clip(np.rint((w - out.weight_offset) / out.weight_scale), -127, 127).astype(np.int8)
+    if model.idf is not None:
+        out.idf = np.asarray(model.idf).astype(np.float16)
+    return out
+
+
+def prune_pipeline(model, keep, dtype=None):
+    """Deep copy of a fitted sklearn model that keeps only the vectorizer columns in `keep`.
+
+    Accepts the models `src.fast_inference.from_model` accepts. A feature
+    selection step is folded into the classifier and replaced by
+    "passthrough". `dtype="float16"` stores the classifier weights as float16
+    (int8 needs the binary artifact, see `quantize`).
+    """
+    if dtype not in (None, "float16"):
+        raise ValueError("sklearn models can only be quantized to float16; write a binary artifact for int8")
+    keep = np.sort(np.asarray(keep))
+    model = copy.deepcopy(model)
+    root = _unwrap(model)
+    if type(root).__name__ == "CalibratedClassifierCV":
+        # calibration members share one fitted pipeline (see from_model); deepcopy keeps that sharing
+        pipelines = {id(p): p for p in (_unwrap(m.estimator) for m in root.calibrated_classifiers_)}.values()
+    else:
+        pipelines = [root]
+    for pipeline in pipelines:
+        _prune_steps(pipeline, keep, dtype)
+    return model
+
+
+def _prune_steps(pipeline, keep, dtype):
+    vect = pipeline.steps[0][1]
+    terms = np.empty(len(vect.vocabulary_), dtype=object)
+    for term, col in vect.vocabulary_.items():
+        terms[col] = term
+    vect.vocabulary_ = {terms[col]: i for i, col in enumerate(keep)}
+    if hasattr(vect, "stop_words_"):
+        # diagnostics only; often larger than the vocabulary itself
+        del vect.stop_words_
+    if hasattr(vect, "_tfidf"):
+        if vect.use_idf:
+            vect.idf_ = vect.idf_[keep]
+        vect._tfidf.n_features_in_ = len(keep)
+
+    # column of every kept feature in the classifier input, -1 if a selector dropped it
+    clf_cols = keep
+    for i, (name, step) in enumerate(pipeline.steps[1:-1], start=1):
+        if step is None or step == "passthrough":
+            continue
+        if hasattr(step, "idf_") or type(step).__name__ == "TfidfTransformer":
+            if hasattr(step, "idf_"):
+                step.idf_ = step.idf_[keep]
+            step.n_features_in_ = len(keep)
+            continue
+        selector = step.selector_ if hasattr(getattr(step, "selector_", None), "get_support") else step
+        support = selector.get_support(indices=True)
+        pos = np.minimum(np.searchsorted(support, clf_cols), len(support) - 1)
+        clf_cols = np.where(support[pos] == clf_cols, pos, -1)
+        pipeline.steps[i] = (name, "passthrough")
+
+    clf = pipeline.steps[-1][1]
+    n_clf = clf.n_features_in_
+    valid = clf_cols >= 0
+    for attr, value in list(vars(clf).items()):
+        # feature_log_prob_, feature_count_, feature_all_, coef_, ...
+        if isinstance(value, np.ndarray) and value.ndim and value.shape[-1] == n_clf:
+            pruned = np.zeros(value.shape[:-1] + (len(keep),), dtype=value.dtype)
+            pruned[..., valid] = value[..., clf_cols[valid]]
+            setattr(clf, attr, pruned)
+    clf.n_features_in_ = len(keep)
+    if dtype == "float16":
+        for attr in ("feature_log_prob_", "coef_"):
+            if hasattr(clf, attr):
+                setattr(clf, attr, getattr(clf, attr).astype(np.float16))
+
+
+def to_json(model, digits=None):
+    """The `frontend/public/model/model.json` layout of `archive/backend/scripts/export_model_json.py`.
+
+    Only uncalibrated Naive Bayes models with idf fit that layout. `digits`
+    rounds idf and weights to that many significant digits.
+    """
+    if model.kind != "nb" or model.calibrators or model.idf is None:
+        raise ValueError("the frontend JSON holds uncalibrated TF-IDF Naive Bayes models only")
+
+    def values(arr):
+        arr = np.asarray(arr, dtype=np.float64).tolist()
+        return arr if digits is None else [float(f"{v:.{digits}g}") for v in arr]
+
+    cols = np.arange(len(model.terms)) if model.term_cols is None else np.asarray(model.term_cols)
+    terms = [t.decode("ascii") if isinstance(t, bytes) else t for t in np.asarray(model.terms).tolist()]
+    w = dequantized_weights(model)
+    return {
+        "vocabulary": {t: int(c) for t, c in zip(terms, cols)},
+        "idf": values(model.idf),
+        "feature_log_prob": [values(w[:, j]) for j in range(w.shape[1])],
+        "class_log_prior": np.asarray(model.bias, dtype=np.float64).tolist(),
+        "classes": [str(c) for c in model.classes_],
+    }
+
+
+def from_json(data, template):
+    """`FastTextModel` scoring like the JSON `data`; analyzer and TF options come from `template`."""
+    out = copy.copy(template)
+    out.terms, out.term_cols = sorted_terms(data["vocabulary"])
+    out.idf = np.asarray(data["idf"], dtype=np.float64)
+    out.weights = np.asarray(data["feature_log_prob"], dtype=np.float64).T
+    out.weight_scale = out.weight_offset = None
+    out.bias = np.asarray(data["class_log_prior"], dtype=np.float64)
+    out.classes_ = np.asarray(data["classes"])
+    return out
@@ -0,0 +1,355 @@
+"""Column-pruned readers and writers for CSV (optionally compressed), Parquet and Arrow IPC files.
+
+The format is chosen from the file extension: `.parquet`/`.pq`,
+`.arrow`/`.feather`/`.ipc`, otherwise CSV (`.csv.gz`, `.csv.bz2`, `.csv.xz`,
+`.csv.zst` are decompressed on the fly). Only the requested columns are
+read: Parquet and Arrow skip the other columns on disk, and Arrow files are
+memory-mapped so record batches are sliced without copying. CSV goes
+through pyarrow's multithreaded parser when pyarrow is installed and
+through `pandas.read_csv(usecols=...)` otherwise. pyarrow is required for
+Parquet/Arrow.
+
+`TableReader` streams batches and reports a `position()` from which a new
+reader can `start` again without parsing the rows before it: Parquet skips
+whole row groups, Arrow slices its record batches, and CSV seeks to the byte
+offset where the next record begins (CSV batches are cut at newlines outside
+quoted fields).
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+import numpy as np
+import pandas as pd
+
+PARQUET_EXTS = (".parquet", ".pq")
+ARROW_EXTS = (".arrow", ".feather", ".ipc")
+COMPRESSION = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+_OPENERS = {None: open, "gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+_CSV_BLOCK_BYTES = 1 << 20
+
+
+def _name(source):
+    return source if isinstance(source, str) else getattr(source, "name", "") or ""
+
+
+def _compression(source):
+    name = _name(source).lower()
+    return next((codec for ext, codec in COMPRESSION.items() if name.endswith(ext)), None)
+
+
+def is_compressed(source) -> bool:
+    return _compression(source) is not None
+
+
+def table_format(source) -> str:
+    """"parquet", "arrow" or "csv" for a path or named file object."""
+    name = _name(source).lower()
+    if _compression(source):
+        name = os.path.splitext(name)[0]
+    if name.endswith(PARQUET_EXTS):
+        return "parquet"
+    if name.endswith(ARROW_EXTS):
+        return "arrow"
+    return "csv"
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _require_pyarrow(fmt):
+    if not has_pyarrow():
+        raise ImportError(f"Reading/writing {fmt} files requires pyarrow (pip install pyarrow)")
+
+
+def _open_arrow(source):
+    import pyarrow as pa
+    if isinstance(source, str):
+        return pa.ipc.open_file(pa.memory_map(source, "r"))
+    data = source.read()
+    source.seek(0)
+    return pa.ipc.open_file(pa.BufferReader(data))
+
+
+def column_names(source):
+    fmt = table_format(source)
+    if fmt == "parquet":
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source).schema_arrow.names
+    if fmt == "arrow":
+        _require_pyarrow(fmt)
+        return _open_arrow(source).schema.names
+    names = pd.read_csv(source, nrows=0, compression=_compression(source)).columns.tolist()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return names
+
+
+def _select(source, columns, optional):
+    names = column_names(source)
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise ValueError(f"{_name(source) or 'Input'} is missing required column(s): {', '.join(missing)}")
+    return list(columns) + [c for c in optional if c in names and c not in columns]
+
+
+def read_table(source, columns=(), optional=()):
+    """DataFrame with `columns` (required) and whichever of `optional` exist; other columns are not read."""
+    fmt = table_format(source)
+    wanted = _select(source, columns, optional)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(source, columns=wanted).to_pandas()
+    if fmt == "arrow":
+        return _open_arrow(source).read_all().select(wanted).to_pandas()
+    compression = _compression(source)
+    # pyarrow decompresses paths by extension but not file objects, and has no xz codec
+    if has_pyarrow() and (isinstance(source, str) or not compression) and compression != "xz":
+        import pyarrow as pa
+        import pyarrow.csv as pcsv
+        try:
+            table = pcsv.read_csv(source, parse_options=pcsv.ParseOptions(newlines_in_values=True),
+                                  convert_options=pcsv.ConvertOptions(include_columns=wanted, strings_can_be_null=True))
+            return table.to_pandas()
+        except pa.ArrowInvalid:
+            # pyarrow rejects ragged rows that pandas tolerates; parse those exactly as pd.read_csv always did
+            if hasattr(source, "seek"):
+                source.seek(0)
+            return pd.read_csv(source, compression=compression)[wanted]
+    return pd.read_csv(source, usecols=wanted, compression=compression)[wanted]
+
+
+def normalize_label(v):
+    """Map labels across datasets to "spam"/"ham": numeric 0/1 and common string variants; missing is "ham"."""
+    if pd.isna(v):
+        return "ham"
+    # numeric labels like 0/1
+    try:
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return "spam" if int(v) == 1 else "ham"
+        s = str(v).strip().lower()
+    except Exception:
+        s = str(v).strip().lower()
+    if s in ("1", "spam", "s", "true", "t", "yes", "y"):
+        return "spam"
+    return "ham"
+
+
+class _RecordSplitter:
+    """Byte offsets of CSV record ends in a stream of blocks that starts at a record boundary.
+
+    A newline ends a record when an even number of quotes precedes it
+    (escaped quotes come in pairs), so quoted fields may span lines. Blocks
+    are kept until `take` joins the bytes of the first records.
+    """
+
+    def __init__(self, src):
+        self.src = src
+        self.blocks = []
+        self.ends = np.empty(0, dtype=np.int64)
+        self.size = 0
+        self.in_quotes = False
+        self.eof = False
+
+    def read(self):
+        """Read and scan one more block; False at the end of the stream."""
+        block = self.src.read(_CSV_BLOCK_BYTES)
+        if not block:
+            self.eof = True
+            return False
+        a = np.frombuffer(block, dtype=np.uint8)
+        quotes = np.flatnonzero(a == ord('"'))
+        newlines = np.flatnonzero(a == ord("\n"))
+        closed = (np.searchsorted(quotes, newlines) + self.in_quotes) % 2 == 0
+        self.ends = np.concatenate([self.ends, newlines[closed] + self.size + 1])
+        self.in_quotes = bool((len(quotes) + self.in_quotes) % 2)
+        self.blocks.append(block)
+        self.size += len(block)
+        return True
+
+    def fill(self, n):
+        """Read until `n` complete records are buffered or the stream ends."""
+        while len(self.ends) < n and self.read():
+            pass
+
+    def take(self, n):
+        """Bytes of the first `n` buffered records, or of everything left when fewer are complete."""
+        data = b"".join(self.blocks)
+        size = int(self.ends[n - 1]) if len(self.ends) >= n else len(data)
+        self.ends = self.ends[np.searchsorted(self.ends, size, side="right"):] - size
+        self.blocks = [data[size:]] if size < len(data) else []
+        self.size -= size
+        return data[:size]
+
+
+class TableReader:
+    """Iterate a file as DataFrames of at most `batch_rows` rows holding only the selected columns.
+
+    `fraction_done()` reports progress by rows for Parquet/Arrow and by
+    (compressed) bytes for CSV. `position()` after a batch is a small dict
+    that, passed as `start` to a new reader of the same file, continues with
+    the next row; rows before it are skipped without being parsed.
+    """
+
+    def __init__(self, path, columns=(), optional=(), batch_rows=10000, start=None, dtype=None):
+        self.path = path
+        self.format = table_format(path)
+        self.batch_rows = batch_rows
+        self.columns = _select(path, columns, optional)
+        self.start = start or {"row": 0, "offset": None}
+        self.rows_read = self.start["row"]
+        self.offset = self.start.get("offset")
+        # CSV only: e.g. str, so a column that is empty in one batch is not read as float there
+        self.dtype = dtype
+        self.num_rows = None
+        self._fh = None
+
+    def fraction_done(self):
+        if self.num_rows:
+            return self.rows_read / self.num_rows
+        if self._fh is not None and not self._fh.closed:
+            return self._fh.tell() / max(os.path.getsize(self.path), 1)
+        return 0.0
+
+    def position(self):
+        """Where the next batch starts: `{"row": rows before it, "offset": CSV byte offset or None}`."""
+        return {"row": self.rows_read, "offset": self.offset}
+
+    def __iter__(self):
+        for batch in self._batches():
+            self.rows_read += len(batch)
+            yield batch
+
+    def _batches(self):
+        skip = self.start["row"]
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            pf = pq.ParquetFile(self.path)
+            self.num_rows = pf.metadata.num_rows
+            groups = []
+            for i in range(pf.num_row_groups):
+                n = pf.metadata.row_group(i).num_rows
+                if skip >= n and not groups:
+                    # whole row groups before the start are never read
+                    skip -= n
+                else:
+                    groups.append(i)
+            if not groups:
+                return
+            for rb in pf.iter_batches(batch_size=self.batch_rows, columns=self.columns, row_groups=groups):
+                if skip:
+                    n = min(skip, rb.num_rows)
+                    rb, skip = rb.slice(n), skip - n
+                    if not rb.num_rows:
+                        continue
+                yield rb.to_pandas()
+        elif self.format == "arrow":
+            reader = _open_arrow(self.path)
+            batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+            self.num_rows = sum(rb.num_rows for rb in batches)
+            for rb in batches:
+                if skip >= rb.num_rows:
+                    skip -= rb.num_rows
+                    continue
+                rb = rb.select(self.columns).slice(skip)
+                skip = 0
+                for start in range(0, rb.num_rows, self.batch_rows):
+                    # zero-copy slice of the mapped file; only to_pandas materializes it
+                    yield rb.slice(start, self.batch_rows).to_pandas()
+        else:
+            compression = _compression(self.path)
+            if compression not in _OPENERS:
+                # no seekable reader for this codec: skip rows in the parser without building frames
+                self.offset = None
+                yield from pd.read_csv(self.path, chunksize=self.batch_rows, usecols=self.columns, dtype=self.dtype,
+                                       compression=compression, skiprows=range(1, skip + 1) if skip else None)
+                return
+            with open(self.path, "rb") as fh:
+                self._fh = fh
+                src = fh if compression is None else _OPENERS[compression](fh)
+                yield from self._csv_batches(src, skip)
+
+    def _csv_batches(self, src, skip):
+        records = _RecordSplitter(src)
+        records.fill(1)
+        header = records.take(1)
+        # batches are parsed without the header line so their bytes are not copied again
+        names = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+        if self.offset is not None:
+            # continue from a saved position (a compressed stream is decompressed up to it, not parsed)
+            src.seek(self.offset)
+            records = _RecordSplitter(src)
+        else:
+            self.offset = len(header)
+            if skip:
+                # a start given by row count only: skip whole records by their byte length
+                records.fill(skip)
+                self.offset += len(records.take(skip))
+        while True:
+            records.fill(self.batch_rows)
+            chunk = records.take(self.batch_rows)
+            if not chunk:
+                return
+            self.offset += len(chunk)
+            if not chunk.isspace():
+                df = pd.read_csv(io.BytesIO(chunk), header=None, names=names, usecols=self.columns, dtype=self.dtype)
+                if len(df):
+                    yield df
+
+
+class TableWriter:
+    """Append DataFrames to a CSV (compressed by extension), Parquet or Arrow IPC file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = table_format(path)
+        if self.format != "csv":
+            _require_pyarrow(self.format)
+        elif _compression(path) not in _OPENERS:
+            raise ValueError(f"Cannot write {_compression(path)}-compressed CSV; use .gz, .bz2 or .xz")
+        self._writer = None
+        self._schema = None
+        self._fh = None
+
+    def write(self, df):
+        if self.format == "csv":
+            header = self._fh is None
+            if header:
+                self._fh = _OPENERS[_compression(self.path)](self.path, "wb")
+            self._fh.write(df.to_csv(index=False, header=header).encode("utf-8"))
+            return
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            # a column with no values in the first batch has no type yet; store it as string
+            self._schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                                      for f in table.schema], metadata=table.schema.metadata)
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+        # later batches may infer e.g. null where the first had string; keep the file's schema. Columns whose
+        # type depends on the values (CSV input) must be read with one dtype, see TableReader(dtype=...)
+        self._writer.write_table(table.cast(self._schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._fh is not None:
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,85 @@
+"""Collapse duplicate training messages into unique texts with counts.
+
+`data/large_emails.csv` is generated from a handful of subject/body
+templates, and real spam corpora are dominated by repeated campaign
+messages. `collapse_duplicates` keeps one row per (cleaned text, label) and
+the number of raw rows it stands for, so tokenization, vectorization and
+every CV fit run once per distinct message. The counts are passed to the
+classifiers as `sample_weight` (see `fit_params`); for Naive Bayes this
+gives exactly the class and feature counts of the raw rows. The vectorizer's
+document frequencies (idf, `min_df`/`max_df`) and chi2 feature selection
+count each distinct message once.
+
+Each cleaned text is also a CV group: `group_folds` and `holdout_split`
+keep all copies of a message, including copies labelled differently, on the
+same side of every split, so no message is scored by a model that was
+trained on its copy.
+"""
+
+import numpy as np
+from sklearn.model_selection import StratifiedGroupKFold, StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+
+
+def collapse_duplicates(texts, labels, key=None):
+    """Unique `(texts, labels, counts, groups)` of a labelled corpus.
+
+    Rows whose `key(text)` (default: `src.preprocess.simple_clean`) and
+    label are equal become one row holding the first of their raw texts;
+    `counts` is how many rows it replaces and `groups` numbers the distinct
+    keys. Order follows first occurrence.
+    """
+    if key is None:
+        from src.preprocess import simple_clean as key
+    rows = {}
+    keys = {}
+    out_texts, out_labels, counts, groups = [], [], [], []
+    for text, label in zip(texts, labels):
+        k = key(text)
+        i = rows.get((k, label))
+        if i is None:
+            rows[(k, label)] = len(out_texts)
+            out_texts.append(text)
+            out_labels.append(label)
+            counts.append(1)
+            groups.append(keys.setdefault(k, len(keys)))
+        else:
+            counts[i] += 1
+    return out_texts, out_labels, np.asarray(counts, dtype=np.int64), np.asarray(groups, dtype=np.int64)
+
+
+def describe_collapse(counts) -> str:
+    n_rows = int(np.sum(counts))
+    return (f"duplicates: {n_rows} rows collapsed into {len(counts)} unique messages "
+            f"({1 - len(counts) / max(n_rows, 1):.0%} fewer, most repeated x{int(np.max(counts, initial=0))})")
+
+
+def group_folds(y, groups=None, cv=3):
+    """`[(train_idx, test_idx), ...]` of `StratifiedKFold(cv)`, or of `StratifiedGroupKFold(cv)` when `groups` is given."""
+    y = np.asarray(y)
+    if groups is None:
+        return list(StratifiedKFold(n_splits=cv).split(np.zeros(len(y)), y))
+    return list(StratifiedGroupKFold(n_splits=cv).split(np.zeros(len(y)), y, groups))
+
+
+def holdout_split(y, groups=None, test_size=0.2, random_state=42):
+    """`(train_idx, test_idx)` of a stratified holdout split that keeps each group on one side.
+
+    Without `groups` this is `train_test_split(..., stratify=y)` on row
+    indices, so scripts pick the same rows as before.
+    """
+    y = np.asarray(y)
+    idx = np.arange(len(y))
+    if groups is None:
+        return train_test_split(idx, test_size=test_size, random_state=random_state, stratify=y)
+    splitter = StratifiedGroupKFold(n_splits=max(2, int(round(1 / test_size))), shuffle=True, random_state=random_state)
+    return next(splitter.split(idx, y, groups))
+
+
+def fit_params(estimator, sample_weight):
+    """Keyword arguments that pass `sample_weight` to the classifier of `estimator` (a Pipeline's last step)."""
+    if sample_weight is None:
+        return {}
+    if isinstance(estimator, Pipeline):
+        return {f"{estimator.steps[-1][0]}__sample_weight": sample_weight}
+    return {"sample_weight": sample_weight}
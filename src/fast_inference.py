@@ -0,0 +1,331 @@
+"""sklearn-free scoring of saved TF-IDF + Naive Bayes / linear pipelines.
+
+`from_model` pulls the fitted state out of a saved model, the same way
+`archive/backend/scripts/export_model_json.py` does: vocabulary, idf and
+TF-IDF options from the vectorizer, the support mask of a feature
+selection step, `feature_log_prob_`/`class_log_prior_` (NB) or
+`coef_`/`intercept_` (logistic regression), and sigmoid/isotonic
+calibrators from `CalibratedClassifierCV`. `FastTextModel` then scores texts
+with plain NumPy: tokens are looked up in a sorted term array with
+`np.searchsorted`, TF-IDF weighting and normalization are applied to flat
+arrays, and class scores are accumulated with `np.bincount`.
+
+Supported pipelines are the ones this repo trains: `TfidfVectorizer`
+(including `BatchTfidfVectorizer`) or `CountVectorizer` + `TfidfTransformer`,
+an optional feature selector, and `MultinomialNB`, `ComplementNB` or
+`LogisticRegression`, optionally wrapped in `CalibratedClassifierCV`.
+`from_model` raises `ValueError` for anything else (e.g. hashing pipelines),
+so callers can fall back to the sklearn model.
+"""
+
+import re
+
+import numpy as np
+from joblib import load
+
+_DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+class WordAnalyzer:
+    """Re-implementation of sklearn's word analyzer (preprocess, tokenize, stop words, n-grams)."""
+
+    def __init__(self, preprocessor=None, tokenizer=None, token_pattern=_DEFAULT_TOKEN_PATTERN, lowercase=True,
+                 stop_words=None, ngram_range=(1, 1)):
+        self.preprocessor = preprocessor
+        self.tokenizer = tokenizer
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.stop_words = frozenset(stop_words) if stop_words else None
+        self.ngram_range = tuple(ngram_range)
+        self._pattern = re.compile(token_pattern) if tokenizer is None else None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pattern"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.tokenizer is None:
+            self._pattern = re.compile(self.token_pattern)
+
+    def __call__(self, doc):
+        if isinstance(doc, list):
+            # already tokenized (see src.vectorizers.BatchTfidfVectorizer)
+            tokens = doc
+        else:
+            if self.preprocessor is not None:
+                doc = self.preprocessor(doc)
+            elif self.lowercase:
+                doc = doc.lower()
+            if self.tokenizer is not None:
+                tokens = self.tokenizer(doc)
+            else:
+                tokens = self._pattern.findall(doc)
+        if self.stop_words is not None:
+            tokens = [w for w in tokens if w not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        out = list(tokens) if min_n == 1 else []
+        n_tokens = len(tokens)
+        for n in range(max(min_n, 2), min(max_n + 1, n_tokens + 1)):
+            for i in range(n_tokens - n + 1):
+                out.append(" ".join(tokens[i:i + n]))
+        return out
+
+
+def sorted_terms(vocabulary):
+    """Sorted term array (bytes when the vocabulary is ASCII) and the column of each term."""
+    terms = list(vocabulary)
+    try:
+        arr = np.array(terms, dtype="S")
+        if any(len(t) != len(b) for t, b in zip(terms, arr)):
+            raise UnicodeEncodeError("ascii", "", 0, 1, "non-ascii term")
+    except UnicodeEncodeError:
+        arr = np.array(terms, dtype="U")
+    order = np.argsort(arr, kind="stable")
+    cols = np.array([vocabulary[t] for t in terms], dtype=np.int32)[order]
+    return arr[order], cols
+
+
+def lookup(terms, term_cols, tokens):
+    """Column index of every token, or -1 for tokens outside the vocabulary.
+
+    `term_cols` maps sorted positions to columns; pass None when the
+    feature arrays are already in sorted-term order (see `src.model_artifact`).
+    """
+    if not tokens:
+        return np.zeros(0, dtype=np.int64)
+    if terms.dtype.kind == "S":
+        try:
+            query = np.array(tokens, dtype="S")
+        except UnicodeEncodeError:
+            # a non-ASCII token cannot match an ASCII vocabulary
+            query = np.array([t if t.isascii() else "\x00" for t in tokens], dtype="S")
+    else:
+        query = np.array(tokens, dtype="U")
+    pos = np.searchsorted(terms, query)
+    pos = np.minimum(pos, len(terms) - 1)
+    found = terms[pos] == query
+    return np.where(found, pos if term_cols is None else term_cols[pos], -1)
+
+
+class FastTextModel:
+    """TF-IDF features + a linear scorer (NB joint log-likelihood or logistic decision).
+
+    `weights` may be int8-quantized (see `src.compression`); each class column
+    then dequantizes as `weights * weight_scale + weight_offset`.
+    """
+
+    def __init__(self, analyzer, terms, term_cols, idf, weights, bias, classes, kind, sublinear_tf=False,
+                 binary=False, norm="l2", calibrators=None, weight_scale=None, weight_offset=None):
+        self.analyzer = analyzer
+        self.terms = terms
+        self.term_cols = term_cols
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.classes_ = np.asarray(classes)
+        self.kind = kind
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+        self.norm = norm
+        self.calibrators = calibrators
+        self.weight_scale = weight_scale
+        self.weight_offset = weight_offset
+
+    @property
+    def n_features(self):
+        return self.weights.shape[0]
+
+    def features(self, texts):
+        """Sparse TF-IDF rows as flat `(doc_index, column, value)` arrays."""
+        doc_tokens = [self.analyzer(t) for t in texts]
+        lengths = np.fromiter((len(t) for t in doc_tokens), dtype=np.int64, count=len(doc_tokens))
+        cols = lookup(self.terms, self.term_cols, [tok for toks in doc_tokens for tok in toks])
+        docs = np.repeat(np.arange(len(doc_tokens), dtype=np.int64), lengths)
+        keep = cols >= 0
+        keys, tf = np.unique(docs[keep] * self.n_features + cols[keep], return_counts=True)
+        docs, cols = np.divmod(keys, self.n_features)
+        vals = tf.astype(np.float64)
+        if self.binary:
+            vals[:] = 1.0
+        if self.sublinear_tf:
+            vals = np.log(vals) + 1.0
+        if self.idf is not None:
+            vals = vals * self.idf[cols]
+        if self.norm == "l2":
+            norms = np.sqrt(np.bincount(docs, weights=vals * vals, minlength=len(doc_tokens)))
+            vals = vals / norms[docs]
+        elif self.norm == "l1":
+            norms = np.bincount(docs, weights=np.abs(vals), minlength=len(doc_tokens))
+            vals = vals / norms[docs]
+        return docs, cols, vals, len(doc_tokens)
+
+    def decision_scores(self, texts):
+        """NB joint log-likelihood or linear decision values, shape (n_texts, n_outputs)."""
+        docs, cols, vals, n = self.features(texts)
+        out = np.empty((n, self.weights.shape[1]))
+        for j in range(self.weights.shape[1]):
+            w = self.weights[cols, j]
+            if self.weight_scale is not None:
+                w = w * self.weight_scale[j] + self.weight_offset[j]
+            out[:, j] = np.bincount(docs, weights=vals * w, minlength=n)
+        return out + self.bias
+
+    def _uncalibrated_proba(self, scores):
+        if self.kind == "nb":
+            scores = scores - scores.max(axis=1, keepdims=True)
+            p = np.exp(scores)
+            return p / p.sum(axis=1, keepdims=True)
+        if scores.shape[1] == 1:
+            pos = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - pos, pos])
+        scores = scores - scores.max(axis=1, keepdims=True)
+        p = np.exp(scores)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts):
+        scores = self.decision_scores(texts)
+        if not self.calibrators:
+            return self._uncalibrated_proba(scores)
+        # binary calibration of the positive-class response, averaged over CV members
+        if self.kind == "nb":
+            response = self._uncalibrated_proba(scores)[:, 1]
+        else:
+            response = scores[:, 0]
+        pos = np.mean([_calibrate(c, response) for c in self.calibrators], axis=0)
+        pos = np.where((pos > 1.0) & (pos <= 1.0 + 1e-5), 1.0, pos)
+        return np.column_stack([1.0 - pos, pos])
+
+    def predict(self, texts):
+        return self.classes_[np.argmax(self.predict_proba(texts), axis=1)]
+
+
+def _calibrate(calibrator, response):
+    method, params = calibrator
+    if method == "sigmoid":
+        a, b = params
+        return 1.0 / (1.0 + np.exp(a * response + b))
+    x, y = params
+    return np.interp(np.clip(response, x[0], x[-1]), x, y)
+
+
+def _unwrap(model):
+    # SpamClassifier / AdvancedSpamClassifier wrappers and FrozenEstimator
+    while True:
+        if hasattr(model, "pipeline") and not hasattr(model, "steps"):
+            model = model.pipeline
+        elif type(model).__name__ == "FrozenEstimator":
+            model = model.estimator
+        else:
+            return model
+
+
+def _calibrator_spec(cal):
+    name = type(cal).__name__
+    if name == "_SigmoidCalibration":
+        return "sigmoid", (float(cal.a_), float(cal.b_))
+    if name == "IsotonicRegression":
+        return "isotonic", (np.asarray(cal.X_thresholds_, dtype=np.float64), np.asarray(cal.y_thresholds_, dtype=np.float64))
+    raise ValueError(f"unsupported calibrator: {name}")
+
+
+def _from_pipeline(pipeline):
+    steps = [step for _, step in pipeline.steps if step is not None and step != "passthrough"]
+    if len(steps) < 2:
+        raise ValueError("expected a vectorizer and a classifier")
+    vect, *middle, clf = steps
+
+    if not hasattr(vect, "vocabulary_"):
+        raise ValueError(f"unsupported vectorizer without a vocabulary: {type(vect).__name__}")
+    if vect.analyzer != "word" or vect.strip_accents is not None:
+        raise ValueError("only word analyzers without strip_accents are supported")
+    tfidf = vect if hasattr(vect, "_tfidf") else None
+    transformer = None
+    selector = None
+    for step in middle:
+        if hasattr(step, "idf_") or type(step).__name__ == "TfidfTransformer":
+            transformer = step
+        elif hasattr(step, "get_support"):
+            selector = step
+        elif hasattr(getattr(step, "selector_", None), "get_support"):
+            # train_advanced.SelectKBestSafe
+            selector = step.selector_
+        else:
+            raise ValueError(f"unsupported pipeline step: {type(step).__name__}")
+    tf_source = tfidf if tfidf is not None else transformer
+
+    analyzer = WordAnalyzer(
+        preprocessor=vect.preprocessor,
+        tokenizer=vect.tokenizer,
+        token_pattern=vect.token_pattern,
+        lowercase=vect.lowercase,
+        stop_words=vect.get_stop_words(),
+        ngram_range=vect.ngram_range,
+    )
+    terms, term_cols = sorted_terms(vect.vocabulary_)
+    n_features = len(vect.vocabulary_)
+
+    if tf_source is not None:
+        idf = np.asarray(tf_source.idf_, dtype=np.float64) if tf_source.use_idf else None
+        sublinear_tf, norm = tf_source.sublinear_tf, tf_source.norm
+    else:
+        idf, sublinear_tf, norm = None, False, None
+
+    name = type(clf).__name__
+    if name in ("MultinomialNB", "ComplementNB"):
+        coef = np.asarray(clf.feature_log_prob_, dtype=np.float64).T
+        bias = np.zeros(coef.shape[1])
+        if name == "MultinomialNB" or len(clf.classes_) == 1:
+            bias = np.asarray(clf.class_log_prior_, dtype=np.float64)
+        kind = "nb"
+    elif hasattr(clf, "coef_") and hasattr(clf, "intercept_") and hasattr(clf, "predict_proba"):
+        coef = np.asarray(clf.coef_, dtype=np.float64).T
+        bias = np.asarray(clf.intercept_, dtype=np.float64)
+        kind = "linear"
+    else:
+        raise ValueError(f"unsupported classifier: {name}")
+
+    if selector is not None:
+        support = selector.get_support(indices=True)
+        full = np.zeros((n_features, coef.shape[1]))
+        full[support] = coef
+        coef = full
+    if coef.shape[0] != n_features:
+        raise ValueError("classifier and vectorizer feature counts differ")
+
+    return FastTextModel(analyzer, terms, term_cols, idf, coef, bias, clf.classes_, kind,
+                         sublinear_tf=sublinear_tf, binary=vect.binary, norm=norm)
+
+
+def from_model(model):
+    """Build a `FastTextModel` from a fitted pipeline, calibrated pipeline or classifier wrapper."""
+    model = _unwrap(model)
+    if type(model).__name__ == "CalibratedClassifierCV":
+        members = model.calibrated_classifiers_
+        if len(model.classes_) != 2:
+            raise ValueError("only binary calibrated models are supported")
+        bases = [_unwrap(m.estimator) for m in members]
+        if any(b is not bases[0] for b in bases):
+            raise ValueError("calibrated models with per-fold estimators are not supported")
+        fast = _from_pipeline(bases[0])
+        fast.calibrators = [_calibrator_spec(m.calibrators[0]) for m in members]
+        fast.classes_ = np.asarray(model.classes_)
+        return fast
+    if not hasattr(model, "steps"):
+        raise ValueError(f"unsupported model type: {type(model).__name__}")
+    return _from_pipeline(model)
+
+
+def load_fast(path):
+    """Load a binary artifact (`src.model_artifact`) or a joblib model and convert it.
+
+    Raises `ValueError` if a joblib model cannot be converted.
+    """
+    from src.model_artifact import is_artifact, load_artifact
+
+    if is_artifact(path):
+        return load_artifact(path)
+    return from_model(load(path))
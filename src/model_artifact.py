@@ -0,0 +1,194 @@
+"""Versioned single-file binary format for `FastTextModel`.
+
+Layout:
+
+    8 bytes   magic b"SPAMNB\\x00\\x00"
+    4 bytes   format version (little-endian uint32)
+    4 bytes   header length (little-endian uint32)
+    header    UTF-8 JSON: model options, analyzer config and an array table
+              of {name: {dtype, shape, offset}}
+    arrays    contiguous, 64-byte aligned, little-endian
+
+The vocabulary is stored as a sorted fixed-width byte (or UTF-32) array so
+lookups are a `np.searchsorted` directly on the mapped file, and idf and
+class weights are stored as float32 rows in that same sorted order, so a
+term's position is its feature column. Weights and idf quantized by
+`src.compression` keep their float16 dtype; int8 weights add per-class
+`weight_scale`/`weight_offset` arrays and are written as format version 2
+(other artifacts stay version 1, so older readers still load them).
+`load_artifact` maps every array with `np.memmap`; nothing is read until it
+is scored, and processes loading the same file share its pages through the
+OS page cache.
+
+Preprocessor and tokenizer callables are stored as `module:qualname`
+references and imported on load, so they must be module-level functions
+(e.g. `src.nb_classifier_adv.simple_clean`).
+"""
+
+import importlib
+import json
+import struct
+
+import numpy as np
+
+from src.fast_inference import FastTextModel, WordAnalyzer, from_model
+
+MAGIC = b"SPAMNB\x00\x00"
+FORMAT_VERSION = 2
+_ALIGN = 64
+_PREFIX = struct.Struct("<8sII")
+
+
+def _func_ref(func):
+    if func is None:
+        return None
+    module, name = getattr(func, "__module__", None), getattr(func, "__qualname__", "")
+    if not module or module == "__main__" or "<" in name:
+        raise ValueError(f"cannot store a reference to {func!r}; use a module-level function")
+    return f"{module}:{name}"
+
+
+def _resolve(ref):
+    if ref is None:
+        return None
+    module, name = ref.split(":")
+    obj = importlib.import_module(module)
+    for part in name.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _le(arr):
+    arr = np.ascontiguousarray(arr)
+    if arr.dtype.byteorder == ">" or (arr.dtype.byteorder == "=" and not np.little_endian):
+        arr = arr.astype(arr.dtype.newbyteorder("<"))
+    return arr
+
+
+def save_artifact(model, path):
+    """Write a `FastTextModel` (or anything `from_model` accepts) to `path`."""
+    if not isinstance(model, FastTextModel):
+        model = from_model(model)
+    an = model.analyzer
+    # reorder per-feature arrays into sorted-term order so positions are columns
+    cols = np.arange(len(model.terms)) if model.term_cols is None else np.asarray(model.term_cols)
+    arrays = {
+        "terms": np.asarray(model.terms),
+        "weights": np.asarray(model.weights, dtype=_stored_dtype(model.weights))[cols],
+        "bias": np.asarray(model.bias, dtype=np.float64),
+    }
+    if model.idf is not None:
+        arrays["idf"] = np.asarray(model.idf, dtype=_stored_dtype(model.idf))[cols]
+    if model.weight_scale is not None:
+        arrays["weight_scale"] = np.asarray(model.weight_scale, dtype=np.float64)
+        arrays["weight_offset"] = np.asarray(model.weight_offset, dtype=np.float64)
+    calibrators = []
+    for i, (method, params) in enumerate(model.calibrators or []):
+        if method == "sigmoid":
+            calibrators.append({"method": method, "a": params[0], "b": params[1]})
+        else:
+            arrays[f"cal{i}_x"] = params[0]
+            arrays[f"cal{i}_y"] = params[1]
+            calibrators.append({"method": method})
+
+    header = {
+        "kind": model.kind,
+        "classes": np.asarray(model.classes_).tolist(),
+        "sublinear_tf": bool(model.sublinear_tf),
+        "binary": bool(model.binary),
+        "norm": model.norm,
+        "calibrators": calibrators,
+        "analyzer": {
+            "preprocessor": _func_ref(an.preprocessor),
+            "tokenizer": _func_ref(an.tokenizer),
+            "token_pattern": an.token_pattern,
+            "lowercase": an.lowercase,
+            "stop_words": sorted(an.stop_words) if an.stop_words else None,
+            "ngram_range": list(an.ngram_range),
+        },
+        "arrays": {},
+    }
+
+    # array offsets are relative to the end of the (padded) header
+    layout = []
+    offset = 0
+    for name, arr in arrays.items():
+        arr = _le(arr)
+        offset = -(-offset // _ALIGN) * _ALIGN
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        layout.append((offset, arr))
+        offset += arr.nbytes
+    blob = json.dumps(header).encode("utf-8")
+    data_start = -(-(_PREFIX.size + len(blob)) // _ALIGN) * _ALIGN
+    blob = blob.ljust(data_start - _PREFIX.size)
+
+    version = 2 if model.weight_scale is not None else 1
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, version, len(blob)))
+        f.write(blob)
+        for rel, arr in layout:
+            f.seek(data_start + rel)
+            f.write(arr.tobytes())
+    return header
+
+
+def _stored_dtype(arr):
+    # quantized arrays keep their dtype; everything else is stored as float32
+    return arr.dtype if arr.dtype in (np.float16, np.int8) else np.float32
+
+
+def is_artifact(path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path) -> dict:
+    with open(path, "rb") as f:
+        magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model artifact")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}; this code reads up to {FORMAT_VERSION}")
+        header = json.loads(f.read(length).decode("utf-8"))
+    header["version"] = version
+    header["data_start"] = _PREFIX.size + length
+    return header
+
+
+def load_artifact(path) -> FastTextModel:
+    """Memory-map an artifact written by `save_artifact`."""
+    header = read_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            continue
+        arrays[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r",
+                                 offset=header["data_start"] + spec["offset"], shape=shape)
+
+    cfg = header["analyzer"]
+    analyzer = WordAnalyzer(
+        preprocessor=_resolve(cfg["preprocessor"]),
+        tokenizer=_resolve(cfg["tokenizer"]),
+        token_pattern=cfg["token_pattern"],
+        lowercase=cfg["lowercase"],
+        stop_words=cfg["stop_words"],
+        ngram_range=tuple(cfg["ngram_range"]),
+    )
+    calibrators = []
+    for i, cal in enumerate(header["calibrators"]):
+        if cal["method"] == "sigmoid":
+            calibrators.append(("sigmoid", (cal["a"], cal["b"])))
+        else:
+            calibrators.append(("isotonic", (np.asarray(arrays[f"cal{i}_x"]), np.asarray(arrays[f"cal{i}_y"]))))
+    return FastTextModel(
+        analyzer, arrays["terms"], None, arrays.get("idf"), arrays["weights"], np.asarray(arrays["bias"]),
+        header["classes"], header["kind"], sublinear_tf=header["sublinear_tf"], binary=header["binary"],
+        norm=header["norm"], calibrators=calibrators or None,
+        weight_scale=_array_or_none(arrays, "weight_scale"), weight_offset=_array_or_none(arrays, "weight_offset"),
+    )
+
+
+def _array_or_none(arrays, name):
+    return np.asarray(arrays[name]) if name in arrays else None
@@ -0,0 +1,201 @@
+"""Closed-form cross-validation of the Naive Bayes smoothing parameter.
+
+A fitted `MultinomialNB`/`ComplementNB` is just per-class feature counts
+plus `alpha`, so the counts of each CV fold are accumulated once and
+`feature_log_prob_` is derived for every alpha analytically, using the same
+formulas as scikit-learn. The held-out rows are then scored against all
+alphas with a single sparse x dense product. Rows can carry a
+`sample_weight` (e.g. duplicate counts from `src.dedup`), which weights both
+the counts and the F1.
+"""
+
+import numpy as np
+from scipy.stats import rankdata
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid
+from sklearn.naive_bayes import ComplementNB, MultinomialNB
+from sklearn.pipeline import Pipeline
+from sklearn.utils import _safe_indexing
+
+from src.dedup import fit_params, group_folds
+
+_ALPHA_MIN = 1e-10
+
+
+def is_nb(est) -> bool:
+    return type(est) in (MultinomialNB, ComplementNB)
+
+
+def _effective_alphas(clf, alphas):
+    alphas = np.asarray(alphas, dtype=np.float64)
+    if not getattr(clf, "force_alpha", True):
+        alphas = np.maximum(alphas, _ALPHA_MIN)
+    return alphas
+
+
+def fold_counts(X, y, classes, sample_weight=None):
+    """Per-class feature counts and class counts, as accumulated by `fit`."""
+    Y = (np.asarray(y)[:, None] == classes[None, :]).astype(np.float64)
+    if sample_weight is not None:
+        Y *= np.asarray(sample_weight, dtype=np.float64)[:, None]
+    return np.asarray((X.T @ Y).T), Y.sum(axis=0)
+
+
+def feature_log_probs(clf, feature_count, alphas):
+    """`feature_log_prob_` of `clf` for every alpha, shape (n_alphas, n_classes, n_features)."""
+    a = _effective_alphas(clf, alphas)[:, None, None]
+    if isinstance(clf, ComplementNB):
+        comp_count = feature_count.sum(axis=0)[None, None, :] + a - feature_count[None]
+        logged = np.log(comp_count / comp_count.sum(axis=2, keepdims=True))
+        if clf.norm:
+            return logged / logged.sum(axis=2, keepdims=True)
+        return -logged
+    smoothed = feature_count[None] + a
+    return np.log(smoothed) - np.log(smoothed.sum(axis=2, keepdims=True))
+
+
+def class_log_prior(clf, class_count):
+    n_classes = len(class_count)
+    if clf.class_prior is not None:
+        return np.log(np.asarray(clf.class_prior, dtype=np.float64))
+    if clf.fit_prior:
+        return np.log(class_count) - np.log(class_count.sum())
+    return np.full(n_classes, -np.log(n_classes))
+
+
+def macro_f1(y_true, preds, sample_weight=None):
+    """`f1_score(average="macro")` of `y_true` against each column of `preds`."""
+    labels = np.unique(np.concatenate([np.unique(y_true), np.unique(preds)]))
+    y_true = np.asarray(y_true)[:, None]
+    w = np.ones((len(y_true), 1)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)[:, None]
+    totals = np.zeros(preds.shape[1])
+    n_labels = np.zeros(preds.shape[1])
+    for label in labels:
+        t = y_true == label
+        p = preds == label
+        tp = ((t & p) * w).sum(axis=0)
+        denom = (t * w).sum(axis=0) + (p * w).sum(axis=0)
+        present = denom > 0
+        totals += np.where(present, 2 * tp / np.where(present, denom, 1), 0.0)
+        n_labels += present
+    return totals / np.maximum(n_labels, 1)
+
+
+def alpha_fold_scores(clf, alphas, Xtr, ytr, Xte, yte, wtr=None, wte=None):
+    """Macro-F1 on (Xte, yte) of `clf` fitted on (Xtr, ytr), for every alpha at once; `wtr`/`wte` weight the rows."""
+    classes = np.unique(ytr)
+    feature_count, class_count = fold_counts(Xtr, ytr, classes, wtr)
+    flp = feature_log_probs(clf, feature_count, alphas)
+    n_alphas, n_classes, n_features = flp.shape
+    W = flp.transpose(2, 0, 1).reshape(n_features, n_alphas * n_classes)
+    jll = np.asarray(Xte @ W).reshape(Xte.shape[0], n_alphas, n_classes)
+    if not isinstance(clf, ComplementNB) or n_classes == 1:
+        jll = jll + class_log_prior(clf, class_count)[None, None, :]
+    preds = classes[np.argmax(jll, axis=2)]
+    return macro_f1(yte, preds, wte)
+
+
+def sweep_head(head, alphas, Xtr, ytr, Xte, yte, wtr=None, wte=None):
+    """Fit the steps of `head` before its NB classifier once, then score every alpha."""
+    if isinstance(head, Pipeline):
+        if len(head.steps) > 1:
+            prefix = clone(Pipeline(head.steps[:-1]))
+            Xtr = prefix.fit_transform(Xtr, ytr)
+            Xte = prefix.transform(Xte)
+        clf = head.steps[-1][1]
+    else:
+        clf = head
+    return alpha_fold_scores(clf, alphas, Xtr, ytr, Xte, yte, wtr, wte)
+
+
+def alpha_only_grid(head, param_grid):
+    """Return the alpha values if `param_grid` only varies the NB smoothing of `head`, else None."""
+    if isinstance(head, Pipeline):
+        name, clf = head.steps[-1]
+        key = f"{name}__alpha"
+    else:
+        clf, key = head, "alpha"
+    if not is_nb(clf) or not isinstance(param_grid, dict) or set(param_grid) != {key}:
+        return None
+    return list(param_grid[key])
+
+
+class NBAlphaSearchCV:
+    """Drop-in for `GridSearchCV(scoring="f1_macro")` over a Pipeline ending in MultinomialNB/ComplementNB.
+
+    Every non-alpha parameter setting is fitted once per fold; all alpha
+    values for it are scored in closed form. Folds, candidate order and
+    tie-breaking follow `GridSearchCV`, so `best_params_` is the same. Exposes
+    `best_params_`, `best_score_`, `best_index_`, `best_estimator_`,
+    `n_splits_` and a `cv_results_` with `params`, `mean_test_score`,
+    `std_test_score` and `rank_test_score`.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+
+    @staticmethod
+    def supports(estimator, param_grid) -> bool:
+        if not isinstance(estimator, Pipeline) or not is_nb(estimator.steps[-1][1]):
+            return False
+        key = f"{estimator.steps[-1][0]}__alpha"
+        grids = [param_grid] if isinstance(param_grid, dict) else list(param_grid)
+        return all(key in g for g in grids)
+
+    def fit(self, X, y, groups=None, sample_weight=None):
+        """`groups` keeps each group within one fold; `sample_weight` weights the NB counts and the F1."""
+        y = np.asarray(y)
+        w = None if sample_weight is None else np.asarray(sample_weight)
+        name = self.estimator.steps[-1][0]
+        key = f"{name}__alpha"
+        folds = group_folds(y, groups, self.cv)
+        grids = [self.param_grid] if isinstance(self.param_grid, dict) else list(self.param_grid)
+
+        fold_scores = {}
+        for grid in grids:
+            alphas = list(grid[key])
+            rest = {k: v for k, v in grid.items() if k != key}
+            for params in ParameterGrid(rest):
+                est = clone(self.estimator).set_params(**params)
+                prefix = Pipeline(est.steps[:-1])
+                clf = est.steps[-1][1]
+                per_fold = []
+                for train_idx, test_idx in folds:
+                    p = clone(prefix)
+                    # positional rows for lists, arrays, matrices and pandas objects alike, as GridSearchCV does
+                    Xtr = p.fit_transform(_safe_indexing(X, train_idx), y[train_idx])
+                    Xte = p.transform(_safe_indexing(X, test_idx))
+                    wtr, wte = (None, None) if w is None else (w[train_idx], w[test_idx])
+                    per_fold.append(alpha_fold_scores(clf, alphas, Xtr, y[train_idx], Xte, y[test_idx], wtr, wte))
+                per_fold = np.array(per_fold)
+                for j, alpha in enumerate(alphas):
+                    fold_scores[_param_key({**params, key: alpha})] = per_fold[:, j]
+
+        all_params = list(ParameterGrid(self.param_grid))
+        scores = np.array([fold_scores[_param_key(p)] for p in all_params])
+        means = scores.mean(axis=1)
+        self.cv_results_ = {
+            "params": all_params,
+            "mean_test_score": means,
+            "std_test_score": scores.std(axis=1),
+            "rank_test_score": rankdata(-means, method="min").astype(np.int32),
+        }
+        self.n_splits_ = len(folds)
+        self.best_index_ = int(np.argmax(means))
+        self.best_params_ = all_params[self.best_index_]
+        self.best_score_ = float(means[self.best_index_])
+        best = clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_ = best.fit(X, y, **fit_params(best, w))
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+
+def _param_key(params):
+    return tuple(sorted((k, repr(v)) for k, v in params.items()))
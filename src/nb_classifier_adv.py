@@ -1,10 +1,14 @@
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.base import clone
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import GridSearchCV
 from joblib import dump, load
 
+from src.dedup import fit_params
+from src.search import fit_search, make_search
+from src.vectorizers import BatchHashingVectorizer, BatchTfidfVectorizer, OnlineTfidfTransformer, Preprocessed
+
 
 def simple_clean(text: str) -> str:
     text = text.lower()
@@ -17,50 +21,86 @@ def simple_clean(text: str) -> str:
 class AdvancedSpamClassifier:
     """Higher-quality pipeline for spam classification with tuning helpers."""
 
-    def __init__(self, use_hashing: bool = False, stop_words: str = "english", ngram_range=(1, 1), min_df: int = 3, max_df: float = 0.9, max_features: int = 50000, sublinear_tf: bool = True):
+    def __init__(self, use_hashing: bool = False, stop_words: str = "english", ngram_range=(1, 1), min_df: int = 3, max_df: float = 0.9, max_features: int = 50000, sublinear_tf: bool = True, n_jobs: int = 1, n_features: int = 2 ** 18):
         """Create a pipeline with safer defaults to reduce overfitting.
 
         Parameters intentionally favor simpler features (unigrams), stopword removal,
         and higher min_df to avoid memorizing rare tokens from synthetic data.
+        `n_jobs` is the number of processes used to clean text in batches.
+
+        `use_hashing` replaces the vocabulary with `n_features` hash buckets and
+        document frequencies counted online (`OnlineTfidfTransformer`), so memory
+        does not grow with the corpus and `partial_fit` works; `min_df`, `max_df`
+        and `max_features` need a vocabulary and are ignored.
         """
         if use_hashing:
-            vect = HashingVectorizer(decode_error="ignore", n_features=2 ** 18, alternate_sign=False)
-            # when hashing, no inverse transform; TfidfTransformer would be used separately if needed
+            vect = BatchHashingVectorizer(preprocessor=simple_clean, stop_words=stop_words, ngram_range=ngram_range, n_features=n_features, alternate_sign=False, norm=None, decode_error="ignore", n_jobs=n_jobs)
             self.pipeline = Pipeline([
                 ("vect", vect),
-                ("clf", MultinomialNB()),
+                ("tfidf", OnlineTfidfTransformer(sublinear_tf=sublinear_tf)),
+                # alpha is added to every bucket, most of them empty; at the vocabulary
+                # default of 1.0 that smoothing mass swamps the counts of the smaller class
+                ("clf", MultinomialNB(alpha=0.01)),
             ])
         else:
-            vect = TfidfVectorizer(preprocessor=simple_clean, stop_words=stop_words, ngram_range=ngram_range, max_df=max_df, min_df=min_df, max_features=max_features, sublinear_tf=sublinear_tf)
+            vect = BatchTfidfVectorizer(preprocessor=simple_clean, stop_words=stop_words, ngram_range=ngram_range, max_df=max_df, min_df=min_df, max_features=max_features, sublinear_tf=sublinear_tf, n_jobs=n_jobs)
             self.pipeline = Pipeline([
                 ("tfidf", vect),
                 ("clf", MultinomialNB()),
             ])
 
-    def train(self, texts, labels):
-        self.pipeline.fit(texts, labels)
+    def train(self, texts, labels, sample_weight=None):
+        """Fit the pipeline; `sample_weight` (e.g. duplicate counts from `src.dedup`) weights the classifier."""
+        self.pipeline.fit(texts, labels, **fit_params(self.pipeline, sample_weight))
 
-    def grid_search(self, texts, labels, param_grid=None, cv=3, n_jobs=1):
-        if param_grid is None:
+    def grid_search(self, texts, labels, param_grid=None, cv=3, n_jobs=1, search="grid", groups=None, sample_weight=None):
+        """Tune the pipeline; `search="halving"` uses successive halving instead of the full grid.
+
+        `groups` keeps each group (e.g. copies of one message) within one CV
+        fold and `sample_weight` weights the fits, as in `src.search.fit_search`.
+        """
+        if param_grid is None and "vect" in self.pipeline.named_steps:
+            param_grid = {
+                "vect__ngram_range": [(1, 1), (1, 2)],
+                "tfidf__sublinear_tf": [False, True],
+                "clf__alpha": [0.003, 0.01, 0.03, 0.1],
+            }
+        elif param_grid is None:
             param_grid = {
                 "tfidf__ngram_range": [(1, 1), (1, 2)],
                 "tfidf__max_df": [0.85, 0.95],
                 "clf__alpha": [0.1, 0.5, 1.0],
             }
-        gs = GridSearchCV(self.pipeline, param_grid=param_grid, cv=cv, n_jobs=n_jobs, scoring="f1_macro")
-        gs.fit(texts, labels)
+        gs = make_search(self.pipeline, param_grid, search=search, cv=cv, n_jobs=n_jobs)
+        gs = fit_search(gs, texts, labels, groups=groups, sample_weight=sample_weight)
         self.pipeline = gs.best_estimator_
         return gs
 
-    def partial_train(self, text_batches, label_batches, classes=None):
-        # For streaming training use HashingVectorizer + MultinomialNB with partial_fit
-        from sklearn.feature_extraction.text import HashingVectorizer
+    def partial_train(self, text_batches, label_batches, classes=None, warm_start=False, n_jobs=1, executor=None):
+        """Fit the hashing pipeline batch by batch with `partial_fit`.
 
-        hv = HashingVectorizer(decode_error="ignore", n_features=2 ** 18, alternate_sign=False)
-        clf = MultinomialNB()
-        first = True
+        Uses the pipeline from `use_hashing=True` (or the default hashing
+        pipeline if this classifier was built without it). With `warm_start`, a
+        pipeline from an earlier `partial_train` call (or a loaded checkpoint)
+        keeps learning instead of starting over. Each batch first updates the
+        document frequencies, so it is weighted with the idf of everything seen
+        so far. Texts are cleaned with `map_batch` over `n_jobs` processes or a
+        shared `executor`.
+        """
+        from src.preprocess import map_batch
+
+        hashing = hasattr(self, "pipeline") and isinstance(self.pipeline.named_steps.get("vect"), HashingVectorizer)
+        first = not (warm_start and hashing and hasattr(self.pipeline.named_steps["clf"], "classes_"))
+        if first:
+            self.pipeline = clone(self.pipeline) if hashing else AdvancedSpamClassifier(use_hashing=True).pipeline
+        vect, clf = self.pipeline.steps[0][1], self.pipeline.steps[-1][1]
         for texts, labels in zip(text_batches, label_batches):
-            X = hv.transform([simple_clean(t) for t in texts])
+            if vect.preprocessor is not None:
+                texts = [Preprocessed(t) for t in map_batch(vect.preprocessor, texts, n_jobs=n_jobs, executor=executor)]
+            X = vect.transform(texts)
+            for _, step in self.pipeline.steps[1:-1]:
+                step.partial_fit(X)
+                X = step.transform(X)
             if first:
                 if classes is None:
                     classes = list(set(labels))
@@ -68,7 +108,11 @@ class AdvancedSpamClassifier:
                 first = False
             else:
                 clf.partial_fit(X, labels)
-        self.pipeline = Pipeline([("vect", hv), ("clf", clf)])
+
+    def partial_fit(self, texts, labels, classes=None):
+        """Update a hashing model with one more batch; `classes` is needed on the first call."""
+        self.partial_train([texts], [labels], classes=classes, warm_start=True)
+        return self
 
     def predict(self, texts):
         return self.pipeline.predict(texts)
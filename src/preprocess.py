@@ -1,5 +1,8 @@
+import os
 import re
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Iterable, List
 import logging
 
 import nltk
@@ -28,6 +31,18 @@ _FALLBACK_STOPWORDS = {
     "it",
 }
 
+# Upper bound on distinct tokens memoized by the lemma cache; the real
+# vocabulary of our corpora is well below this, so evictions should be rare.
+LEMMA_CACHE_SIZE = 200_000
+
+# Default number of texts handed to a worker process at a time by the batch helpers
+BATCH_CHUNKSIZE = 1000
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\b[a-z0-9]+\b")
+
 
 def ensure_nltk():
     global _nltk_ready
@@ -57,26 +72,90 @@ def ensure_nltk():
     _nltk_ready = True
 
 
+def _load_stopwords() -> frozenset:
+    # Try to load NLTK stopwords; fall back to a small safe set if unavailable
+    try:
+        return frozenset(stopwords.words("english"))
+    except LookupError:
+        _log.warning("NLTK stopwords not found, using fallback stopword set")
+    except Exception:
+        _log.exception("Error loading NLTK stopwords, using fallback set")
+    return frozenset(_FALLBACK_STOPWORDS)
+
+
+class PreprocessContext:
+    """Lemmatizer, stopword set and token->lemma memo shared by every call in a process.
+
+    The memo is a bounded LRU cache; `WordNetLemmatizer.lemmatize` is a pure
+    function of the token, so memoizing it does not change the output.
+    Pickling keeps only the configuration and rebuilds the rest on load.
+    """
+
+    def __init__(self, cache_size: int = LEMMA_CACHE_SIZE):
+        ensure_nltk()
+        self.cache_size = cache_size
+        self.lemmatizer = WordNetLemmatizer()
+        self.stopwords = _load_stopwords()
+        self.lemmatize = lru_cache(maxsize=cache_size)(self.lemmatizer.lemmatize)
+
+    def lemmas(self, text: str) -> List[str]:
+        lemmatize = self.lemmatize
+        return [lemmatize(t) for t in simple_tokenize(simple_clean(text))]
+
+    def cache_stats(self) -> dict:
+        info = self.lemmatize.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            # every miss inserts one entry, so anything not resident was evicted
+            "evictions": info.misses - info.currsize,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+
+    def clear_cache(self):
+        self.lemmatize.cache_clear()
+
+    def __getstate__(self):
+        return {"cache_size": self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state["cache_size"])
+
+
+_context = None
+
+
+def get_context() -> PreprocessContext:
+    """Return the process-wide preprocessing context, creating it on first use."""
+    global _context
+    if _context is None:
+        _context = PreprocessContext()
+    return _context
+
+
+def lemma_cache_stats() -> dict:
+    return get_context().cache_stats()
+
+
 def simple_tokenize(text: str) -> List[str]:
     # lightweight tokenizer: split on word boundaries to avoid heavy NLTK tokenizers
-    return re.findall(r"\b[a-z0-9]+\b", text.lower())
+    return _TOKEN_RE.findall(text.lower())
 
 
 def simple_clean(text: str) -> str:
     # Lower, remove URLs and non-alphanumerics
     text = text.lower()
-    text = re.sub(r"https?://\S+|www\.\S+", "", text)
-    text = re.sub(r"[^a-z0-9\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = _URL_RE.sub("", text)
+    text = _NON_ALNUM_RE.sub(" ", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
     return text
 
 
 def lemmatize_text(text: str) -> str:
-    ensure_nltk()
-    lemmatizer = WordNetLemmatizer()
-    tokens = simple_tokenize(simple_clean(text))
-    lemmas = [lemmatizer.lemmatize(t) for t in tokens]
-    return " ".join(lemmas)
+    return " ".join(get_context().lemmas(text))
 
 
 def tokenize_and_lemmatize(text: str) -> List[str]:
@@ -85,18 +164,58 @@ def tokenize_and_lemmatize(text: str) -> List[str]:
     This is suitable to pass as `tokenizer` to sklearn vectorizers so that
     stopword removal happens consistently with the tokenization/lemmatization.
     """
-    ensure_nltk()
-    lemmatizer = WordNetLemmatizer()
-    # Try to load NLTK stopwords; fall back to a small safe set if unavailable
-    try:
-        sw = set(stopwords.words("english"))
-    except LookupError:
-        _log.warning("NLTK stopwords not found, using fallback stopword set")
-        sw = _FALLBACK_STOPWORDS
-    except Exception:
-        _log.exception("Error loading NLTK stopwords, using fallback set")
-        sw = _FALLBACK_STOPWORDS
+    ctx = get_context()
+    sw = ctx.stopwords
+    return [l for l in ctx.lemmas(text) if l not in sw]
+
+
+def _effective_n_jobs(n_jobs) -> int:
+    # same convention as sklearn/joblib: None -> 1, -1 -> all cores, -2 -> all but one
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    cpus = os.cpu_count() or 1
+    if n_jobs < 0:
+        return max(1, cpus + 1 + n_jobs)
+    return n_jobs
+
+
+def _map_chunk(func, chunk):
+    return [func(t) for t in chunk]
+
+
+def map_batch(func: Callable, texts: Iterable, n_jobs=1, chunksize: int = BATCH_CHUNKSIZE, executor=None) -> list:
+    """Apply `func` to every text, spreading chunks over a process pool.
+
+    Results come back in input order. Small inputs and `n_jobs=1` run inline,
+    so this is safe to call on the serving path; `func` must be picklable
+    (a module-level function) when more than one process is used. Pass an
+    `executor` to reuse one pool across many calls instead of starting a new
+    one per call.
+    """
+    texts = list(texts)
+    n_jobs = _effective_n_jobs(n_jobs)
+    if (n_jobs == 1 and executor is None) or len(texts) <= chunksize:
+        return [func(t) for t in texts]
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    out = []
+    if executor is not None:
+        for result in executor.map(partial(_map_chunk, func), chunks):
+            out.extend(result)
+        return out
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as ex:
+        for result in ex.map(partial(_map_chunk, func), chunks):
+            out.extend(result)
+    return out
+
+
+def clean_batch(texts: Iterable[str], n_jobs=1, chunksize: int = BATCH_CHUNKSIZE) -> List[str]:
+    return map_batch(simple_clean, texts, n_jobs=n_jobs, chunksize=chunksize)
+
+
+def lemmatize_batch(texts: Iterable[str], n_jobs=1, chunksize: int = BATCH_CHUNKSIZE) -> List[str]:
+    return map_batch(lemmatize_text, texts, n_jobs=n_jobs, chunksize=chunksize)
+
 
-    tokens = simple_tokenize(simple_clean(text))
-    lemmas = [lemmatizer.lemmatize(t) for t in tokens]
-    return [l for l in lemmas if l not in sw]
+def tokenize_batch(texts: Iterable[str], n_jobs=1, chunksize: int = BATCH_CHUNKSIZE, tokenizer: Callable = None) -> List[List[str]]:
+    """Batch version of `tokenize_and_lemmatize` (or another picklable tokenizer)."""
+    return map_batch(tokenizer or tokenize_and_lemmatize, texts, n_jobs=n_jobs, chunksize=chunksize)
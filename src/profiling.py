@@ -0,0 +1,195 @@
+"""Profiling helpers behind the `--profile` options of predict.py and predict_batch.py.
+
+`ProfileSession` wraps a block of inference and combines:
+
+- the per-stage table of an instrumented model (`src.stage_timing`),
+- a sampling profiler (`StackSampler`) that reads the Python stack of the
+  profiled thread from a background thread every few milliseconds. It
+  reports hotspots by self and total time and can write the samples as
+  folded stacks, the input format of flamegraph.pl, speedscope and inferno.
+  Sampling keeps the overhead at a few percent, so the stage timings stay
+  representative.
+- optionally tracemalloc: peak traced memory and the allocation sites
+  holding the most memory near that peak (a snapshot is taken whenever
+  traced memory reaches a new high; this slows allocation-heavy code
+  noticeably),
+- optionally a deterministic cProfile dump readable by pstats, snakeviz or
+  gprof2dot.
+"""
+
+import collections
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from src.stage_timing import StageTimings, instrument
+
+
+def _frame_label(code):
+    path = code.co_filename
+    for root in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if path.startswith(root + os.sep):
+            path = path[len(root) + 1:]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Collect the Python stack of `thread_id` (default: the calling thread) every `interval` seconds."""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        labels = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                # root first, as folded stacks expect
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def hotspots(self, top=15):
+        """`(function, self share, total share)` for the functions with the most samples of their own."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for label in set(stack):
+                total[label] += n
+        samples = self.samples or 1
+        return [(label, n / samples, total[label] / samples) for label, n in own.most_common(top)]
+
+    def format_table(self, top=15):
+        lines = [f"{'self':>7} {'total':>7}  function ({self.samples} samples every {self.interval * 1e3:g} ms)"]
+        for label, own, total in self.hotspots(top):
+            lines.append(f"{own:>7.1%} {total:>7.1%}  {label}")
+        return "\n".join(lines)
+
+    def write_folded(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(";".join(stack) + f" {n}\n")
+
+
+class ProfileSession:
+    """Context manager that profiles a block; `report()` returns the text summary."""
+
+    def __init__(self, timings=None, sample_interval=0.005, memory=False, cprofile_out=None, folded_out=None, top=15):
+        self.timings = timings
+        self.sampler = StackSampler(sample_interval) if sample_interval else None
+        self.memory = memory
+        self.cprofile_out = cprofile_out
+        self.folded_out = folded_out
+        self.top = top
+        self.seconds = 0.0
+        self._profile = None
+        self._snapshot = None
+        self._snapshot_size = 0
+        self._peak = 0
+        self._mem_stop = threading.Event()
+        self._mem_thread = None
+
+    def _watch_memory(self, interval=0.05):
+        while not self._mem_stop.wait(interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > max(1.1 * self._snapshot_size, 1 << 20):
+                self._snapshot = tracemalloc.take_snapshot()
+                self._snapshot_size = current
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start(10)
+            self._mem_thread = threading.Thread(target=self._watch_memory, name="memory-sampler", daemon=True)
+            self._mem_thread.start()
+        if self.cprofile_out:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.sampler is not None:
+            self.sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._start
+        if self.sampler is not None:
+            self.sampler.stop()
+            if self.folded_out:
+                self.sampler.write_folded(self.folded_out)
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.cprofile_out)
+        if self.memory:
+            self._mem_stop.set()
+            self._mem_thread.join()
+            if self._snapshot is None:
+                self._snapshot = tracemalloc.take_snapshot()
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def report(self):
+        parts = [f"Profiled {self.seconds:.3f}s"]
+        if self.timings is not None and self.timings.histograms:
+            parts.append("Per-stage breakdown:\n" + self.timings.format_table())
+        if self.sampler is not None and self.sampler.samples:
+            parts.append("Python hotspots (sampled):\n" + self.sampler.format_table(self.top))
+        if self._snapshot is not None:
+            lines = [f"Peak traced memory: {self._peak / 2 ** 20:.1f} MB; "
+                     f"top allocation sites at {self._snapshot_size / 2 ** 20:.1f} MB:"]
+            own = [tracemalloc.Filter(False, f) for f in (tracemalloc.__file__, cProfile.__file__, __file__)]
+            for stat in self._snapshot.filter_traces(own).statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 2 ** 20:>9.2f} MB {stat.count:>9} blocks  {frame.filename}:{frame.lineno}")
+            parts.append("\n".join(lines))
+        outputs = [p for p in (self.folded_out, self.cprofile_out) if p]
+        if outputs:
+            parts.append("Wrote " + ", ".join(outputs))
+        return "\n\n".join(parts)
+
+
+def add_profile_args(parser):
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings (documents, non-zeros) and sampled Python hotspots")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also trace memory allocations (slower)")
+    parser.add_argument("--profile-folded", help="With --profile, write sampled stacks in folded format (flamegraph.pl, speedscope)")
+    parser.add_argument("--profile-cprofile", help="With --profile, also write a cProfile dump (pstats, snakeviz, gprof2dot)")
+
+
+def profile_model(clf, args):
+    """Instrument `clf` for the --profile options; returns `(model to call, ProfileSession)`."""
+    timings = StageTimings()
+    if hasattr(clf, "pipeline"):
+        # SpamClassifier/AdvancedSpamClassifier: time the steps of the wrapped pipeline in place
+        clf.pipeline = instrument(clf.pipeline, timings)
+    else:
+        # e.g. fast-inference models: no pipeline steps, whole calls are timed
+        clf = instrument(clf, timings)
+    session = ProfileSession(timings, memory=args.profile_memory, cprofile_out=args.profile_cprofile,
+                             folded_out=args.profile_folded)
+    return clf, session
@@ -0,0 +1,381 @@
+"""Hyperparameter search helpers that fit each feature extractor only once.
+
+`GridSearchCV` over a full `Pipeline` refits the TF-IDF step for every
+parameter value, fold and candidate, even when only the classifier
+changes. `FoldFeatureCache` computes the train/test matrices of every CV
+fold once per distinct vectorizer configuration; `search_head` then tunes
+only the downstream steps (feature selection, classifier) on those
+matrices. Folds match what `GridSearchCV(cv=k)` uses for classifiers
+(`StratifiedKFold(k)`), and candidates are ranked the same way, so the
+selection is the same.
+
+`parallel_search_heads` runs the (candidate, parameters, fold) fits of
+many candidates as one flat pool of tasks over worker processes, with the
+fold matrices placed once in shared memory instead of pickled per task.
+
+`make_search` picks between exhaustive `GridSearchCV` and successive
+halving (`HalvingGridSearchCV`), which scores every candidate on a small
+sample first and only keeps the best third for the next, larger round.
+
+Grids that only vary the smoothing `alpha` of a Naive Bayes classifier are
+scored in closed form (see `src.nb_alpha`) instead of one fit per value.
+
+Corpora collapsed by `src.dedup` pass their duplicate counts as
+`sample_weight` and their groups as `groups`: folds become
+`StratifiedGroupKFold` and both the classifier fits and the F1 are
+weighted; `fit_search` does the same for a search built by `make_search`.
+"""
+
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+import sklearn
+from sklearn import config_context
+from sklearn.base import clone
+from sklearn.metrics import f1_score, get_scorer
+from sklearn.model_selection import GridSearchCV, ParameterGrid, StratifiedGroupKFold
+from sklearn.utils.fixes import parse_version
+
+from src.dedup import fit_params, group_folds
+from src.nb_alpha import NBAlphaSearchCV, alpha_only_grid, sweep_head
+
+# parameters that change how fast a vectorizer runs but not what it produces
+_NON_FEATURE_PARAMS = {"n_jobs", "chunksize"}
+# searches route sample_weight to their scorer from scikit-learn 1.4 on
+_HAS_SEARCH_ROUTING = parse_version(sklearn.__version__).release >= (1, 4)
+
+
+def take(X, idx):
+    """Row subset of a list of documents or of a matrix."""
+    if hasattr(X, "shape"):
+        return X[idx]
+    return [X[i] for i in idx]
+
+
+def _fold_weights(sample_weight, train_idx, test_idx):
+    if sample_weight is None:
+        return None, None
+    return sample_weight[train_idx], sample_weight[test_idx]
+
+
+def vectorizer_key(vect) -> tuple:
+    params = vect.get_params(deep=False)
+    return (type(vect).__name__,) + tuple((k, repr(params[k])) for k in sorted(params) if k not in _NON_FEATURE_PARAMS)
+
+
+class FoldFeatureCache:
+    """In-memory CSR matrices per (vectorizer params, fold), computed on first use.
+
+    With `groups`, folds keep every group on one side; `sample_weight` is
+    kept for the searches that score on these folds.
+    """
+
+    def __init__(self, X, y, cv=3, groups=None, sample_weight=None):
+        self.X = X
+        self.y = np.asarray(y)
+        self.sample_weight = None if sample_weight is None else np.asarray(sample_weight)
+        self.folds = group_folds(self.y, groups, cv)
+        self._fold_mats = {}
+        self._full = {}
+        self.vectorizer_fits = 0
+        self.hits = 0
+
+    def fold_matrices(self, vect):
+        """Return `[(X_train_fold, X_test_fold), ...]` for an unfitted vectorizer template."""
+        key = vectorizer_key(vect)
+        if key in self._fold_mats:
+            self.hits += 1
+            return self._fold_mats[key]
+        mats = []
+        for train_idx, test_idx in self.folds:
+            v = clone(vect)
+            Xtr = v.fit_transform(take(self.X, train_idx)).tocsr()
+            Xte = v.transform(take(self.X, test_idx)).tocsr()
+            mats.append((Xtr, Xte))
+            self.vectorizer_fits += 1
+        self._fold_mats[key] = mats
+        return mats
+
+    def full(self, vect):
+        """Return `(fitted_vectorizer, X_matrix)` fitted on all rows."""
+        key = vectorizer_key(vect)
+        if key in self._full:
+            self.hits += 1
+            return self._full[key]
+        v = clone(vect)
+        Xm = v.fit_transform(self.X).tocsr()
+        self.vectorizer_fits += 1
+        self._full[key] = (v, Xm)
+        return self._full[key]
+
+    def describe(self) -> str:
+        return f"feature cache: {len(self._fold_mats)} vectorizer configs, {self.vectorizer_fits} vectorizer fits, {self.hits} reuses"
+
+
+def score_fold(head, params, Xtr, ytr, Xte, yte, wtr=None, wte=None) -> float:
+    est = clone(head).set_params(**params)
+    est.fit(Xtr, ytr, **fit_params(est, wtr))
+    return f1_score(yte, est.predict(Xte), average="macro", sample_weight=wte)
+
+
+def score_settings(head, param_grid, settings, Xtr, ytr, Xte, yte, wtr=None, wte=None) -> list:
+    """Scores of `head` on one fold for each of `settings` (drawn from `param_grid`)."""
+    alphas = alpha_only_grid(head, param_grid)
+    if alphas is not None and len(settings) > 1:
+        by_alpha = dict(zip(map(repr, alphas), sweep_head(head, alphas, Xtr, ytr, Xte, yte, wtr, wte)))
+        return [float(by_alpha[repr(next(iter(p.values())))]) for p in settings]
+    return [score_fold(head, params, Xtr, ytr, Xte, yte, wtr, wte) for params in settings]
+
+
+def search_head(head, param_grid, fold_mats, y, folds, sample_weight=None):
+    """Score every setting of `param_grid` for `head` on precomputed fold matrices.
+
+    Returns `(best_params, best_score, results)` where `results` is a list of
+    `(params, mean_f1_macro)` in `ParameterGrid` order; ties go to the first
+    setting, as in `GridSearchCV`. `sample_weight` weights the fits and the F1.
+    """
+    y = np.asarray(y)
+    settings = list(ParameterGrid(param_grid))
+    per_fold = [score_settings(head, param_grid, settings, Xtr, y[tr], Xte, y[te], *_fold_weights(sample_weight, tr, te))
+                for (Xtr, Xte), (tr, te) in zip(fold_mats, folds)]
+    means = np.mean(per_fold, axis=0)
+    results = [(params, float(m)) for params, m in zip(settings, means)]
+    best = int(np.argmax(means))
+    return results[best][0], results[best][1], results
+
+
+class SharedCSR:
+    """Picklable handle to a CSR matrix whose arrays live in one shared-memory block."""
+
+    def __init__(self, X):
+        X = sparse.csr_matrix(X)
+        self.shape = X.shape
+        self._parts = []
+        offset = 0
+        arrays = (X.data, X.indices, X.indptr)
+        for arr in arrays:
+            self._parts.append((arr.dtype.str, arr.size, offset))
+            offset += arr.nbytes
+        self.nbytes = offset
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.name = self._shm.name
+        for arr, (_, size, start) in zip(arrays, self._parts):
+            np.ndarray(size, dtype=arr.dtype, buffer=self._shm.buf, offset=start)[:] = arr
+
+    def __getstate__(self):
+        return {"shape": self.shape, "_parts": self._parts, "nbytes": self.nbytes, "name": self.name, "_shm": None}
+
+    def attach(self):
+        """Rebuild the matrix on top of the shared buffer without copying it."""
+        if self._shm is None:
+            # workers share the parent's resource tracker, so only the creator unlinks the block
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        data, indices, indptr = (np.ndarray(size, dtype=np.dtype(dt), buffer=self._shm.buf, offset=start)
+                                 for dt, size, start in self._parts)
+        return sparse.csr_matrix((data, indices, indptr), shape=self.shape, copy=False)
+
+    def release(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+_worker_state = {}
+
+
+def _init_worker(shared_mats, y, folds, sample_weight=None):
+    _worker_state["mats"] = {key: [(a.attach(), b.attach()) for a, b in mats] for key, mats in shared_mats.items()}
+    _worker_state["y"] = y
+    _worker_state["folds"] = folds
+    _worker_state["sample_weight"] = sample_weight
+
+
+def _run_task(task_id, head, param_grid, settings, mat_key, fold):
+    start = time.perf_counter()
+    Xtr, Xte = _worker_state["mats"][mat_key][fold]
+    train_idx, test_idx = _worker_state["folds"][fold]
+    y = _worker_state["y"]
+    weights = _fold_weights(_worker_state["sample_weight"], train_idx, test_idx)
+    scores = score_settings(head, param_grid, settings, Xtr, y[train_idx], Xte, y[test_idx], *weights)
+    return task_id, scores, time.perf_counter() - start, os.getpid()
+
+
+def plan_workers(n_workers, fold_mats, mem_budget_mb=None) -> int:
+    """Cap the worker count so that concurrent fits stay within `mem_budget_mb`.
+
+    The shared matrices are counted once; each running task is assumed to
+    need about twice its largest training matrix for the copies made by
+    feature selection and the solvers.
+    """
+    if n_workers is None or n_workers < 1:
+        n_workers = os.cpu_count() or 1
+    if not mem_budget_mb:
+        return n_workers
+    shared = sum(Xtr.data.nbytes + Xtr.indices.nbytes + Xte.data.nbytes + Xte.indices.nbytes
+                 for mats in fold_mats.values() for Xtr, Xte in mats)
+    per_task = 2 * max(Xtr.data.nbytes + Xtr.indices.nbytes for mats in fold_mats.values() for Xtr, _ in mats)
+    room = mem_budget_mb * 1e6 - shared
+    return max(1, min(n_workers, int(room // per_task) if per_task else n_workers))
+
+
+def parallel_search_heads(candidates, fold_mats, y, folds, n_workers=None, mem_budget_mb=None, sample_weight=None):
+    """Evaluate many candidates as one flat pool of (candidate, params, fold) tasks.
+
+    `candidates` is a list of `(name, head, param_grid, mat_key)`, where
+    `mat_key` indexes `fold_mats`, a dict of fold matrix lists as returned by
+    `FoldFeatureCache.fold_matrices`. Naive Bayes alpha grids become a single
+    closed-form task per fold. Returns `(results, timings)`:
+    `results[name]` is `(best_params, best_score, all_results)` as from
+    `search_head`, and `timings` holds one `(name, params, fold, seconds, pid)`
+    row per task. `sample_weight` weights the fits and the F1 as in `search_head`.
+    """
+    y = np.asarray(y)
+    n_workers = plan_workers(n_workers, fold_mats, mem_budget_mb)
+    tasks = []
+    for name, head, param_grid, mat_key in candidates:
+        settings = list(ParameterGrid(param_grid))
+        groups = [settings] if alpha_only_grid(head, param_grid) is not None else [[p] for p in settings]
+        for group in groups:
+            for fold in range(len(folds)):
+                tasks.append((name, head, param_grid, group, mat_key, fold))
+
+    shared_mats = {key: [(SharedCSR(a), SharedCSR(b)) for a, b in mats] for key, mats in fold_mats.items()}
+    fold_scores = {}
+    timings = []
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(shared_mats, y, folds, sample_weight)) as ex:
+            futures = [ex.submit(_run_task, i, *task[1:]) for i, task in enumerate(tasks)]
+            for fut in as_completed(futures):
+                task_id, scores, seconds, pid = fut.result()
+                name, _, _, group, _, fold = tasks[task_id]
+                for params, score in zip(group, scores):
+                    fold_scores.setdefault((name, repr(params)), []).append(score)
+                shown = group[0] if len(group) == 1 else f"{len(group)}-value alpha sweep"
+                timings.append((name, shown, fold, seconds, pid))
+    finally:
+        for mats in shared_mats.values():
+            for a, b in mats:
+                a.release()
+                b.release()
+
+    results = {}
+    for name, _, param_grid, _ in candidates:
+        per_params = [(params, float(np.mean(fold_scores[(name, repr(params))]))) for params in ParameterGrid(param_grid)]
+        best = int(np.argmax([score for _, score in per_params]))
+        results[name] = (per_params[best][0], per_params[best][1], per_params)
+    return results, timings
+
+
+def format_timing_table(timings, wall_seconds=None) -> str:
+    rows = sorted(timings, key=lambda r: r[3], reverse=True)
+    lines = [f"{'seconds':>8}  {'worker':>7}  {'fold':>4}  candidate / params"]
+    for name, params, fold, seconds, pid in rows:
+        lines.append(f"{seconds:8.2f}  {pid:>7}  {fold:>4}  {name} {params}")
+    total = sum(r[3] for r in rows)
+    summary = f"{len(rows)} tasks, {total:.1f}s of task time"
+    if wall_seconds:
+        summary += f" in {wall_seconds:.1f}s wall ({total / wall_seconds:.1f}x)"
+    lines.append(summary)
+    return "\n".join(lines)
+
+
+SEARCH_ENGINES = ("grid", "halving")
+
+
+def make_search(estimator, param_grid, search="grid", cv=3, n_jobs=None, scoring="f1_macro", factor=3, random_state=42):
+    """Build an exhaustive or successive-halving search; both refit the best candidate on all rows.
+
+    An exhaustive F1-macro search over a Pipeline ending in a Naive Bayes
+    classifier is served by `NBAlphaSearchCV`, which picks the same
+    parameters without refitting per alpha.
+    """
+    if search == "grid":
+        if scoring == "f1_macro" and isinstance(cv, int) and NBAlphaSearchCV.supports(estimator, param_grid):
+            return NBAlphaSearchCV(estimator, param_grid, cv=cv)
+        return GridSearchCV(estimator, param_grid, cv=cv, scoring=scoring, n_jobs=n_jobs)
+    if search == "halving":
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingGridSearchCV
+
+        return HalvingGridSearchCV(estimator, param_grid, cv=cv, scoring=scoring, n_jobs=n_jobs, factor=factor, random_state=random_state)
+    raise ValueError(f"unknown search engine: {search!r} (expected one of {SEARCH_ENGINES})")
+
+
+def _search_classifiers(gs):
+    """The classifier of `gs.estimator` and every classifier its grid swaps in."""
+    name, clf = gs.estimator.steps[-1]
+    grids = [gs.param_grid] if isinstance(gs.param_grid, dict) else gs.param_grid
+    return [clf] + [c for grid in grids for c in grid.get(name, []) if hasattr(c, "fit")]
+
+
+def fit_search(gs, X, y, groups=None, sample_weight=None):
+    """Fit a search from `make_search`, keeping each of `groups` within one fold and weighting fits and scores.
+
+    Returns the fitted search. The sklearn searches are cloned first, so the
+    group folds, weighted scorer and fit requests set here do not change
+    `gs` or its estimators; use the returned search. They get the weights
+    through metadata routing, so their F1 is weighted like that of
+    `NBAlphaSearchCV` and the feature cache. scikit-learn < 1.4 cannot route
+    weights to the scorer: the fits are still weighted, the F1 is not, and
+    a warning says so.
+    """
+    if isinstance(gs, NBAlphaSearchCV):
+        return gs.fit(X, y, groups=groups, sample_weight=sample_weight)
+    gs = clone(gs)
+    if groups is not None and isinstance(gs.cv, int):
+        gs.cv = StratifiedGroupKFold(n_splits=gs.cv)
+    if sample_weight is None:
+        return gs.fit(X, y, groups=groups)
+    if not _HAS_SEARCH_ROUTING:
+        warnings.warn(f"scikit-learn {sklearn.__version__} cannot pass sample_weight to the search scorer; "
+                      "fits are weighted but the CV F1 is not (needs scikit-learn >= 1.4)", UserWarning)
+        return gs.fit(X, y, groups=groups, **fit_params(gs.estimator, sample_weight))
+    with config_context(enable_metadata_routing=True):
+        gs.scoring = get_scorer(gs.scoring).set_score_request(sample_weight=True)
+        for clf in _search_classifiers(gs):
+            clf.set_fit_request(sample_weight=True)
+        return gs.fit(X, y, groups=groups, sample_weight=sample_weight)
+
+
+def _cv_fold_f1(estimator, X, y, train_idx, test_idx, sample_weight):
+    wtr, wte = _fold_weights(sample_weight, train_idx, test_idx)
+    est = clone(estimator).fit(take(X, train_idx), y[train_idx], **fit_params(estimator, wtr))
+    return f1_score(y[test_idx], est.predict(take(X, test_idx)), average="macro", sample_weight=wte)
+
+
+def cross_val_f1(estimator, X, y, cv=3, groups=None, sample_weight=None, n_jobs=None):
+    """Per-fold macro F1 like `cross_val_score(scoring="f1_macro")`, with group-aware folds and weighted fits and scores."""
+    y = np.asarray(y)
+    sample_weight = None if sample_weight is None else np.asarray(sample_weight)
+    folds = group_folds(y, groups, cv)
+    return np.array(Parallel(n_jobs=n_jobs)(delayed(_cv_fold_f1)(estimator, X, y, tr, te, sample_weight) for tr, te in folds))
+
+
+def search_cost(gs, n_samples):
+    """Return `(rows_fitted, rows_fitted_exhaustive)` for a search fitted on `n_samples` rows.
+
+    Cost is counted as training rows seen summed over every CV fit, which is
+    what dominates TF-IDF + classifier training. For `GridSearchCV` both
+    numbers are equal.
+    """
+    n_splits = gs.n_splits_
+    if hasattr(gs, "n_resources_"):
+        used = sum(n * r for n, r in zip(gs.n_candidates_, gs.n_resources_)) * n_splits
+        return used, gs.n_candidates_[0] * n_samples * n_splits
+    cost = len(gs.cv_results_["params"]) * n_samples * n_splits
+    return cost, cost
+
+
+def describe_savings(costs) -> str:
+    """Summarize a list of `search_cost` results."""
+    used = sum(u for u, _ in costs)
+    exhaustive = sum(e for _, e in costs)
+    if not exhaustive:
+        return "search cost: nothing to compare"
+    return (f"search cost: {used:,} training rows fitted vs {exhaustive:,} for the exhaustive grid "
+            f"({1 - used / exhaustive:.0%} saved)")
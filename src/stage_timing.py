@@ -0,0 +1,278 @@
+"""Low-overhead per-stage latency histograms for fitted pipelines.
+
+`instrument(model, timings)` wraps the steps of a fitted `Pipeline` (also
+inside `CalibratedClassifierCV` or the `SpamClassifier` wrappers) in
+`TimedStep` proxies, so every `transform`/`predict_proba` call records its
+duration under the step name. Preprocessor/tokenizer callables of text
+vectorizers (`simple_clean`, `lemmatize_text`, `tokenize_and_lemmatize`) are
+timed separately as the "preprocess" stage and subtracted from the
+vectorizer step, and for calibrated models the time outside the pipeline
+steps is recorded as "calibration". Each stage also counts the documents it
+processed and, for `transform` steps, the non-zeros of the feature matrix it
+produced (classifier steps show "-"). Each call adds two `perf_counter` reads
+and a bucket search, which is negligible next to the work being timed.
+Instrumentation mutates the model in place; do not save an instrumented
+model.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from sklearn.exceptions import NotFittedError
+from sklearn.utils.validation import check_is_fitted
+
+# seconds; roughly 2.5x apart from 50us to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; `counts[i]` counts values <= `buckets[i]`, the last slot is +Inf."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        return np.cumsum(self.counts).tolist()
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if it is the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        idx = bisect.bisect_left(self.cumulative(), q * self.count)
+        return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+
+
+class StageTimings:
+    """Histograms of seconds per named stage; safe to share between threads."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        # stage -> [documents in, non-zeros out]
+        self.flow = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, stage, seconds):
+        hist = self.histograms.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(stage, Histogram(self.buckets))
+        hist.observe(seconds)
+
+    def count(self, stage, docs, nnz=None):
+        with self._lock:
+            flow = self.flow.setdefault(stage, [0, 0])
+            flow[0] += docs
+            if nnz is not None:
+                flow[1] += nnz
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # per-thread accumulators used to attribute nested time (preprocess inside a vectorizer,
+    # pipeline steps inside a calibrated model)
+    def _acc(self):
+        acc = getattr(self._local, "acc", None)
+        if acc is None:
+            acc = self._local.acc = {}
+        return acc
+
+    def accumulate(self, key, seconds):
+        acc = self._acc()
+        acc[key] = acc.get(key, 0.0) + seconds
+
+    def take(self, key):
+        return self._acc().pop(key, 0.0)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.flow = {}
+
+    def summary(self):
+        """One row per stage: count, total, mean and bucketed p50/p99 (seconds), documents and non-zeros out."""
+        rows = []
+        for stage, h in sorted(self.histograms.items(), key=lambda kv: -kv[1].sum):
+            docs, nnz = self.flow.get(stage, (0, 0))
+            rows.append({"stage": stage, "count": h.count, "total": h.sum, "mean": h.sum / h.count if h.count else 0.0,
+                         "p50": h.quantile(0.5), "p99": h.quantile(0.99), "docs": docs, "nnz": nnz})
+        return rows
+
+    def format_table(self):
+        """Text table of `summary()`; shares are relative to the "total" stage when it was recorded."""
+        rows = self.summary()
+        total = self.histograms.get("total")
+        grand = (total.sum if total is not None else sum(r["total"] for r in rows)) or 1.0
+        lines = [f"{'stage':<16} {'calls':>7} {'total ms':>10} {'mean ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'share':>7} "
+                 f"{'docs':>9} {'nnz out':>11}"]
+        for r in rows:
+            lines.append(f"{r['stage']:<16} {r['count']:>7} {r['total'] * 1e3:>10.2f} {r['mean'] * 1e3:>10.3f} "
+                         f"{r['p50'] * 1e3:>9.3f} {r['p99'] * 1e3:>9.3f} {r['total'] / grand:>7.1%} "
+                         f"{r['docs']:>9} {r['nnz'] or '-':>11}")
+        return "\n".join(lines)
+
+
+class TimedCallable:
+    """Wrap a preprocessor/tokenizer; time is accumulated and attributed by the enclosing `TimedStep`."""
+
+    def __init__(self, func, timings):
+        self.func = func
+        self.timings = timings
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.timings.accumulate("preprocess", time.perf_counter() - start)
+
+
+class TimedStep:
+    """Proxy for a fitted pipeline step that times its inference methods."""
+
+    _TIMED = ("transform", "predict", "predict_proba", "predict_log_proba", "decision_function")
+
+    def __init__(self, step, name, timings):
+        self.__dict__["_step"] = step
+        self.__dict__["_name"] = name
+        self.__dict__["_timings"] = timings
+
+    def __getattr__(self, attr):
+        value = getattr(self._step, attr)
+        if attr in self._TIMED:
+            return self._wrap(attr, value)
+        return value
+
+    def __setattr__(self, attr, value):
+        setattr(self._step, attr, value)
+
+    def __sklearn_is_fitted__(self):
+        # check_is_fitted would otherwise inspect the proxy's own attributes
+        try:
+            check_is_fitted(self._step)
+        except NotFittedError:
+            return False
+        return True
+
+    def _wrap(self, attr, method):
+        timings, name = self._timings, self._name
+        # only feature matrices have meaningful non-zeros; classifier outputs are labels/probabilities
+        features = attr == "transform"
+
+        def timed(*args, **kwargs):
+            timings.take("preprocess")
+            start = time.perf_counter()
+            out = None
+            try:
+                out = method(*args, **kwargs)
+                return out
+            finally:
+                elapsed = time.perf_counter() - start
+                pre = timings.take("preprocess")
+                docs = _rows(args[0]) if args else 0
+                if pre:
+                    timings.observe("preprocess", pre)
+                    timings.count("preprocess", docs)
+                timings.observe(name, elapsed - pre)
+                timings.accumulate("steps", elapsed)
+                timings.count(name, docs, _nnz(out) if features else None)
+
+        return timed
+
+
+def _rows(X):
+    shape = getattr(X, "shape", None)
+    if shape is not None:
+        return shape[0]
+    try:
+        return len(X)
+    except TypeError:
+        return 0
+
+
+def _nnz(out):
+    if out is None:
+        return None
+    nnz = getattr(out, "nnz", None)
+    if nnz is not None:
+        return nnz
+    return int(np.count_nonzero(out)) if isinstance(out, np.ndarray) else None
+
+
+class TimedModel:
+    """Times whole-model calls as "total"; for calibrated models the time outside the steps is "calibration"."""
+
+    def __init__(self, model, timings, calibrated):
+        self.model = model
+        self.timings = timings
+        self.calibrated = calibrated
+
+    def __getattr__(self, attr):
+        return getattr(self.model, attr)
+
+    def _call(self, method, X):
+        self.timings.take("steps")
+        start = time.perf_counter()
+        out = getattr(self.model, method)(X)
+        elapsed = time.perf_counter() - start
+        steps = self.timings.take("steps")
+        if self.calibrated:
+            self.timings.observe("calibration", max(elapsed - steps, 0.0))
+            self.timings.count("calibration", _rows(X))
+        self.timings.observe("total", elapsed)
+        self.timings.count("total", _rows(X))
+        return out
+
+    def predict_proba(self, X):
+        return self._call("predict_proba", X)
+
+    def predict(self, X):
+        return self._call("predict", X)
+
+
+def _instrument_pipeline(pipeline, timings):
+    for i, (name, step) in enumerate(pipeline.steps):
+        if step is None or step == "passthrough" or isinstance(step, TimedStep):
+            continue
+        for attr in ("preprocessor", "tokenizer"):
+            func = getattr(step, attr, None)
+            if callable(func) and not isinstance(func, TimedCallable):
+                # n_jobs > 1 would ship the wrapper to worker processes; time in-process only
+                if getattr(step, "n_jobs", 1) in (1, None):
+                    setattr(step, attr, TimedCallable(func, timings))
+        pipeline.steps[i] = (name, TimedStep(step, name, timings))
+
+
+def instrument(model, timings):
+    """Instrument a fitted model for `timings` and return the object to call instead of it."""
+    inner = getattr(model, "pipeline", model) if not hasattr(model, "steps") else model
+    if type(inner).__name__ == "FrozenEstimator":
+        inner = inner.estimator
+    calibrated = type(inner).__name__ == "CalibratedClassifierCV"
+    if calibrated:
+        for member in inner.calibrated_classifiers_:
+            est = member.estimator
+            est = getattr(est, "estimator", est) if type(est).__name__ == "FrozenEstimator" else est
+            if hasattr(est, "steps"):
+                _instrument_pipeline(est, timings)
+    elif hasattr(inner, "steps"):
+        _instrument_pipeline(inner, timings)
+    return TimedModel(model, timings, calibrated)
@@ -0,0 +1,188 @@
+"""Content-addressed on-disk cache of tokenized texts.
+
+Each text is keyed by a 16-byte BLAKE2 digest of its content, inside a
+directory named after a fingerprint of the preprocessing configuration
+(function, stopword set, NLTK version), so changing any of those starts a
+fresh cache. Entries are stored in append-only segments of flat `.npy`
+arrays that are memory-mapped on load:
+
+    <seg>.keys.npy     (n, 16) uint8   text digests
+    <seg>.offsets.npy  (n + 1,) int64  start of each text's tokens in `ids`
+    <seg>.ids.npy      (m,) uint16/32  token ids into the segment vocabulary
+    <seg>.vocab.json   token strings; written last, marks the segment complete
+
+Segments never change once written, so several training processes can
+share a cache directory.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Callable, Iterable, List
+
+import numpy as np
+
+from src.preprocess import BATCH_CHUNKSIZE, get_context, map_batch, tokenize_and_lemmatize
+from src.vectorizers import Preprocessed
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(".cache", "tokens")
+
+
+def _text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def preprocess_fingerprint(func: Callable) -> str:
+    """Digest of everything that can change the output of `func`."""
+    import nltk
+
+    config = {
+        "format": CACHE_FORMAT_VERSION,
+        "func": f"{func.__module__}.{func.__qualname__}",
+        "stopwords": sorted(get_context().stopwords),
+        "nltk": nltk.__version__,
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class _Segment:
+    def __init__(self, base):
+        self.keys = np.load(base + ".keys.npy", mmap_mode="r")
+        self.offsets = np.load(base + ".offsets.npy", mmap_mode="r")
+        self.ids = np.load(base + ".ids.npy", mmap_mode="r")
+        with open(base + ".vocab.json", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+    def tokens(self, row):
+        vocab = self.vocab
+        return [vocab[i] for i in self.ids[self.offsets[row]:self.offsets[row + 1]].tolist()]
+
+
+class TokenCache:
+    """Cache the output of a picklable tokenizer/preprocessor across runs.
+
+    `func` may return a list of tokens (e.g. `tokenize_and_lemmatize`) or a
+    space-joined string (e.g. `lemmatize_text`, `simple_clean`); strings are
+    stored as their space-separated tokens and rebuilt exactly on load.
+    Misses are computed with `map_batch`, so `n_jobs` fans them out over
+    processes.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, func: Callable = tokenize_and_lemmatize, n_jobs=1, chunksize: int = BATCH_CHUNKSIZE):
+        self.func = func
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.path = os.path.join(cache_dir, preprocess_fingerprint(func))
+        self.hits = 0
+        self.misses = 0
+        self._segments = []
+        self._index = {}
+        self._returns_str = None
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.path):
+            return
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self._returns_str = json.load(f)["returns_str"]
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".vocab.json"):
+                continue
+            seg = _Segment(os.path.join(self.path, name[: -len(".vocab.json")]))
+            seg_no = len(self._segments)
+            self._segments.append(seg)
+            raw = seg.keys.tobytes()
+            for row in range(len(seg.keys)):
+                self._index.setdefault(raw[row * 16:(row + 1) * 16], (seg_no, row))
+
+    def _write_segment(self, keys, results):
+        os.makedirs(self.path, exist_ok=True)
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"returns_str": self._returns_str, "func": f"{self.func.__module__}.{self.func.__qualname__}"}, f)
+
+        vocab = {}
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        ids = []
+        for i, tokens in enumerate(results):
+            ids.extend(vocab.setdefault(t, len(vocab)) for t in tokens)
+            offsets[i + 1] = len(ids)
+        id_dtype = np.uint16 if len(vocab) <= np.iinfo(np.uint16).max else np.uint32
+
+        base = os.path.join(self.path, f"seg-{uuid.uuid4().hex[:12]}")
+        np.save(base + ".keys.npy", np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, 16))
+        np.save(base + ".offsets.npy", offsets)
+        np.save(base + ".ids.npy", np.asarray(ids, dtype=id_dtype))
+        tmp = base + ".vocab.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(vocab), f)
+        os.replace(tmp, base + ".vocab.json")
+
+        seg_no = len(self._segments)
+        self._segments.append(_Segment(base))
+        for row, key in enumerate(keys):
+            self._index[key] = (seg_no, row)
+
+    def tokenize(self, texts: Iterable[str]) -> list:
+        """Return `func(text)` for every text, computing and storing only the misses."""
+        texts = list(texts)
+        keys = [_text_key(t) for t in texts]
+        out = [None] * len(texts)
+        missing = {}
+        for i, key in enumerate(keys):
+            loc = self._index.get(key)
+            if loc is None:
+                missing.setdefault(key, []).append(i)
+                continue
+            self.hits += 1
+            tokens = self._segments[loc[0]].tokens(loc[1])
+            out[i] = " ".join(tokens) if self._returns_str else tokens
+
+        if missing:
+            miss_keys = list(missing)
+            results = map_batch(self.func, [texts[missing[k][0]] for k in miss_keys], n_jobs=self.n_jobs, chunksize=self.chunksize)
+            if self._returns_str is None:
+                self._returns_str = isinstance(results[0], str)
+            for key, result in zip(miss_keys, results):
+                for i in missing[key]:
+                    out[i] = result if self._returns_str else list(result)
+                self.misses += len(missing[key])
+            self._write_segment(miss_keys, [r.split(" ") if self._returns_str else r for r in results])
+        return out
+
+    def prepare(self, texts: Iterable[str]) -> list:
+        """Tokenize through the cache and return documents ready for `BatchTfidfVectorizer`.
+
+        Token lists are passed through as-is; strings are wrapped in
+        `Preprocessed` so the vectorizer skips its preprocessor for them.
+        """
+        docs = self.tokenize(texts)
+        if self._returns_str:
+            return [Preprocessed(d) for d in docs]
+        return docs
+
+    def stats(self) -> dict:
+        size = 0
+        if os.path.isdir(self.path):
+            size = sum(os.path.getsize(os.path.join(self.path, n)) for n in os.listdir(self.path))
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": len(self._index),
+            "segments": len(self._segments),
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def describe(self) -> str:
+        s = self.stats()
+        return (f"token cache {s['path']}: {s['entries']} entries in {s['segments']} segments, "
+                f"{s['bytes'] / 1e6:.1f} MB; this run {s['hits']} hits / {s['misses']} misses "
+                f"(hit rate {s['hit_rate']:.1%})")
@@ -0,0 +1,171 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils.validation import check_array, check_is_fitted
+
+from src.preprocess import BATCH_CHUNKSIZE, map_batch
+
+
+class Preprocessed(str):
+    """Marks a document whose preprocessor stage has already been applied."""
+
+    __slots__ = ()
+
+
+class _BatchTextMixin:
+    """Batch preprocessing shared by the vectorizers below; see `BatchTfidfVectorizer`."""
+
+    def build_preprocessor(self):
+        preprocess = super().build_preprocessor()
+
+        def _preprocess(doc):
+            if isinstance(doc, (list, Preprocessed)):
+                return doc
+            return preprocess(doc)
+
+        return _preprocess
+
+    def build_tokenizer(self):
+        tokenize = super().build_tokenizer()
+
+        def _tokenize(doc):
+            if isinstance(doc, list):
+                return doc
+            return tokenize(doc)
+
+        return _tokenize
+
+    def _pretransform(self, raw_documents):
+        if self.analyzer != "word" or self.input != "content":
+            return raw_documents
+        docs = [self.decode(d) for d in raw_documents]
+        if self.tokenizer is not None:
+            preprocess = self.build_preprocessor()
+            todo = [i for i, d in enumerate(docs) if not isinstance(d, list)]
+            results = map_batch(self.tokenizer, [preprocess(docs[i]) for i in todo], n_jobs=self.n_jobs, chunksize=self.chunksize)
+            for i, tokens in zip(todo, results):
+                docs[i] = list(tokens)
+        elif self.preprocessor is not None:
+            todo = [i for i, d in enumerate(docs) if not isinstance(d, (list, Preprocessed))]
+            results = map_batch(self.preprocessor, [docs[i] for i in todo], n_jobs=self.n_jobs, chunksize=self.chunksize)
+            for i, text in zip(todo, results):
+                docs[i] = Preprocessed(text)
+        return docs
+
+
+class BatchTfidfVectorizer(_BatchTextMixin, TfidfVectorizer):
+    """TfidfVectorizer that runs its custom tokenizer/preprocessor over whole batches.
+
+    `fit`/`transform` hand the user-supplied `tokenizer` (or `preprocessor` when
+    no tokenizer is set) the full document list at once via `map_batch`, so it
+    can be fanned out over `n_jobs` processes. Documents that arrive already
+    tokenized (lists of tokens) or wrapped in `Preprocessed` skip those stages,
+    which lets callers feed a pre-tokenized stream. Features are identical to
+    a plain TfidfVectorizer with the same parameters.
+    """
+
+    def __init__(self, *, input="content", encoding="utf-8", decode_error="strict", strip_accents=None,
+                 lowercase=True, preprocessor=None, tokenizer=None, analyzer="word", stop_words=None,
+                 token_pattern=r"(?u)\b\w\w+\b", ngram_range=(1, 1), max_df=1.0, min_df=1, max_features=None,
+                 vocabulary=None, binary=False, dtype=np.float64, norm="l2", use_idf=True, smooth_idf=True,
+                 sublinear_tf=False, n_jobs=1, chunksize=BATCH_CHUNKSIZE):
+        super().__init__(
+            input=input, encoding=encoding, decode_error=decode_error, strip_accents=strip_accents,
+            lowercase=lowercase, preprocessor=preprocessor, tokenizer=tokenizer, analyzer=analyzer,
+            stop_words=stop_words, token_pattern=token_pattern, ngram_range=ngram_range, max_df=max_df,
+            min_df=min_df, max_features=max_features, vocabulary=vocabulary, binary=binary, dtype=dtype,
+            norm=norm, use_idf=use_idf, smooth_idf=smooth_idf, sublinear_tf=sublinear_tf,
+        )
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+
+    def fit(self, raw_documents, y=None):
+        return super().fit(self._pretransform(raw_documents), y)
+
+    def fit_transform(self, raw_documents, y=None):
+        return super().fit_transform(self._pretransform(raw_documents), y)
+
+    def transform(self, raw_documents):
+        return super().transform(self._pretransform(raw_documents))
+
+
+class BatchHashingVectorizer(_BatchTextMixin, HashingVectorizer):
+    """HashingVectorizer with the batch preprocessing of `BatchTfidfVectorizer`.
+
+    Stateless, so it needs no vocabulary and no fitting; `Preprocessed`
+    documents and token lists skip the preprocessor/tokenizer the same way.
+    """
+
+    def __init__(self, *, input="content", encoding="utf-8", decode_error="strict", strip_accents=None,
+                 lowercase=True, preprocessor=None, tokenizer=None, stop_words=None, token_pattern=r"(?u)\b\w\w+\b",
+                 ngram_range=(1, 1), analyzer="word", n_features=2 ** 20, binary=False, norm="l2",
+                 alternate_sign=True, dtype=np.float64, n_jobs=1, chunksize=BATCH_CHUNKSIZE):
+        super().__init__(
+            input=input, encoding=encoding, decode_error=decode_error, strip_accents=strip_accents,
+            lowercase=lowercase, preprocessor=preprocessor, tokenizer=tokenizer, stop_words=stop_words,
+            token_pattern=token_pattern, ngram_range=ngram_range, analyzer=analyzer, n_features=n_features,
+            binary=binary, norm=norm, alternate_sign=alternate_sign, dtype=dtype,
+        )
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+
+    def transform(self, X):
+        if isinstance(X, str):
+            # let HashingVectorizer raise its error for a single string
+            return super().transform(X)
+        return super().transform(self._pretransform(X))
+
+
+class OnlineTfidfTransformer(TransformerMixin, BaseEstimator):
+    """TF-IDF weighting of hashed counts with document frequencies updated online.
+
+    `partial_fit` adds each batch's per-column document counts to `df_`, one
+    counter per hash bucket, so memory stays at `n_features` counters however
+    many documents and distinct n-grams are seen (n-grams that collide share a
+    count, as they share a column). `idf_` uses `TfidfTransformer`'s formula,
+    so fitting all documents at once weights features exactly like it does.
+    """
+
+    def __init__(self, norm="l2", use_idf=True, smooth_idf=True, sublinear_tf=False):
+        self.norm = norm
+        self.use_idf = use_idf
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+
+    def fit(self, X, y=None):
+        for attr in ("df_", "n_docs_", "idf_"):
+            self.__dict__.pop(attr, None)
+        return self.partial_fit(X)
+
+    def partial_fit(self, X, y=None):
+        X = check_array(X, accept_sparse="csr")
+        if not sp.issparse(X):
+            X = sp.csr_matrix(X)
+        if not hasattr(self, "df_"):
+            self.df_ = np.zeros(X.shape[1], dtype=np.int64)
+            self.n_docs_ = 0
+            self.n_features_in_ = X.shape[1]
+        elif X.shape[1] != self.df_.shape[0]:
+            raise ValueError(f"X has {X.shape[1]} features, but {type(self).__name__} was fitted with {self.df_.shape[0]}")
+        self.df_ += np.bincount(X.indices, minlength=X.shape[1])
+        self.n_docs_ += X.shape[0]
+        smooth = int(self.smooth_idf)
+        # without smoothing, buckets no document has hit yet are treated as seen once
+        self.idf_ = np.log((self.n_docs_ + smooth) / np.maximum(self.df_ + smooth, 1)) + 1
+        return self
+
+    def transform(self, X, copy=True):
+        check_is_fitted(self, "df_")
+        X = check_array(X, accept_sparse="csr", dtype=[np.float64, np.float32], copy=copy)
+        if not sp.issparse(X):
+            X = sp.csr_matrix(X)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.use_idf:
+            X.data *= self.idf_[X.indices]
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
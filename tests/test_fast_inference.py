@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, chi2
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from src.fast_inference import from_model
+
+SPAM = ["win a free prize now", "claim your free cash reward", "urgent winner call now to claim",
+        "free entry to win cash", "you have won a prize call now", "cheap loans apply now free"]
+HAM = ["are we still meeting for lunch", "see you at the office tomorrow", "can you send me the report",
+       "thanks for dinner last night", "call me when you get home", "the meeting moved to friday"]
+TEXTS = SPAM * 3 + HAM * 3
+LABELS = ["spam"] * (3 * len(SPAM)) + ["ham"] * (3 * len(HAM))
+QUERIES = ["free prize call now", "lunch at the office", "win cash tomorrow", "unknown words only", ""]
+
+
+def plain():
+    return Pipeline([("tfidf", TfidfVectorizer(ngram_range=(1, 2))), ("clf", MultinomialNB(alpha=0.1))])
+
+
+def selected():
+    return Pipeline([("tfidf", TfidfVectorizer()), ("select", SelectKBest(chi2, k=10)), ("clf", MultinomialNB())])
+
+
+def calibrated():
+    pipe = Pipeline([("tfidf", TfidfVectorizer(sublinear_tf=True)), ("clf", LogisticRegression())])
+    return CalibratedClassifierCV(pipe, cv=3, ensemble=False)
+
+
+@pytest.mark.parametrize("build", [plain, selected, calibrated])
+def test_predict_proba_matches_sklearn(build):
+    model = build().fit(TEXTS, LABELS)
+    fast = from_model(model)
+    assert np.allclose(fast.predict_proba(QUERIES), model.predict_proba(QUERIES))
+    assert list(fast.predict(QUERIES)) == list(model.predict(QUERIES))
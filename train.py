@@ -1,20 +1,19 @@
 import argparse
 import os
-import pandas as pd
 
+from src.data_io import read_table
 from src.nb_classifier import SpamClassifier
 
 
 def load_data(path):
-    df = pd.read_csv(path)
-    if "text" not in df.columns or "label" not in df.columns:
-        raise ValueError("CSV must contain 'text' and 'label' columns")
+    # CSV (optionally compressed), Parquet or Arrow; only the two columns are read
+    df = read_table(path, ["text", "label"])
     return df["text"].astype(str).tolist(), df["label"].astype(str).tolist()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Train a Naive Bayes spam classifier")
-    parser.add_argument("--data", default="data/sample_emails.csv", help="Path to CSV dataset")
+    parser.add_argument("--data", default="data/sample_emails.csv", help="Path to CSV/Parquet/Arrow dataset")
     parser.add_argument("--output", default="models/model.joblib", help="Where to save the trained model")
     args = parser.parse_args()
 
@@ -6,19 +6,24 @@ backwards-compatible with older usage.
 
 import argparse
 import os
+import time
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import classification_report, confusion_matrix, precision_recall_curve
 from sklearn.feature_selection import SelectKBest, chi2
 from sklearn.pipeline import Pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import ComplementNB
 from sklearn.linear_model import LogisticRegression
 from sklearn.calibration import CalibratedClassifierCV
 from joblib import dump
 
-from src.preprocess import lemmatize_text
+from src.data_io import normalize_label, read_table
+from src.dedup import collapse_duplicates, describe_collapse, fit_params, holdout_split
+from src.preprocess import lemmatize_text, tokenize_and_lemmatize
+from src.search import (FoldFeatureCache, describe_savings, fit_search, format_timing_table, make_search,
+                        parallel_search_heads, search_cost, search_head, take, vectorizer_key)
+from src.token_cache import DEFAULT_CACHE_DIR, TokenCache
+from src.vectorizers import BatchTfidfVectorizer
 from sklearn.base import TransformerMixin, BaseEstimator
 import warnings
 
@@ -61,60 +66,63 @@ class SelectKBestSafe(BaseEstimator, TransformerMixin):
 def load_and_combine(paths):
     dfs = []
     for p in paths:
-        df = pd.read_csv(p)
-        if "subject" in df.columns and "text" in df.columns:
+        df = read_table(p, ["text", "label"], optional=["subject"])
+        if "subject" in df.columns:
             df["text"] = df["subject"].fillna("") + " " + df["text"].fillna("")
-        if "text" not in df.columns or "label" not in df.columns:
-            raise ValueError(f"{p} must contain 'text' and 'label' columns")
         dfs.append(df[["text", "label"]])
     combined = pd.concat(dfs, ignore_index=True)
-    # Normalize labels across datasets: handle numeric 0/1 and common string variants
-    def _normalize_label(v):
-        if pd.isna(v):
-            return "ham"
-        # numeric labels like 0/1
-        try:
-            if isinstance(v, (int, float)) and not isinstance(v, bool):
-                return "spam" if int(v) == 1 else "ham"
-            s = str(v).strip().lower()
-        except Exception:
-            s = str(v).strip().lower()
-        if s in ("1", "spam", "s", "true", "t", "yes", "y"):
-            return "spam"
-        return "ham"
-
-    combined["label"] = combined["label"].apply(_normalize_label)
+    combined["label"] = combined["label"].apply(normalize_label)
     return combined["text"].astype(str).tolist(), combined["label"].astype(str).tolist()
 
 
-def build_pipeline(use_char=False, k_best=None, clf_name="logreg"):
+def build_vectorizer(use_char=False, n_jobs=1):
     # Use a tokenizer that lemmatizes and removes stopwords to keep
     # stopword handling consistent with preprocessing and avoid warnings.
-    from src.preprocess import tokenize_and_lemmatize
     # When providing a custom tokenizer, explicitly set token_pattern=None
     # to avoid sklearn informing that token_pattern will be ignored.
-    vect = TfidfVectorizer(tokenizer=tokenize_and_lemmatize, token_pattern=None, preprocessor=None,
-                           lowercase=False,
-                           ngram_range=(1, 2) if not use_char else (1, 3),
-                           max_df=0.95, min_df=2, max_features=60000)
-    steps = [("tfidf", vect)]
+    return BatchTfidfVectorizer(tokenizer=tokenize_and_lemmatize, token_pattern=None, preprocessor=None,
+                                lowercase=False,
+                                ngram_range=(1, 2) if not use_char else (1, 3),
+                                max_df=0.95, min_df=2, max_features=60000, n_jobs=n_jobs)
+
+
+def build_head(k_best=None, clf_name="logreg"):
+    """Steps that follow the vectorizer: optional feature selection and the classifier."""
+    steps = []
     if k_best:
         steps.append(("select", SelectKBestSafe(chi2, k=k_best)))
     if clf_name == "logreg":
-        clf = LogisticRegression(max_iter=2000, solver="saga", class_weight="balanced")
+        # saga's step size ignores sample_weight, so it stops converging on duplicate counts; lbfgs reaches the same optimum
+        clf = LogisticRegression(max_iter=2000, solver="lbfgs", class_weight="balanced")
     else:
         clf = ComplementNB()
     steps.append(("clf", clf))
-    return Pipeline(steps)
+    return steps
+
+
+def build_pipeline(use_char=False, k_best=None, clf_name="logreg", n_jobs=1):
+    return Pipeline([("tfidf", build_vectorizer(use_char=use_char, n_jobs=n_jobs))] + build_head(k_best=k_best, clf_name=clf_name))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Advanced training with char n-grams, selection, calibration")
-    parser.add_argument("--inputs", nargs="+", default=["data/large_emails.csv", "data/sms_spam.csv"], help="CSV files to combine for training")
+    parser.add_argument("--inputs", nargs="+", default=["data/large_emails.csv", "data/sms_spam.csv"], help="CSV (optionally compressed), Parquet or Arrow files to combine for training")
     parser.add_argument("--data", nargs="*", help="Alias for --inputs (single path or list)")
     parser.add_argument("--output", default="models/model_advanced_final.joblib")
     parser.add_argument("--cv", type=int, default=3)
     parser.add_argument("--large", action="store_true", help="Run a larger grid search (longer)")
+    parser.add_argument("--search", choices=["shared", "grid", "halving"], default="shared",
+                        help="shared: fit each TF-IDF config once per fold and tune only selection/classifier on the cached matrices; "
+                             "grid: a full GridSearchCV per candidate; "
+                             "halving: one successive-halving search over all candidates that drops weak ones on small subsets")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="With --search shared: run all candidate/fold fits as one pool of N processes sharing the fold matrices (-1 = all cores)")
+    parser.add_argument("--mem-budget-mb", type=float, default=None, help="Lower --workers if the estimated memory of concurrent fits exceeds this")
+    parser.add_argument("--prep-jobs", type=int, default=1, help="Processes used to tokenize/lemmatize text in batches (-1 = all cores)")
+    parser.add_argument("--token-cache", default=DEFAULT_CACHE_DIR, help="Directory of the on-disk tokenization cache")
+    parser.add_argument("--no-token-cache", action="store_true", help="Tokenize from scratch without reading or writing the cache")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Train on every raw row instead of unique messages weighted by their number of copies")
     args = parser.parse_args()
 
     # allow --data as alias to --inputs
@@ -123,7 +131,21 @@ def main():
         inputs = args.data
 
     texts, labels = load_and_combine(inputs)
-    X_train, X_test, y_train, y_test = train_test_split(texts, labels, test_size=0.2, random_state=42, stratify=labels)
+    weights = groups = None
+    if not args.keep_duplicates:
+        texts, labels, weights, groups = collapse_duplicates(texts, labels)
+        print(describe_collapse(weights))
+    if not args.no_token_cache:
+        # tokenize once through the cache; the vectorizers pass token lists through
+        cache = TokenCache(args.token_cache, tokenize_and_lemmatize, n_jobs=args.prep_jobs)
+        texts = cache.prepare(texts)
+        print(cache.describe())
+    # copies of a message stay on one side of every split; fits and scores are weighted by the copy counts
+    train_idx, test_idx = holdout_split(labels, groups)
+    X_train, X_test = take(texts, train_idx), take(texts, test_idx)
+    y_train, y_test = take(labels, train_idx), take(labels, test_idx)
+    w_train, w_test = (None, None) if weights is None else (weights[train_idx], weights[test_idx])
+    g_train = None if groups is None else groups[train_idx]
 
     # moderate vs larger grid selection
     if args.large:
@@ -157,34 +179,104 @@ def main():
                 for clf_name in spec["clf_name"]:
                     candidates.append((use_char, k, clf_name))
 
+    def clf_param_grid(clf_name):
+        if clf_name == "logreg":
+            return {"clf__C": [0.1, 1.0, 5.0]}
+        return {"clf__alpha": [0.01, 0.1, 0.5]}
+
     best_model = None
     best_score = -1
+    features = FoldFeatureCache(X_train, y_train, cv=args.cv, groups=g_train, sample_weight=w_train) if args.search == "shared" else None
+
+    pooled = timings = None
+    if features is not None and args.workers != 1:
+        # every (candidate, C/alpha, fold) fit becomes one task in a single process pool
+        fold_mats = {}
+        jobs = []
+        for use_char, k, clf_name in candidates:
+            vect = build_vectorizer(use_char=use_char, n_jobs=args.prep_jobs)
+            key = vectorizer_key(vect)
+            fold_mats[key] = features.fold_matrices(vect)
+            jobs.append(((use_char, k, clf_name), Pipeline(build_head(k_best=k, clf_name=clf_name)), clf_param_grid(clf_name), key))
+        pool_start = time.perf_counter()
+        pooled, timings = parallel_search_heads(jobs, fold_mats, features.y, features.folds, n_workers=args.workers,
+                                                mem_budget_mb=args.mem_budget_mb, sample_weight=w_train)
+        pool_wall = time.perf_counter() - pool_start
+
+    if args.search == "halving":
+        # Express every candidate as a grid over pipeline steps so one halving
+        # search can compare them all; "passthrough" stands in for no selection.
+        halving_grid = []
+        for use_char, k, clf_name in candidates:
+            head = dict(build_head(k_best=k, clf_name=clf_name))
+            grid = {
+                "tfidf__ngram_range": [build_vectorizer(use_char=use_char).ngram_range],
+                "select": [head.get("select", "passthrough")],
+                "clf": [head["clf"]],
+            }
+            grid.update(clf_param_grid(clf_name))
+            halving_grid.append(grid)
+        base = Pipeline([("tfidf", build_vectorizer(n_jobs=args.prep_jobs)), ("select", "passthrough")] + build_head())
+        gs = make_search(base, halving_grid, search="halving", cv=args.cv, n_jobs=-1)
+        gs = fit_search(gs, X_train, y_train, groups=g_train, sample_weight=w_train)
+        for i, (n_cand, n_res) in enumerate(zip(gs.n_candidates_, gs.n_resources_)):
+            print(f"Halving round {i}: {n_cand} settings on {n_res} rows")
+        print(f"  best cv f1_macro: {gs.best_score_:.3f}, params: {gs.best_params_}")
+        print(describe_savings([search_cost(gs, len(X_train))]))
+        best_score = gs.best_score_
+        best_model = gs.best_estimator_
+        if isinstance(best_model.named_steps["clf"], LogisticRegression):
+            try:
+                best_model = CalibratedClassifierCV(gs.best_estimator_, cv="prefit")
+                best_model.fit(X_train, y_train, sample_weight=w_train)
+            except Exception:
+                best_model = gs.best_estimator_
+        candidates = []
 
     for use_char, k, clf_name in candidates:
         print(f"Training candidate: use_char={use_char} k_best={k} clf={clf_name}")
-        pipeline = build_pipeline(use_char=use_char, k_best=k, clf_name=clf_name)
-        if clf_name == "logreg":
-            param_grid_clf = {"clf__C": [0.1, 1.0, 5.0]}
-        else:
-            param_grid_clf = {"clf__alpha": [0.01, 0.1, 0.5]}
+        param_grid_clf = clf_param_grid(clf_name)
 
-        gs = GridSearchCV(pipeline, param_grid_clf, cv=args.cv, scoring="f1_macro", n_jobs=-1)
-        gs.fit(X_train, y_train)
-        print(f"  best cv f1_macro: {gs.best_score_:.3f}, params: {gs.best_params_}")
+        if features is not None:
+            vect = build_vectorizer(use_char=use_char, n_jobs=args.prep_jobs)
+            head = Pipeline(build_head(k_best=k, clf_name=clf_name))
+            if pooled is not None:
+                best_params, score, _ = pooled[(use_char, k, clf_name)]
+            else:
+                best_params, score, _ = search_head(head, param_grid_clf, features.fold_matrices(vect), features.y, features.folds,
+                                                    sample_weight=w_train)
+            print(f"  best cv f1_macro: {score:.3f}, params: {best_params}")
+            if score <= best_score:
+                # only the winning candidate's refit is ever used
+                continue
+            fitted_vect, X_full = features.full(vect)
+            head.set_params(**best_params).fit(X_full, y_train, **fit_params(head, w_train))
+            best_estimator = Pipeline([("tfidf", fitted_vect)] + head.steps)
+        else:
+            pipeline = build_pipeline(use_char=use_char, k_best=k, clf_name=clf_name, n_jobs=args.prep_jobs)
+            gs = make_search(pipeline, param_grid_clf, search="grid", cv=args.cv, n_jobs=-1)
+            gs = fit_search(gs, X_train, y_train, groups=g_train, sample_weight=w_train)
+            best_params, score, best_estimator = gs.best_params_, gs.best_score_, gs.best_estimator_
+            print(f"  best cv f1_macro: {score:.3f}, params: {best_params}")
 
-        final = gs.best_estimator_
+        final = best_estimator
         if clf_name == "logreg":
             try:
                 final = CalibratedClassifierCV(final, cv="prefit")
-                final.fit(X_train, y_train)
+                final.fit(X_train, y_train, sample_weight=w_train)
             except Exception:
-                final = gs.best_estimator_
+                final = best_estimator
 
-        score = gs.best_score_
         if score > best_score:
             best_score = score
             best_model = final
 
+    if features is not None:
+        print(features.describe())
+    if timings is not None:
+        print("\nPer-task timings (slowest first):")
+        print(format_timing_table(timings, wall_seconds=pool_wall))
+
     preds = best_model.predict(X_test)
     probas = None
     try:
@@ -193,11 +285,11 @@ def main():
         pass
 
     print("\nBest model test evaluation:\n")
-    print(classification_report(y_test, preds))
-    print("Confusion matrix:\n", confusion_matrix(y_test, preds))
+    print(classification_report(y_test, preds, sample_weight=w_test))
+    print("Confusion matrix:\n", confusion_matrix(y_test, preds, sample_weight=w_test))
 
     if probas is not None:
-        precision, recall, thresholds = precision_recall_curve([1 if y=="spam" else 0 for y in y_test], probas)
+        precision, recall, thresholds = precision_recall_curve([1 if y=="spam" else 0 for y in y_test], probas, sample_weight=w_test)
         f1_scores = 2 * (precision * recall) / (precision + recall + 1e-12)
         best_idx = np.argmax(f1_scores)
         best_threshold = thresholds[best_idx] if best_idx < len(thresholds) else 0.5
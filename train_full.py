@@ -1,24 +1,23 @@
 import argparse
 import os
-import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 
-from src.nb_classifier_adv import AdvancedSpamClassifier
+from src.data_io import read_table
+from src.dedup import collapse_duplicates, describe_collapse, holdout_split
+from src.nb_classifier_adv import AdvancedSpamClassifier, simple_clean
+from src.search import SEARCH_ENGINES, cross_val_f1, describe_savings, search_cost, take
+from src.token_cache import DEFAULT_CACHE_DIR, TokenCache
 
 
 def load_structured(path):
-    df = pd.read_csv(path)
-    # support columns: id, subject, text, label OR text,label
-    if "text" in df.columns and "label" in df.columns:
-        if "subject" in df.columns:
-            texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str).tolist()
-        else:
-            texts = df["text"].astype(str).tolist()
-        labels = df["label"].astype(str).tolist()
-        return texts, labels
+    # support columns: id, subject, text, label OR text,label; other columns are never read
+    df = read_table(path, ["text", "label"], optional=["subject"])
+    if "subject" in df.columns:
+        texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str).tolist()
     else:
-        raise ValueError("CSV must contain at least 'text' and 'label' columns")
+        texts = df["text"].astype(str).tolist()
+    labels = df["label"].astype(str).tolist()
+    return texts, labels
 
 
 def main():
@@ -26,34 +25,53 @@ def main():
     parser.add_argument("--data", default="data/large_emails.csv")
     parser.add_argument("--output", default="models/model_advanced.joblib")
     parser.add_argument("--grid", action="store_true", help="Run GridSearchCV for hyperparameters")
+    parser.add_argument("--search", choices=SEARCH_ENGINES, default="grid", help="Search engine used with --grid (halving drops weak candidates early)")
+    parser.add_argument("--hashing", action="store_true", help="Hashed n-grams with online IDF instead of a vocabulary (constant memory)")
+    parser.add_argument("--token-cache", default=DEFAULT_CACHE_DIR, help="Directory of the on-disk tokenization cache")
+    parser.add_argument("--no-token-cache", action="store_true", help="Tokenize from scratch without reading or writing the cache")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Train on every raw row instead of unique messages weighted by their number of copies")
     args = parser.parse_args()
 
     texts, labels = load_structured(args.data)
-    X_train, X_test, y_train, y_test = train_test_split(texts, labels, test_size=0.2, random_state=42, stratify=labels)
+    weights = groups = None
+    if not args.keep_duplicates:
+        texts, labels, weights, groups = collapse_duplicates(texts, labels, key=simple_clean)
+        print(describe_collapse(weights))
+    if not args.no_token_cache:
+        # both vectorizers of AdvancedSpamClassifier use simple_clean as their preprocessor
+        cache = TokenCache(args.token_cache, simple_clean)
+        texts = cache.prepare(texts)
+        print(cache.describe())
+    # copies of a message stay on one side of the split; metrics below count every raw row
+    train_idx, test_idx = holdout_split(labels, groups)
+    X_train, X_test = take(texts, train_idx), take(texts, test_idx)
+    y_train, y_test = take(labels, train_idx), take(labels, test_idx)
+    w_train, w_test = (None, None) if weights is None else (weights[train_idx], weights[test_idx])
+    g_train = None if groups is None else groups[train_idx]
 
     # initialize with safer defaults to reduce overfitting
-    clf = AdvancedSpamClassifier(ngram_range=(1, 1), min_df=3, max_df=0.9, sublinear_tf=True)
+    clf = AdvancedSpamClassifier(use_hashing=args.hashing, ngram_range=(1, 1), min_df=3, max_df=0.9, sublinear_tf=True)
     if args.grid:
         print("Running grid search (this may take a while)...")
         # smaller grid to keep run time reasonable
         param_grid = {
-            "tfidf__ngram_range": [(1, 1), (1, 2)],
+            "vect__ngram_range" if args.hashing else "tfidf__ngram_range": [(1, 1), (1, 2)],
             "clf__alpha": [0.01, 0.1, 0.5, 1.0],
         }
-        gs = clf.grid_search(X_train, y_train, param_grid=param_grid, n_jobs=-1)
+        gs = clf.grid_search(X_train, y_train, param_grid=param_grid, n_jobs=-1, search=args.search, groups=g_train, sample_weight=w_train)
         print("Best params:", gs.best_params_)
+        print(describe_savings([search_cost(gs, len(X_train))]))
     else:
-        clf.train(X_train, y_train)
+        clf.train(X_train, y_train, sample_weight=w_train)
 
     preds = clf.predict(X_test)
-    print("Classification report:\n", classification_report(y_test, preds))
-    print("Confusion matrix:\n", confusion_matrix(y_test, preds))
+    print("Classification report:\n", classification_report(y_test, preds, sample_weight=w_test))
+    print("Confusion matrix:\n", confusion_matrix(y_test, preds, sample_weight=w_test))
 
     # cross-validation on training set to detect overfitting
     try:
-        from sklearn.model_selection import cross_val_score
-
-        cv_scores = cross_val_score(clf.pipeline, X_train, y_train, cv=3, scoring="f1_macro", n_jobs=-1)
+        cv_scores = cross_val_f1(clf.pipeline, X_train, y_train, cv=3, groups=g_train, sample_weight=w_train, n_jobs=-1)
         print(f"Cross-val F1-macro on train (3-fold): {cv_scores.mean():.3f} ± {cv_scores.std():.3f}")
     except Exception:
         pass
@@ -1,15 +1,17 @@
 import argparse
 import os
 import pandas as pd
-from sklearn.model_selection import train_test_split, StratifiedKFold, GridSearchCV
 from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.pipeline import Pipeline
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB, ComplementNB
 from sklearn.linear_model import LogisticRegression
 from joblib import dump
 
+from src.dedup import collapse_duplicates, describe_collapse, holdout_split
 from src.preprocess import lemmatize_text
+from src.search import SEARCH_ENGINES, describe_savings, fit_search, make_search, search_cost, take
+from src.token_cache import DEFAULT_CACHE_DIR, TokenCache
+from src.vectorizers import BatchTfidfVectorizer
 
 
 def load_structured(path):
@@ -25,15 +27,15 @@ def load_structured(path):
         raise ValueError("CSV must contain at least 'text' and 'label' columns")
 
 
-def build_pipelines():
+def build_pipelines(n_jobs=1):
     # return dict of candidate pipelines
     pipelines = {}
 
-    tfidf = TfidfVectorizer(preprocessor=lemmatize_text, stop_words="english", ngram_range=(1, 2), max_df=0.9, min_df=3, max_features=40000)
+    tfidf = BatchTfidfVectorizer(preprocessor=lemmatize_text, stop_words="english", ngram_range=(1, 2), max_df=0.9, min_df=3, max_features=40000, n_jobs=n_jobs)
 
     pipelines["mnb"] = Pipeline([("tfidf", tfidf), ("clf", MultinomialNB())])
     pipelines["cnb"] = Pipeline([("tfidf", tfidf), ("clf", ComplementNB())])
-    pipelines["logreg"] = Pipeline([("tfidf", tfidf), ("clf", LogisticRegression(max_iter=1000, solver="saga", class_weight="balanced"))])
+    pipelines["logreg"] = Pipeline([("tfidf", tfidf), ("clf", LogisticRegression(max_iter=1000, solver="lbfgs", class_weight="balanced"))])
 
     return pipelines
 
@@ -43,16 +45,35 @@ def main():
     parser.add_argument("--data", default="data/large_emails.csv")
     parser.add_argument("--output", default="models/model_best.joblib")
     parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--search", choices=SEARCH_ENGINES, default="grid", help="grid: exhaustive GridSearchCV; halving: successive halving on growing subsets")
+    parser.add_argument("--prep-jobs", type=int, default=1, help="Processes used to lemmatize text in batches (-1 = all cores)")
+    parser.add_argument("--token-cache", default=DEFAULT_CACHE_DIR, help="Directory of the on-disk tokenization cache")
+    parser.add_argument("--no-token-cache", action="store_true", help="Tokenize from scratch without reading or writing the cache")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Train on every raw row instead of unique messages weighted by their number of copies")
     args = parser.parse_args()
 
     texts, labels = load_structured(args.data)
-    X_train, X_test, y_train, y_test = train_test_split(texts, labels, test_size=0.2, random_state=42, stratify=labels)
-
-    candidates = build_pipelines()
+    weights = groups = None
+    if not args.keep_duplicates:
+        texts, labels, weights, groups = collapse_duplicates(texts, labels)
+        print(describe_collapse(weights))
+    if not args.no_token_cache:
+        cache = TokenCache(args.token_cache, lemmatize_text, n_jobs=args.prep_jobs)
+        texts = cache.prepare(texts)
+        print(cache.describe())
+    train_idx, test_idx = holdout_split(labels, groups)
+    X_train, X_test = take(texts, train_idx), take(texts, test_idx)
+    y_train, y_test = take(labels, train_idx), take(labels, test_idx)
+    w_train, w_test = (None, None) if weights is None else (weights[train_idx], weights[test_idx])
+    g_train = None if groups is None else groups[train_idx]
+
+    candidates = build_pipelines(n_jobs=args.prep_jobs)
 
     best_model = None
     best_score = -1
     results = {}
+    costs = []
 
     for name, pipeline in candidates.items():
         print(f"Training candidate: {name}")
@@ -62,8 +83,9 @@ def main():
         else:
             param_grid = {"clf__C": [0.1, 1.0, 5.0]}
 
-        gs = GridSearchCV(pipeline, param_grid, cv=args.cv, scoring="f1_macro", n_jobs=-1)
-        gs.fit(X_train, y_train)
+        gs = make_search(pipeline, param_grid, search=args.search, cv=args.cv, n_jobs=-1)
+        gs = fit_search(gs, X_train, y_train, groups=g_train, sample_weight=w_train)
+        costs.append(search_cost(gs, len(X_train)))
         score = gs.best_score_
         print(f"  best cv f1_macro: {score:.3f}, params: {gs.best_params_}")
         results[name] = (score, gs)
@@ -71,11 +93,13 @@ def main():
             best_score = score
             best_model = gs.best_estimator_
 
+    print(describe_savings(costs))
+
     # Evaluate best model on test set
     preds = best_model.predict(X_test)
     print("\nBest model test evaluation:\n")
-    print(classification_report(y_test, preds))
-    print("Confusion matrix:\n", confusion_matrix(y_test, preds))
+    print(classification_report(y_test, preds, sample_weight=w_test))
+    print("Confusion matrix:\n", confusion_matrix(y_test, preds, sample_weight=w_test))
 
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
     dump(best_model, args.output)
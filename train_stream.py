@@ -0,0 +1,113 @@
+"""Out-of-core trainer: streams CSV/Parquet/Arrow files through AdvancedSpamClassifier.partial_train.
+
+Only one batch of rows is in memory at a time (hashed n-grams need no
+vocabulary, and the online document frequencies and MultinomialNB keep
+fixed-size counts), so memory does not grow with the corpus. Every `--checkpoint-every` batches the classifier and
+the read position are written atomically to `<output>.ckpt`; `--resume`
+continues from there after an interruption, seeking to the saved position
+(a CSV byte offset or Parquet row group) instead of re-reading the rows
+before it.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from joblib import dump, load
+
+from src.data_io import TableReader, normalize_label
+from src.nb_classifier_adv import AdvancedSpamClassifier
+
+CLASSES = ["ham", "spam"]
+
+
+def iter_batches(inputs, batch_rows, start_file=0, start=None):
+    """Yield `(file_index, position, texts, labels)` for every batch, starting at a saved position.
+
+    `position` is `TableReader.position()` after the batch; passed back as
+    `start` with its file index, reading continues after that batch without
+    parsing the rows before it.
+    """
+    for i, path in enumerate(inputs):
+        if i < start_file:
+            continue
+        reader = TableReader(path, ["text", "label"], optional=["subject"], batch_rows=batch_rows,
+                             start=start if i == start_file else None)
+        for df in reader:
+            if "subject" in df.columns:
+                texts = (df["subject"].fillna("") + " " + df["text"].fillna("")).astype(str).tolist()
+            else:
+                texts = df["text"].fillna("").astype(str).tolist()
+            yield i, reader.position(), texts, df["label"].map(normalize_label).tolist()
+
+
+def save_checkpoint(path, clf, state):
+    tmp = path + ".tmp"
+    dump({"pipeline": clf.pipeline, "state": state}, tmp)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a hashing Naive Bayes spam classifier on files larger than memory")
+    parser.add_argument("--inputs", nargs="+", required=True, help="CSV (optionally compressed), Parquet or Arrow files")
+    parser.add_argument("--output", default="models/model_stream.joblib")
+    parser.add_argument("--batch-rows", type=int, default=50000, help="Rows read, cleaned and fitted per batch")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Write a checkpoint every N batches")
+    parser.add_argument("--resume", action="store_true", help="Continue from <output>.ckpt if it exists")
+    parser.add_argument("--n-jobs", type=int, default=1, help="Processes used to clean text (-1 = all cores)")
+    parser.add_argument("--ngram-max", type=int, default=1, help="Hash word n-grams up to this length")
+    parser.add_argument("--n-features", type=int, default=2 ** 18, help="Hash buckets (model size grows linearly)")
+    args = parser.parse_args()
+
+    ckpt_path = args.output + ".ckpt"
+    clf = AdvancedSpamClassifier(use_hashing=True, ngram_range=(1, args.ngram_max), n_features=args.n_features)
+    state = {"inputs": args.inputs, "file": 0, "position": None, "rows": 0, "batches": 0}
+    warm = False
+    if args.resume and os.path.exists(ckpt_path):
+        ckpt = load(ckpt_path)
+        if ckpt["state"]["inputs"] != args.inputs:
+            raise SystemExit(f"{ckpt_path} was written for inputs {ckpt['state']['inputs']}; pass the same --inputs")
+        clf.pipeline, state, warm = ckpt["pipeline"], ckpt["state"], True
+        if "position" not in state:
+            # checkpoints written before read positions were saved resume by row count
+            state["position"] = {"row": state.pop("file_rows"), "offset": None}
+        print(f"Resuming after {state['rows']} rows ({state['batches']} batches)")
+
+    n_jobs = args.n_jobs if args.n_jobs > 0 else os.cpu_count() or 1
+    # one pool for the whole run instead of one per batch
+    executor = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    start = time.perf_counter()
+    trained = 0
+    try:
+        for file_index, position, texts, labels in iter_batches(args.inputs, args.batch_rows,
+                                                                state["file"], state["position"]):
+            clf.partial_train([texts], [labels], classes=CLASSES, warm_start=warm, executor=executor)
+            warm = True
+            trained += len(texts)
+            state.update(file=file_index, position=position, rows=state["rows"] + len(texts),
+                         batches=state["batches"] + 1)
+            if state["batches"] % args.checkpoint_every == 0:
+                save_checkpoint(ckpt_path, clf, state)
+            elapsed = time.perf_counter() - start
+            print(f"batch {state['batches']}: {state['rows']} rows ({os.path.basename(args.inputs[file_index])}), "
+                  f"{trained / elapsed:.0f} rows/s", flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if not warm:
+        raise SystemExit("No rows to train on")
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    clf.save(args.output)
+    if os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    elapsed = time.perf_counter() - start
+    print(f"Trained on {trained} rows in {elapsed:.1f}s ({trained / max(elapsed, 1e-9):.0f} rows/s); "
+          f"model saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()